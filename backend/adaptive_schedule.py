@@ -0,0 +1,88 @@
+import time
+import threading
+from utils import load_json, save_json
+
+# 内容未变化时间隔的增长倍数
+DEFAULT_BACKOFF = 1.5
+
+# 估计变化间隔时新样本的权重（指数加权平均）
+GAP_SMOOTHING = 0.3
+
+# 每个预计变化周期内至少检查的次数，决定退避的上限
+CHECKS_PER_CHANGE = 2
+
+def clamp(value, minimum, maximum):
+    """把间隔限制在[minimum, maximum]范围内"""
+    return max(minimum, min(value, maximum))
+
+# adaptive模式下默认的抖动比例；fixed模式默认不抖动，保持配置的准确间隔
+DEFAULT_JITTER = 0.1
+
+def jitter_seconds(interval, fraction):
+    """间隔的随机抖动幅度（秒），不超过间隔的一半"""
+    return int(min(max(float(fraction or 0), 0), 0.5) * interval) or None
+
+def jittered_interval(interval, fraction):
+    """返回IntervalTrigger的(间隔, 抖动)
+
+    IntervalTrigger只会在间隔之后再随机延迟[0, jitter]秒，因此把间隔缩短一个幅度、
+    抖动设为两倍幅度，使每次触发在±幅度内均匀偏移，平均间隔保持不变
+    """
+    amplitude = jitter_seconds(interval, fraction)
+    if not amplitude:
+        return interval, None
+    return interval - amplitude, 2 * amplitude
+
+class AdaptiveSchedule:
+    """根据每个任务的拉取结果学习上游的变化频率，动态调整检查间隔，状态保存到JSON文件
+
+    内容未变化时间隔按倍数增长，但不超过预计变化间隔的1/CHECKS_PER_CHANGE；
+    检测到变化后间隔回到最小值，并用两次变化的时间差更新预计变化间隔。
+    """
+
+    def __init__(self, state_path, backoff=DEFAULT_BACKOFF):
+        self.state_path = state_path
+        self.backoff = max(float(backoff or DEFAULT_BACKOFF), 1.0)
+        self._lock = threading.Lock()
+        self.state = load_json(state_path, {}) or {}
+
+    def interval(self, key, initial, minimum, maximum):
+        """任务当前的检查间隔，没有记录时使用initial"""
+        with self._lock:
+            entry = self.state.get(key) or {}
+            return clamp(entry.get("interval", initial), minimum, maximum)
+
+    def observe(self, key, changed, initial, minimum, maximum, now=None):
+        """记录一次拉取结果并返回新的间隔；changed为None表示本次失败，间隔保持不变"""
+        now = now if now is not None else time.time()
+        with self._lock:
+            entry = self.state.setdefault(key, {})
+            interval = clamp(entry.get("interval", initial), minimum, maximum)
+            if changed is None:
+                entry["failures"] = entry.get("failures", 0) + 1
+            elif changed:
+                last_change = entry.get("last_change")
+                if last_change is not None and now > last_change:
+                    gap = now - last_change
+                    mean_gap = entry.get("mean_change_gap")
+                    entry["mean_change_gap"] = round(
+                        gap if mean_gap is None else GAP_SMOOTHING * gap + (1 - GAP_SMOOTHING) * mean_gap, 1)
+                entry["last_change"] = now
+                entry["changes"] = entry.get("changes", 0) + 1
+                entry["unchanged_runs"] = 0
+                interval = minimum
+            else:
+                entry["unchanged_runs"] = entry.get("unchanged_runs", 0) + 1
+                ceiling = maximum
+                if entry.get("mean_change_gap"):
+                    ceiling = clamp(entry["mean_change_gap"] / CHECKS_PER_CHANGE, minimum, maximum)
+                interval = max(min(interval * self.backoff, ceiling), minimum)
+            entry["interval"] = int(interval)
+            entry["updated"] = now
+            save_json(self.state, self.state_path)
+            return entry["interval"]
+
+    def snapshot(self):
+        """所有任务的调度状态"""
+        with self._lock:
+            return {key: dict(value) for key, value in self.state.items()}
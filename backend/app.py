@@ -2,15 +2,25 @@ import os
 import json
 import time
 import logging
-from flask import Flask, request, jsonify, render_template, send_from_directory
+import threading
+
+# 进程开始导入的时间，用于统计启动耗时
+PROCESS_START = time.time()
+
+from flask import Flask, request, jsonify, render_template, send_from_directory, make_response, Response, stream_with_context
 from flask_cors import CORS
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime
 
-from utils import load_config, save_config, setup_logger
-from updater import run_updater
-from geoip_updater import run_geo_updater
+from utils import setup_logger, set_yaml_engine, BackupStore
+from config_service import get_service, get_config_dir, DEFAULT_WATCH_INTERVAL
+from config_diff import summarize_changeset
+from history_store import HistoryStore, DEFAULT_RETENTION
+from metrics import summarize_runs
+from job_manager import JobManager, SingleFlight
+from adaptive_schedule import AdaptiveSchedule, DEFAULT_BACKOFF, DEFAULT_JITTER, jittered_interval
+# updater和geoip_updater依赖requests等较重的模块，在首次执行任务时才导入，缩短启动时间
 
 # 初始化日志
 logger = setup_logger("app.log")
@@ -21,10 +31,15 @@ logger.info("=" * 50)
 
 # 加载配置
 # 配置文件位置优先从环境变量获取，如未设置则使用默认路径
-config_dir = os.environ.get('CONFIG_DIR', '/config')
+config_dir = get_config_dir()
 config_path = os.path.join(config_dir, "config.yaml")
-# 历史记录文件路径
+# 配置缓存：服务和更新器共用，文件未变化时不重新解析
+config_service = get_service(config_path)
+# 历史记录数据库路径，以及需要导入的旧版历史记录文件
+history_db_path = os.path.join(config_dir, "task_history.db")
 history_path = os.path.join(config_dir, "task_history.json")
+# 自适应调度学习到的检查间隔
+schedule_state_path = os.path.join(config_dir, "schedule_state.json")
 
 # 检查配置目录是否存在
 if not os.path.exists(config_dir):
@@ -47,7 +62,7 @@ if not os.path.exists(config_path):
             logger.error(f"复制默认配置失败: {e}")
 
 logger.info(f"尝试加载配置文件: {config_path}")
-config = load_config(config_path)
+config = config_service.get()
 
 if not config:
     logger.error("无法加载配置文件，使用默认配置")
@@ -57,17 +72,24 @@ if not config:
         "geoip_fetch_interval": 86400,
         "mihomo_config_path": "/etc/mihomo/config.yaml",
         "backup_dir": "/etc/mihomo/data/backups",
+        "cache_dir": "/etc/mihomo/data/cache",
         "geoip_url": "https://github.com/MetaCubeX/meta-rules-dat/releases/latest/download/geoip.dat",
         "geosite_url": "https://github.com/MetaCubeX/meta-rules-dat/releases/latest/download/geosite.dat",
         "mmdb_url": "https://github.com/MetaCubeX/meta-rules-dat/releases/latest/download/country.mmdb",
         "geoip_path": "/etc/mihomo/geoip.dat",
         "geosite_path": "/etc/mihomo/geosite.dat",
         "mmdb_path": "/etc/mihomo/country.mmdb",
+        "geo_download_workers": 3,
+        "geo_download_chunk_size": 1048576,
+        "geo_download_retries": 3,
+        "geo_retry_backoff": 2,
+        "geo_mirror_race": True,
         "yacd_url": "http://192.168.3.110:8080",
         "clash_api_url": "http://192.168.3.110:9097",
+        "reload_mode": "systemctl",
         "web_port": 5000
     }
-    save_config(config, config_path)
+    config_service.save(config)
     logger.info("使用默认配置初始化配置文件")
 else:
     logger.info("成功加载配置文件")
@@ -76,7 +98,10 @@ else:
     if config.get('backup_dir') == '/etc/mihomo/backups':
         config['backup_dir'] = '/etc/mihomo/data/backups'
         logger.info(f"更新备份目录为持久化目录: {config['backup_dir']}")
-        save_config(config, config_path)
+        config_service.save(config)
+
+# 选择YAML引擎（默认优先使用libyaml）
+set_yaml_engine(config.get('yaml_engine', 'auto'))
 
 # 确保备份目录存在
 backup_dir = config.get('backup_dir', '/etc/mihomo/data/backups')
@@ -90,101 +115,255 @@ app = Flask(__name__,
 CORS(app)  # 启用CORS
 logger.info(f"Flask应用初始化完成，CORS已启用")
 
-# 从文件加载任务执行历史记录
-def load_task_history():
-    """从JSON文件加载任务执行历史"""
-    if os.path.exists(history_path):
-        try:
-            with open(history_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"加载任务历史记录失败: {e}")
-    return []
+# 任务执行历史：SQLite存储，首次启动时导入旧版task_history.json
+history_store = HistoryStore(
+    history_db_path,
+    config.get('history_retention', DEFAULT_RETENTION),
+    config.get('history_retention_days', 0),
+    legacy_json_path=history_path
+)
+logger.info(f"任务历史数据库: {history_db_path}")
 
-# 保存任务执行历史记录到文件
-def save_task_history(history):
-    """保存任务执行历史到JSON文件"""
+# 记录任务执行结果
+def log_task_result(task_name, success, message=None, details=None):
+    """记录任务执行结果到历史数据库"""
     try:
-        with open(history_path, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-        return True
+        history_store.add(task_name, success, message, details)
     except Exception as e:
         logger.error(f"保存任务历史记录失败: {e}")
-        return False
 
-# 存储任务执行结果的列表
-task_results = load_task_history()
-logger.info(f"加载了 {len(task_results)} 条历史任务记录")
+# 生成配置更新结果的说明
+def describe_update(details):
+    """根据更新详情生成任务历史中的说明文字"""
+    if details.get('status') == 'unchanged':
+        if 'changeset' in details:
+            return "配置没有实际变化，跳过写入和重启"
+        return "订阅内容未变化，跳过更新"
+    if details.get('status') == 'updated' and 'changeset' in details:
+        return f"成功（{summarize_changeset(details['changeset'])}）"
+    return None
 
-# 记录任务执行结果
-def log_task_result(task_name, success, message=None):
-    """记录任务执行结果到全局列表并持久化存储"""
-    global task_results
-    result = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "task": task_name,
-        "success": success,
-        "message": message or ("成功" if success else "失败")
-    }
-    task_results.append(result)
-    # 只保留最新的50条记录
-    if len(task_results) > 50:
-        task_results = task_results[-50:]
-    # 持久化保存
-    save_task_history(task_results)
+# 就绪状态：每类更新自进程启动以来第一次成功完成的时间，全部完成后/ready返回200
+sync_state = {'mihomo': None, 'geoip': None}
+sync_state_lock = threading.Lock()
 
-# 定时更新Mihomo配置的任务
-def update_mihomo_config_job():
-    """定时更新Mihomo配置任务"""
+# 记录更新成功完成
+def mark_synced(task):
+    """记录某类更新第一次成功完成的时间"""
+    with sync_state_lock:
+        if sync_state.get(task) is None:
+            sync_state[task] = time.time()
+            logger.info(f"{task} 首次同步完成，距进程启动 {sync_state[task] - PROCESS_START:.2f}秒")
+
+# 同一类型的更新（定时任务和手动触发）同时只执行一次，后到的触发共享正在进行的结果
+single_flight = SingleFlight()
+
+# 执行一次Mihomo配置更新
+def run_mihomo_update(on_phase=None):
+    """执行Mihomo配置更新并记录任务历史"""
     logger.info("开始执行Mihomo配置更新任务")
     try:
-        success = run_updater()
-        log_task_result("Mihomo配置更新", success)
+        from updater import run_updater
+        details = {}
+        success = run_updater(details, on_phase)
+        log_task_result("Mihomo配置更新", success, describe_update(details), details)
+        adapt_schedule('update_mihomo_config', mihomo_changed(details))
+        if success:
+            mark_synced('mihomo')
         return success
     except Exception as e:
         logger.error(f"Mihomo配置更新任务失败: {e}")
         log_task_result("Mihomo配置更新", False, str(e))
         return False
 
-# 定时更新GeoIP数据的任务
-def update_geoip_job():
-    """定时更新GeoIP数据任务"""
+# 定时更新Mihomo配置的任务
+def update_mihomo_config_job(on_phase=None):
+    """定时更新Mihomo配置任务，已有更新在执行时合并到该次执行"""
+    success, _ = single_flight.do('mihomo', run_mihomo_update, on_phase)
+    return success
+
+# 执行一次GeoIP数据更新
+def run_geoip_update(on_phase=None):
+    """执行GeoIP数据更新并记录任务历史"""
     logger.info("开始执行GeoIP数据更新任务")
     try:
-        success = run_geo_updater()
-        log_task_result("GeoIP数据更新", success)
+        from geoip_updater import run_geo_updater
+        details = {}
+        success = run_geo_updater(details, on_phase)
+        log_task_result("GeoIP数据更新", success, details.get('summary'), details)
+        adapt_schedule('update_geoip', geo_changed(success, details))
+        if success:
+            mark_synced('geoip')
         return success
     except Exception as e:
         logger.error(f"GeoIP数据更新任务失败: {e}")
         log_task_result("GeoIP数据更新", False, str(e))
         return False
 
+# 定时更新GeoIP数据的任务
+def update_geoip_job(on_phase=None):
+    """定时更新GeoIP数据任务，已有更新在执行时合并到该次执行"""
+    success, _ = single_flight.do('geoip', run_geoip_update, on_phase)
+    return success
+
+# 手动触发任务的后台执行器，接口立即返回任务ID
+job_manager = JobManager()
+
+# SSE推送任务状态的间隔（秒），任务没有变化时发送保活注释
+JOB_EVENT_INTERVAL = 1.0
+
+# 提交手动更新任务
+def submit_update_job(job_type, run_func, label):
+    """在后台执行更新任务，阶段变化通过job.update(phase=...)报告
+
+    同类型的更新正在执行时（例如定时任务），本次任务加入该执行，共享其阶段和结果
+    """
+    def run(job):
+        success, shared = single_flight.do(job_type, run_func, lambda name: job.update(phase=name))
+        message = label + ("成功" if success else "失败")
+        if shared:
+            message += "（已合并到正在进行的更新）"
+        return success, message
+    return job_manager.submit(job_type, run)
+
+# 任务状态快照
+def job_snapshot(job):
+    """任务状态字典，GEO更新任务附带各文件的下载进度"""
+    data = job.to_dict()
+    if job.type == 'geoip':
+        from geoip_updater import get_download_progress
+        data['progress'] = get_download_progress()
+    return data
+
+# 定时任务的间隔配置：(间隔配置项, 默认间隔, 默认最小间隔, 默认最大间隔)，单位秒
+SCHEDULED_JOBS = {
+    'update_mihomo_config': ('fetch_interval', 3600, 900, 86400),
+    'update_geoip': ('geoip_fetch_interval', 86400, 3600, 172800),
+}
+
+# 影响定时任务间隔的配置项，修改后重新调度
+SCHEDULE_KEYS = ('fetch_interval', 'geoip_fetch_interval', 'fetch_interval_min', 'fetch_interval_max',
+                 'geoip_fetch_interval_min', 'geoip_fetch_interval_max', 'schedule_mode', 'schedule_jitter')
+
+adaptive_schedule = AdaptiveSchedule(schedule_state_path, config.get('schedule_backoff', DEFAULT_BACKOFF))
+
+# 定时任务的间隔范围
+def interval_bounds(job_id, current_config):
+    """返回(配置的间隔, 最小间隔, 最大间隔)"""
+    key, default, default_min, default_max = SCHEDULED_JOBS[job_id]
+    interval = int(current_config.get(key) or default)
+    minimum = int(current_config.get(f"{key}_min") or min(default_min, interval))
+    maximum = max(int(current_config.get(f"{key}_max") or max(default_max, interval)), minimum)
+    return interval, minimum, maximum
+
+# 定时任务当前的间隔
+def job_interval(job_id, current_config):
+    """fixed模式使用配置的间隔，adaptive模式使用学习到的间隔"""
+    interval, minimum, maximum = interval_bounds(job_id, current_config)
+    if current_config.get('schedule_mode', 'fixed') != 'adaptive':
+        return interval
+    return adaptive_schedule.interval(job_id, interval, minimum, maximum)
+
+# 创建带随机抖动的间隔触发器
+def job_trigger(seconds, current_config):
+    """每次触发在±schedule_jitter×间隔内随机偏移，避免多个实例同时请求上游；未配置时只有adaptive模式默认抖动"""
+    default = DEFAULT_JITTER if current_config.get('schedule_mode', 'fixed') == 'adaptive' else 0
+    seconds, jitter = jittered_interval(seconds, current_config.get('schedule_jitter', default))
+    return IntervalTrigger(seconds=seconds, jitter=jitter)
+
+# 按当前配置重新调度定时任务
+def reschedule_jobs(current_config):
+    """配置中的间隔、调度模式或抖动变化后重新设置两个定时任务"""
+    for job_id in SCHEDULED_JOBS:
+        seconds = job_interval(job_id, current_config)
+        scheduler.reschedule_job(job_id, trigger=job_trigger(seconds, current_config))
+        logger.info(f"更新定时任务 {job_id} 间隔为: {seconds}秒")
+
+# 检查调度相关配置是否有效
+def schedule_config_error(current_config):
+    """按新配置计算各定时任务的间隔和触发器，配置无效时返回错误描述，有效时返回None"""
+    try:
+        for job_id in SCHEDULED_JOBS:
+            if interval_bounds(job_id, current_config)[1] <= 0:
+                return f"{SCHEDULED_JOBS[job_id][0]} 的间隔必须大于0"
+            job_trigger(job_interval(job_id, current_config), current_config)
+    except (TypeError, ValueError) as e:
+        return f"调度配置无效: {e}"
+    return None
+
+# 根据拉取结果调整自适应调度的间隔
+def adapt_schedule(job_id, changed):
+    """adaptive模式下记录上游内容是否变化并重新调度；changed为None表示本次失败"""
+    try:
+        current_config = config_service.get() or config
+        if current_config.get('schedule_mode', 'fixed') != 'adaptive':
+            return
+        interval = adaptive_schedule.observe(job_id, changed, *interval_bounds(job_id, current_config))
+        scheduler.reschedule_job(job_id, trigger=job_trigger(interval, current_config))
+        result = {True: "有变化", False: "无变化", None: "失败"}[changed]
+        logger.info(f"自适应调度: {job_id} 本次{result}，下次间隔 {interval}秒")
+    except Exception as e:
+        logger.error(f"调整定时任务间隔失败: {e}")
+
+# 配置更新结果是否表示订阅内容有变化
+def mihomo_changed(details):
+    """updated为有变化，unchanged为无变化，其他情况（失败）返回None"""
+    status = details.get('status')
+    if status == 'updated':
+        return True
+    if status == 'unchanged':
+        return False
+    return None
+
+# GEO更新结果是否表示上游文件有变化
+def geo_changed(success, details):
+    """任意文件安装了新版本为有变化，全部失败时返回None"""
+    files = (details.get('files') or {}).values()
+    if any(item.get('status') == 'installed' for item in files):
+        return True
+    if not success and not any(item.get('success') for item in files):
+        return None
+    return False
+
 # 初始化定时任务调度器
 scheduler = BackgroundScheduler()
 logger.info("初始化定时任务调度器")
 
 # 添加Mihomo配置更新任务
+mihomo_interval = job_interval('update_mihomo_config', config)
 scheduler.add_job(
     update_mihomo_config_job,
-    IntervalTrigger(seconds=config.get('fetch_interval', 3600)),
+    job_trigger(mihomo_interval, config),
     id='update_mihomo_config',
     replace_existing=True
 )
-logger.info(f"添加Mihomo配置更新任务，间隔: {config.get('fetch_interval', 3600)}秒")
+logger.info(f"添加Mihomo配置更新任务，间隔: {mihomo_interval}秒，调度模式: {config.get('schedule_mode', 'fixed')}")
 
 # 添加GeoIP数据更新任务
+geoip_interval = job_interval('update_geoip', config)
 scheduler.add_job(
     update_geoip_job,
-    IntervalTrigger(seconds=config.get('geoip_fetch_interval', 86400)),
+    job_trigger(geoip_interval, config),
     id='update_geoip',
     replace_existing=True
 )
-logger.info(f"添加GeoIP数据更新任务，间隔: {config.get('geoip_fetch_interval', 86400)}秒")
+logger.info(f"添加GeoIP数据更新任务，间隔: {geoip_interval}秒")
 
 # 启动调度器
 scheduler.start()
 logger.info("定时任务调度器已启动")
 
+# 配置文件变化（Web界面保存或直接编辑文件）后的处理
+def on_config_changed(old_config, new_config, changed):
+    """调度相关配置变化时重新调度定时任务，YAML引擎变化时切换引擎"""
+    if changed & set(SCHEDULE_KEYS):
+        reschedule_jobs(new_config)
+    if 'yaml_engine' in changed:
+        set_yaml_engine(new_config.get('yaml_engine', 'auto'))
+
+config_service.subscribe(on_config_changed)
+config_service.start_watching(config.get('config_watch_interval', DEFAULT_WATCH_INTERVAL))
+
 # 主页路由
 @app.route('/')
 def index():
@@ -196,8 +375,7 @@ def index():
 def get_config():
     """获取当前配置"""
     try:
-        config = load_config(config_path)
-        return jsonify({"success": True, "data": config})
+        return jsonify({"success": True, "data": config_service.get()})
     except Exception as e:
         logger.error(f"获取配置失败: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
@@ -211,29 +389,21 @@ def update_config():
         if not data:
             return jsonify({"success": False, "message": "没有提供配置数据"}), 400
         
-        current_config = load_config(config_path)
+        current_config = config_service.get() or {}
         
         # 更新配置项
         for key, value in data.items():
             current_config[key] = value
         
-        # 保存更新后的配置
-        if save_config(current_config, config_path):
-            # 更新调度器中的任务间隔
-            if 'fetch_interval' in data:
-                scheduler.reschedule_job(
-                    'update_mihomo_config', 
-                    trigger=IntervalTrigger(seconds=data['fetch_interval'])
-                )
-                logger.info(f"更新Mihomo配置更新间隔为: {data['fetch_interval']}秒")
-            
-            if 'geoip_fetch_interval' in data:
-                scheduler.reschedule_job(
-                    'update_geoip', 
-                    trigger=IntervalTrigger(seconds=data['geoip_fetch_interval'])
-                )
-                logger.info(f"更新GeoIP数据更新间隔为: {data['geoip_fetch_interval']}秒")
-                
+        # 调度配置由配置变化事件应用，事件中的错误不会返回给调用方，因此保存前先检查
+        if set(data) & set(SCHEDULE_KEYS):
+            error = schedule_config_error(current_config)
+            if error:
+                logger.error(f"更新配置失败: {error}")
+                return jsonify({"success": False, "message": error}), 400
+        
+        # 保存更新后的配置，调度器通过配置变化事件重新调度任务
+        if config_service.save(current_config):
             return jsonify({"success": True, "message": "配置已更新"})
         else:
             return jsonify({"success": False, "message": "保存配置失败"}), 500
@@ -246,8 +416,8 @@ def update_config():
 def manual_update_mihomo():
     """手动触发Mihomo配置更新"""
     logger.info("手动触发Mihomo配置更新")
-    success = update_mihomo_config_job()
-    return jsonify({"success": success, "message": "Mihomo配置更新" + ("成功" if success else "失败")})
+    job = submit_update_job('mihomo', run_mihomo_update, "Mihomo配置更新")
+    return jsonify({"success": True, "message": "Mihomo配置更新任务已提交", "data": job_snapshot(job)}), 202
 
 # API路由 - 从本地YAML文件导入配置
 @app.route('/api/import/local', methods=['POST'])
@@ -271,12 +441,13 @@ def import_local_yaml():
         from updater import MihomoUpdater
         updater = MihomoUpdater()
         success = updater.update_with_yaml_content(yaml_content)
+        details = dict(updater.last_details, status=updater.last_status, run=updater.run_record.finish())
         
         if success:
-            log_task_result("从本地文件导入配置", True)
+            log_task_result("从本地文件导入配置", True, describe_update(details), details)
             return jsonify({"success": True, "message": "从本地文件导入配置成功"})
         else:
-            log_task_result("从本地文件导入配置", False, "导入失败")
+            log_task_result("从本地文件导入配置", False, "导入失败", details)
             return jsonify({"success": False, "message": "从本地文件导入配置失败"}), 500
             
     except Exception as e:
@@ -289,28 +460,228 @@ def import_local_yaml():
 def manual_update_geoip():
     """手动触发GeoIP数据更新"""
     logger.info("手动触发GeoIP数据更新")
-    success = update_geoip_job()
-    return jsonify({"success": success, "message": "GeoIP数据更新" + ("成功" if success else "失败")})
+    job = submit_update_job('geoip', run_geoip_update, "GeoIP数据更新")
+    return jsonify({"success": True, "message": "GeoIP数据更新任务已提交", "data": job_snapshot(job)}), 202
+
+# API路由 - 查询后台任务状态
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """获取后台任务的状态、当前阶段和进度"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "任务不存在"}), 404
+    return jsonify({"success": True, "data": job_snapshot(job)})
+
+# API路由 - 以Server-Sent Events推送后台任务状态
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """状态变化时推送job事件，任务结束后关闭连接"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "任务不存在"}), 404
+
+    def events():
+        last_version = -1
+        while True:
+            version = job.wait_change(last_version, JOB_EVENT_INTERVAL)
+            # GEO任务运行中下载进度持续变化，每个间隔都推送一次
+            if version != last_version or (job.type == 'geoip' and not job.done):
+                yield f"event: job\ndata: {json.dumps(job_snapshot(job), ensure_ascii=False)}\n\n"
+            else:
+                yield ": keepalive\n\n"
+            last_version = version
+            if job.done:
+                break
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # 关闭Nginx等反向代理的缓冲，保证事件及时送达
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# API路由 - 获取GEO文件下载进度
+@app.route('/api/geoip/progress', methods=['GET'])
+def get_geoip_progress():
+    """获取GEO文件下载进度（已下载/总大小/速度）"""
+    from geoip_updater import get_download_progress
+    return jsonify({"success": True, "data": get_download_progress()})
 
 # API路由 - 获取任务执行历史
 @app.route('/api/history', methods=['GET'])
 def get_task_history():
-    """获取任务执行历史"""
-    return jsonify({"success": True, "data": task_results})
+    """分页获取任务执行历史（从新到旧），支持按任务名称前缀和成功状态筛选，带ETag"""
+    try:
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = min(max(request.args.get('page_size', 50, type=int), 1), 500)
+        task = request.args.get('task') or None
+        success = request.args.get('success')
+        success = None if success in (None, '') else success.lower() in ('1', 'true', 'yes')
+        
+        # 历史记录和查询参数都没有变化时直接返回304
+        etag = f"{history_store.version()}-{page}-{page_size}-{task or ''}-{success}"
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+        
+        items, total = history_store.query(page, page_size, task, success)
+        response = jsonify({"success": True, "data": items, "total": total, "page": page, "page_size": page_size})
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        logger.error(f"获取任务历史失败: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+# API路由 - 获取最近一次配置变更集
+@app.route('/api/diff/latest', methods=['GET'])
+def get_latest_diff():
+    """获取最近一次配置更新的变更集（新增、删除、修改的节点、代理组和规则）"""
+    result = history_store.latest_with_detail('changeset')
+    if result:
+        changeset = result['details']['changeset']
+        return jsonify({"success": True, "data": {
+            "timestamp": result['timestamp'],
+            "task": result['task'],
+            "status": result['details'].get('status'),
+            "summary": summarize_changeset(changeset),
+            "changeset": changeset,
+        }})
+    return jsonify({"success": True, "data": None})
+
+# API路由 - 各阶段耗时统计
+@app.route('/api/metrics/phases', methods=['GET'])
+def get_phase_metrics():
+    """统计最近的任务运行记录中各阶段耗时和字节数的p50/p95，可按任务名称前缀筛选"""
+    try:
+        limit = min(max(request.args.get('limit', 200, type=int), 1), 5000)
+        task = request.args.get('task') or None
+        entries = history_store.recent_with_detail('run', limit, task)
+        data = {}
+        for entry in entries:
+            data.setdefault(entry['task'], []).append(entry['details']['run'])
+        return jsonify({"success": True, "data": {name: summarize_runs(runs) for name, runs in data.items()}})
+    except Exception as e:
+        logger.error(f"获取阶段耗时统计失败: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+# API路由 - 获取更新任务的执行和合并次数
+@app.route('/api/metrics/jobs', methods=['GET'])
+def get_job_metrics():
+    """各类更新实际执行的次数，以及因已有执行而被合并的触发次数（进程启动以来）"""
+    return jsonify({"success": True, "data": single_flight.stats()})
+
+# API路由 - 获取定时任务的调度状态
+@app.route('/api/schedule', methods=['GET'])
+def get_schedule():
+    """各定时任务的调度模式、当前间隔、下次执行时间，以及自适应调度学习到的状态"""
+    try:
+        current_config = config_service.get() or config
+        state = adaptive_schedule.snapshot()
+        data = {}
+        for job_id in SCHEDULED_JOBS:
+            job = scheduler.get_job(job_id)
+            next_run = job.next_run_time if job else None
+            data[job_id] = {
+                "mode": current_config.get('schedule_mode', 'fixed'),
+                "interval": job_interval(job_id, current_config),
+                "next_run_time": next_run.strftime("%Y-%m-%d %H:%M:%S") if next_run else None,
+                "state": state.get(job_id, {}),
+            }
+        return jsonify({"success": True, "data": data})
+    except Exception as e:
+        logger.error(f"获取调度状态失败: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+# API路由 - 分页获取配置备份列表
+@app.route('/api/backups', methods=['GET'])
+def list_backups():
+    """分页获取配置备份（编号、时间、哈希、大小），只读取备份索引"""
+    try:
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = min(max(request.args.get('page_size', 20, type=int), 1), 200)
+        current_config = config_service.get() or config
+        store = BackupStore(
+            current_config.get('backup_dir', '/etc/mihomo/data/backups'),
+            current_config.get('max_backups', 10),
+            current_config.get('max_backup_age_days', 0)
+        )
+        entries, total = store.page((page - 1) * page_size, page_size)
+        for entry in entries:
+            entry['timestamp'] = datetime.fromtimestamp(entry['time']).strftime("%Y-%m-%d %H:%M:%S")
+        return jsonify({"success": True, "data": {
+            "items": entries,
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+        }})
+    except Exception as e:
+        logger.error(f"获取备份列表失败: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+# API路由 - 恢复配置备份
+@app.route('/api/backups/<int:backup_id>/restore', methods=['POST'])
+def restore_backup(backup_id):
+    """把指定备份恢复为当前Mihomo配置并重新加载"""
+    logger.info(f"恢复配置备份: #{backup_id}")
+    try:
+        from updater import MihomoUpdater
+        updater = MihomoUpdater(config_path)
+        if not updater.backup_store().get(backup_id):
+            return jsonify({"success": False, "message": f"备份 #{backup_id} 不存在"}), 404
+        
+        success = updater.restore_backup(backup_id)
+        details = dict(updater.last_details, status=updater.last_status)
+        if success and updater.last_status == 'reload_failed':
+            # 配置文件已恢复，但Mihomo仍在使用旧配置
+            message = f"已恢复备份 #{backup_id}，但Mihomo重新加载失败"
+            log_task_result("恢复配置备份", False, message, details)
+            return jsonify({"success": True, "reloaded": False, "message": message, "data": details})
+        log_task_result("恢复配置备份", success, f"恢复备份 #{backup_id}" + ("成功" if success else "失败"), details)
+        if success:
+            return jsonify({"success": True, "reloaded": True, "message": f"已恢复备份 #{backup_id}", "data": details})
+        return jsonify({"success": False, "message": f"恢复备份 #{backup_id} 失败"}), 500
+    except Exception as e:
+        logger.error(f"恢复配置备份失败: {e}")
+        log_task_result("恢复配置备份", False, str(e))
+        return jsonify({"success": False, "message": str(e)}), 500
 
 # 健康检查路由
 @app.route('/health')
 def health_check():
-    """健康检查接口"""
-    return jsonify({"status": "ok"})
+    """存活检查接口：进程能响应请求即返回ok，不依赖更新是否完成"""
+    return jsonify({"status": "ok", "uptime": round(time.time() - PROCESS_START, 3)})
 
-if __name__ == "__main__":
-    # 启动时立即执行一次更新任务
-    logger.info("服务启动，执行初始更新任务")
+# 就绪检查路由
+@app.route('/ready')
+def readiness_check():
+    """就绪检查接口：配置和GEO文件自启动以来都成功同步过一次后返回200，否则返回503"""
+    with sync_state_lock:
+        state = dict(sync_state)
+    ready = all(value is not None for value in state.values())
+    data = {
+        "status": "ready" if ready else "starting",
+        "synced": {task: value is not None for task, value in state.items()},
+        "uptime": round(time.time() - PROCESS_START, 3),
+    }
+    return jsonify(data), 200 if ready else 503
+
+# 执行启动时的初始更新
+def run_initial_updates():
+    """在后台线程中依次执行一次配置更新和GEO文件更新，不阻塞HTTP服务"""
+    logger.info("服务启动，在后台执行初始更新任务")
     update_mihomo_config_job()
     update_geoip_job()
-    
-    # 启动Flask应用
+    logger.info(f"初始更新任务完成，距进程启动 {time.time() - PROCESS_START:.2f}秒")
+
+if __name__ == "__main__":
+    from werkzeug.serving import make_server
+
+    # 先绑定端口，保证/health在初始更新期间即可访问
     port = config.get('web_port', 5000)
-    logger.info(f"Mihomo自动更新服务已启动，监听端口: {port}")
-    app.run(host='0.0.0.0', port=port) 
\ No newline at end of file
+    server = make_server('0.0.0.0', port, app, threaded=True)
+    logger.info(f"Mihomo自动更新服务已启动，监听端口: {port}，启动耗时 {time.time() - PROCESS_START:.2f}秒")
+
+    # 启动时在后台执行一次更新任务
+    threading.Thread(target=run_initial_updates, name="initial-update", daemon=True).start()
+    server.serve_forever() 
\ No newline at end of file
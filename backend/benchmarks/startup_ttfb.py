@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测量服务从进程启动到/health返回第一个字节（TTFB）的时间，以及到/ready返回200的时间
+
+使用临时配置目录启动app.py，订阅和GEO地址指向本机不可用的端口，初始更新会很快失败，
+因此/ready通常不会就绪，只用于确认初始更新没有阻塞HTTP服务。
+
+使用方法: python benchmarks/startup_ttfb.py [端口] [次数]
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import http.client
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from utils import load_config, save_config
+
+
+def prepare_config_dir(port):
+    """生成临时配置目录，所有外部地址都指向不可用的本机端口"""
+    config_dir = tempfile.mkdtemp(prefix="mihomo-updater-bench-")
+    config = load_config(os.path.join(BACKEND_DIR, "config.yaml"))
+    unreachable = "http://127.0.0.1:9"
+    config.update({
+        "web_port": port,
+        "fetch_url": f"{unreachable}/sub",
+        "geoip_url": f"{unreachable}/geoip.dat",
+        "geosite_url": f"{unreachable}/geosite.dat",
+        "mmdb_url": f"{unreachable}/country.mmdb",
+        "geo_download_retries": 0,
+        "mihomo_config_path": os.path.join(config_dir, "mihomo", "config.yaml"),
+        "backup_dir": os.path.join(config_dir, "backups"),
+        "geoip_path": os.path.join(config_dir, "mihomo", "geoip.dat"),
+        "geosite_path": os.path.join(config_dir, "mihomo", "geosite.dat"),
+        "mmdb_path": os.path.join(config_dir, "mihomo", "country.mmdb"),
+    })
+    save_config(config, os.path.join(config_dir, "config.yaml"))
+    return config_dir
+
+
+def request_status(port, path):
+    """请求本机接口，返回状态码，连接失败时返回None"""
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+        conn.request("GET", path)
+        status = conn.getresponse().status
+        conn.close()
+        return status
+    except OSError:
+        return None
+
+
+def measure_once(port, ready_timeout=5.0):
+    """启动一次服务，返回(到/health的秒数, 到/ready的秒数或None)"""
+    config_dir = prepare_config_dir(port)
+    env = dict(os.environ, CONFIG_DIR=config_dir)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "app.py"], cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        health = None
+        while health is None and process.poll() is None:
+            if request_status(port, "/health") == 200:
+                health = time.perf_counter() - start
+            else:
+                time.sleep(0.01)
+        ready = None
+        while health is not None and time.perf_counter() - start < health + ready_timeout:
+            if request_status(port, "/ready") == 200:
+                ready = time.perf_counter() - start
+                break
+            time.sleep(0.1)
+        return health, ready
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(config_dir, ignore_errors=True)
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5099
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    for i in range(runs):
+        health, ready = measure_once(port)
+        if health is None:
+            print(f"第{i + 1}次: 服务启动失败")
+            return 1
+        ready_text = f"{ready:.3f}s" if ready is not None else "未就绪（初始更新失败）"
+        print(f"第{i + 1}次: /health TTFB {health:.3f}s, /ready {ready_text}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+比较完整解析与按段解析（只解析proxies、proxy-groups、rules）大订阅的耗时和内存峰值
+
+使用方法: python benchmarks/streaming_parse.py [节点数] [无关条目数]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import yaml_load, yaml_dump, yaml_load_sections, SUBSCRIPTION_SECTIONS
+
+
+def build_subscription(proxy_count, extra_count):
+    """生成带有大量无关配置段（dns、hosts、script）的合成订阅"""
+    proxies = [
+        {"name": f"节点-{i:05d}", "type": "ss", "server": f"s{i}.example.com",
+         "port": 10000 + i % 50000, "cipher": "aes-128-gcm", "password": f"pw{i}"}
+        for i in range(proxy_count)
+    ]
+    return {
+        "port": 7890,
+        "dns": {
+            "enable": True,
+            "nameserver-policy": {f"+.domain{i}.example.com": [f"10.0.{i % 256}.1"] for i in range(extra_count)},
+        },
+        "hosts": {f"host{i}.lan": f"192.168.{i % 256}.{i % 250 + 1}" for i in range(extra_count)},
+        "script": {"shortcuts": {f"rule{i}": f"host == 'h{i}.example.com'" for i in range(extra_count)}},
+        "proxies": proxies,
+        "proxy-groups": [{"name": "PROXY", "type": "select", "proxies": [p["name"] for p in proxies]}],
+        "rules": [f"DOMAIN-SUFFIX,site{i}.example.com,PROXY" for i in range(extra_count)] + ["MATCH,DIRECT"],
+    }
+
+
+def measure(func, *args):
+    """返回(结果, 耗时秒数, 内存峰值字节数)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    proxy_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    extra_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    text = yaml_dump(build_subscription(proxy_count, extra_count))
+    print(f"订阅大小: {len(text) / 1024 / 1024:.1f}MB")
+
+    full, full_time, full_peak = measure(yaml_load, text)
+    print(f"完整解析: {full_time:.3f}s, 内存峰值 {full_peak / 1024 / 1024:.1f}MB")
+    partial, partial_time, partial_peak = measure(yaml_load_sections, text, SUBSCRIPTION_SECTIONS)
+    print(f"按段解析: {partial_time:.3f}s, 内存峰值 {partial_peak / 1024 / 1024:.1f}MB")
+
+    # 按段解析的结果必须与完整解析中对应的部分一致
+    same = partial == {key: full[key] for key in SUBSCRIPTION_SECTIONS}
+    print(f"解析结果一致: {same}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+比较libyaml（c）与纯Python（python）两种YAML引擎的解析和序列化耗时
+
+使用方法: python benchmarks/yaml_engines.py [节点数] [规则数]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yaml
+from utils import yaml_load, yaml_dump
+
+
+def build_config(proxy_count, rule_count):
+    """生成与真实订阅结构相近的合成配置"""
+    proxies = [
+        {
+            "name": f"节点-{i:05d}",
+            "type": "vmess",
+            "server": f"s{i}.example.com",
+            "port": 10000 + i % 50000,
+            "uuid": f"00000000-0000-0000-0000-{i:012d}",
+            "alterId": 0,
+            "cipher": "auto",
+            "tls": i % 2 == 0,
+            "network": "ws",
+            "ws-opts": {"path": f"/ws/{i}", "headers": {"Host": f"cdn{i}.example.com"}},
+        }
+        for i in range(proxy_count)
+    ]
+    names = [proxy["name"] for proxy in proxies]
+    return {
+        "port": 7890,
+        "mode": "rule",
+        "proxies": proxies,
+        "proxy-groups": [
+            {"name": "PROXY", "type": "select", "proxies": names},
+            {"name": "AUTO", "type": "url-test", "proxies": names,
+             "url": "http://www.gstatic.com/generate_204", "interval": 300},
+        ],
+        "rules": [f"DOMAIN-SUFFIX,site{i}.example.com,PROXY" for i in range(rule_count)] + ["MATCH,DIRECT"],
+    }
+
+
+def measure(func, *args):
+    """返回(结果, 耗时秒数)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    proxy_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rule_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    if not yaml.__with_libyaml__:
+        print("PyYAML未编译libyaml支持，只能测试python引擎")
+        return 1
+
+    config = build_config(proxy_count, rule_count)
+    results = {}
+    for engine in ("python", "c"):
+        text, dump_time = measure(yaml_dump, config, None, engine)
+        parsed, load_time = measure(yaml_load, text, engine)
+        results[engine] = (text, parsed)
+        print(f"{engine:>6}: 序列化 {dump_time:.3f}s, 解析 {load_time:.3f}s, 大小 {len(text) / 1024 / 1024:.1f}MB")
+
+    # 两种引擎的输出必须完全一致
+    same_dump = results["python"][0] == results["c"][0]
+    same_load = results["python"][1] == results["c"][1] == config
+    print(f"序列化结果一致: {same_dump}, 解析结果一致: {same_load}")
+    return 0 if same_dump and same_load else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
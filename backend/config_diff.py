@@ -0,0 +1,105 @@
+import json
+import hashlib
+from difflib import SequenceMatcher
+
+# 参与比较的配置段
+DIFF_SECTIONS = ('proxies', 'proxy-groups', 'rules')
+
+# 变更集中每类最多保留的条目数，计数不受影响
+DIFF_ITEM_LIMIT = 20
+
+def fingerprint(item):
+    """计算配置项内容的指纹，与字典键顺序无关"""
+    data = json.dumps(item, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+def _index_by_name(items):
+    """按名称建立索引：{名称: 指纹}，没有名称的项使用指纹作为名称"""
+    index = {}
+    for item in items or []:
+        key = fingerprint(item)
+        name = item.get('name', key) if isinstance(item, dict) else key
+        index[str(name)] = key
+    return index
+
+def _compact(added, removed, modified=None):
+    """生成紧凑的变更记录：完整计数加上截断的条目列表"""
+    change = {
+        "added": len(added),
+        "removed": len(removed),
+        "items": {
+            "added": list(added)[:DIFF_ITEM_LIMIT],
+            "removed": list(removed)[:DIFF_ITEM_LIMIT],
+        },
+    }
+    if modified is not None:
+        change["modified"] = len(modified)
+        change["items"]["modified"] = list(modified)[:DIFF_ITEM_LIMIT]
+    return change
+
+def diff_named(old_items, new_items):
+    """按名称比较节点或代理组，列表顺序的变化不算修改"""
+    old_index = _index_by_name(old_items)
+    new_index = _index_by_name(new_items)
+    added = [name for name in new_index if name not in old_index]
+    removed = [name for name in old_index if name not in new_index]
+    modified = [name for name in new_index if name in old_index and new_index[name] != old_index[name]]
+    return _compact(added, removed, modified)
+
+def diff_rules(old_rules, new_rules):
+    """把规则作为有序序列比较，规则顺序的变化会体现为删除和新增"""
+    old_rules = [str(rule) for rule in old_rules or []]
+    new_rules = [str(rule) for rule in new_rules or []]
+    
+    # 先去掉相同的前缀和后缀，只对中间变化的部分做序列比较
+    start = 0
+    limit = min(len(old_rules), len(new_rules))
+    while start < limit and old_rules[start] == new_rules[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old_rules[-1 - end] == new_rules[-1 - end]:
+        end += 1
+    old_middle = old_rules[start:len(old_rules) - end]
+    new_middle = new_rules[start:len(new_rules) - end]
+    
+    added = []
+    removed = []
+    if old_middle and new_middle:
+        matcher = SequenceMatcher(None, old_middle, new_middle, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag in ('replace', 'delete'):
+                removed.extend(old_middle[i1:i2])
+            if tag in ('replace', 'insert'):
+                added.extend(new_middle[j1:j2])
+    else:
+        removed = old_middle
+        added = new_middle
+    return _compact(added, removed)
+
+def diff_configs(old_config, new_config):
+    """比较两份配置的proxies、proxy-groups、rules，返回紧凑的变更集"""
+    old_config = old_config or {}
+    new_config = new_config or {}
+    changeset = {
+        "proxies": diff_named(old_config.get('proxies'), new_config.get('proxies')),
+        "proxy-groups": diff_named(old_config.get('proxy-groups'), new_config.get('proxy-groups')),
+        "rules": diff_rules(old_config.get('rules'), new_config.get('rules')),
+    }
+    changeset["changed"] = any(
+        changeset[section]["added"] or changeset[section]["removed"] or changeset[section].get("modified")
+        for section in DIFF_SECTIONS
+    )
+    return changeset
+
+def summarize_changeset(changeset):
+    """生成变更集的一行说明"""
+    if not changeset.get("changed"):
+        return "配置无变化"
+    parts = []
+    for section in DIFF_SECTIONS:
+        change = changeset[section]
+        counts = f"+{change['added']} -{change['removed']}"
+        if "modified" in change:
+            counts += f" ~{change['modified']}"
+        parts.append(f"{section} {counts}")
+    return ", ".join(parts)
@@ -0,0 +1,142 @@
+import os
+import copy
+import logging
+import threading
+from utils import yaml_load, save_yaml
+
+logger = logging.getLogger("mihomo-updater")
+
+# 默认配置目录，可通过环境变量CONFIG_DIR修改
+DEFAULT_CONFIG_DIR = '/config'
+
+# 后台检查配置文件变化的间隔（秒）
+DEFAULT_WATCH_INTERVAL = 2.0
+
+def get_config_dir():
+    """配置目录：环境变量CONFIG_DIR，未设置时为/config"""
+    return os.environ.get('CONFIG_DIR', DEFAULT_CONFIG_DIR)
+
+def default_config_path():
+    """服务和更新器共用的配置文件路径"""
+    return os.path.join(get_config_dir(), "config.yaml")
+
+def _file_signature(path):
+    """文件的(修改时间, 大小, inode)，文件不存在时返回None；原子替换后inode也会变化"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+class ConfigService:
+    """在内存中保存解析后的配置，每次读取前通过stat检查文件是否变化，变化时重新解析并通知订阅者"""
+
+    def __init__(self, config_path):
+        self.config_path = config_path
+        self._config = None
+        self._signature = None
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._watcher = None
+        self._stop = threading.Event()
+        self.reloads = 0
+
+    def get(self):
+        """返回当前配置的副本（调用方可以随意修改），文件不存在或解析失败时返回None"""
+        return copy.deepcopy(self._revalidate())
+
+    def _revalidate(self):
+        """文件签名变化时重新解析，返回当前配置"""
+        signature = _file_signature(self.config_path)
+        with self._lock:
+            if signature is not None and signature == self._signature:
+                return self._config
+            previous = self._config
+            config = self._read()
+            if config is None and previous is not None and signature is not None:
+                # 文件暂时无法解析（例如正在被编辑器写入），继续使用上一次的配置
+                return previous
+            self._config = config
+            self._signature = signature
+            self.reloads += 1
+        if previous is not None and config is not None and config != previous:
+            self._publish(previous, config)
+        return config
+
+    def _read(self):
+        """读取并解析配置文件"""
+        try:
+            with open(self.config_path, 'r', encoding='utf-8') as file:
+                config = yaml_load(file)
+            return config if isinstance(config, dict) else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"加载配置文件失败: {e}")
+            return None
+
+    def save(self, config):
+        """原子写入配置文件并更新缓存，配置有变化时通知订阅者"""
+        with self._lock:
+            previous = self._config
+            if not save_yaml(config, self.config_path):
+                return False
+            self._config = copy.deepcopy(config)
+            self._signature = _file_signature(self.config_path)
+        if previous is not None and config != previous:
+            self._publish(previous, self._config)
+        return True
+
+    def subscribe(self, callback):
+        """订阅配置变化：callback(旧配置, 新配置, 变化的配置项集合)"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def _publish(self, old, new):
+        """通知订阅者，单个订阅者出错不影响其他订阅者"""
+        changed = {key for key in set(old) | set(new) if old.get(key) != new.get(key)}
+        logger.info(f"配置文件已变化: {', '.join(sorted(map(str, changed)))}")
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(copy.deepcopy(old), copy.deepcopy(new), changed)
+            except Exception as e:
+                logger.error(f"处理配置变化失败: {e}")
+
+    def start_watching(self, interval=DEFAULT_WATCH_INTERVAL):
+        """启动后台线程定期stat配置文件，手动编辑文件后也能及时通知订阅者"""
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="config-watch", daemon=True)
+        self._watcher.start()
+        logger.info(f"开始监视配置文件变化: {self.config_path}，间隔 {interval}秒")
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            self._revalidate()
+
+    def stop_watching(self):
+        """停止后台监视线程"""
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
+
+# 每个配置文件对应一个共享的服务实例
+_services = {}
+_services_lock = threading.Lock()
+
+def get_service(config_path=None):
+    """获取配置文件对应的共享ConfigService，未指定路径时使用CONFIG_DIR下的config.yaml"""
+    key = os.path.abspath(config_path or default_config_path())
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            service = _services[key] = ConfigService(key)
+        return service
+
+def load_config(config_path=None):
+    """通过共享缓存读取配置，文件未变化时不重新解析，返回可修改的副本"""
+    return get_service(config_path).get()
@@ -2,17 +2,183 @@ import os
 import requests
 import logging
 import time
-from utils import load_config, setup_logger
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from utils import setup_logger, load_json, save_json, file_sha256
+from config_service import load_config, default_config_path
+from metrics import RunRecord
 
 # 初始化日志
 logger = setup_logger("geoip_updater.log")
 logger.info("GeoIP更新器初始化")
 
+# 需要更新的GEO文件：(名称, URL配置项, 路径配置项, 默认路径)
+GEO_FILES = [
+    ("GeoIP", "geoip_url", "geoip_path", "/etc/mihomo/geoip.dat"),
+    ("GeoSite", "geosite_url", "geosite_path", "/etc/mihomo/geosite.dat"),
+    ("MMDB", "mmdb_url", "mmdb_path", "/etc/mihomo/country.mmdb"),
+]
+
+# 校验信息存储文件名，保存在GEO文件所在目录
+VALIDATOR_FILENAME = ".geo_validators.json"
+
+# 镜像统计信息存储文件名，保存在GEO文件所在目录
+MIRROR_STATS_FILENAME = ".geo_mirrors.json"
+
+# 镜像连续失败达到上限后降级的时长（秒），期间只作为最后的备选
+MIRROR_COOLDOWN = 6 * 3600
+
+# 延迟和吞吐量滚动平均的平滑系数
+MIRROR_EWMA_ALPHA = 0.3
+
+# 可以重试的HTTP状态码（5xx之外）
+RETRYABLE_STATUS = (408, 429)
+
+class TransientDownloadError(IOError):
+    """可以重试的下载错误：传输被截断、续传范围不匹配等，重试时重新请求"""
+
+# 下载错误是否值得重试
+def is_transient_error(error):
+    """连接失败、超时、传输中断、5xx/408/429可以重试；地址无效、其他4xx和本地写入错误立即失败"""
+    if isinstance(error, TransientDownloadError):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return status is None or status >= 500 or status in RETRYABLE_STATUS
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                              requests.exceptions.ChunkedEncodingError))
+
+# 下载进度：{保存路径: {...}}，供Web界面展示
+_progress_lock = threading.Lock()
+_download_progress = {}
+
+def _set_progress(save_path, **fields):
+    """更新某个文件的下载进度"""
+    with _progress_lock:
+        item = _download_progress.setdefault(save_path, {"path": save_path})
+        item.update(fields)
+        item['updated_at'] = time.time()
+
+def get_download_progress():
+    """获取所有GEO文件的下载进度快照"""
+    with _progress_lock:
+        return [dict(item) for item in _download_progress.values()]
+
+def _parse_content_range(value):
+    """解析Content-Range头，返回(起始位置, 总大小)，总大小未知时为None"""
+    # 格式: bytes 100-999/1000 或 bytes 100-999/*
+    unit, _, spec = (value or '').partition(' ')
+    byte_range, _, total = spec.partition('/')
+    start = byte_range.partition('-')[0]
+    if unit != 'bytes' or not start.isdigit():
+        raise TransientDownloadError(f"无法解析Content-Range: {value}")
+    return int(start), int(total) if total.isdigit() else None
+
+class ValidatorStore:
+    """按URL持久化保存GEO文件的ETag、Last-Modified、大小和sha256"""
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.lock = threading.Lock()
+        self.entries = load_json(store_path, {}) or {}
+
+    def get(self, url):
+        """获取URL对应的校验信息"""
+        with self.lock:
+            entry = self.entries.get(url)
+            return dict(entry) if entry else None
+
+    def set(self, url, entry):
+        """更新URL对应的校验信息并立即写盘"""
+        with self.lock:
+            self.entries[url] = entry
+            save_json(self.entries, self.store_path)
+
+    def matches_local(self, url, save_path):
+        """检查本地文件是否就是校验信息记录的那个文件，返回可用的校验信息"""
+        entry = self.get(url)
+        if not entry or entry.get('path') != save_path:
+            return None
+        try:
+            if os.path.getsize(save_path) != entry.get('size'):
+                return None
+        except OSError:
+            return None
+        if file_sha256(save_path) != entry.get('sha256'):
+            return None
+        return entry
+
+class MirrorStats:
+    """持久化保存每个镜像的滚动延迟、吞吐量和失败次数，用于镜像排序"""
+
+    def __init__(self, store_path, max_failures=3):
+        self.store_path = store_path
+        self.max_failures = max_failures
+        self.lock = threading.Lock()
+        self.entries = load_json(store_path, {}) or {}
+
+    def _ewma(self, old, value):
+        """计算滚动平均"""
+        if old is None:
+            return value
+        return MIRROR_EWMA_ALPHA * value + (1 - MIRROR_EWMA_ALPHA) * old
+
+    def record_success(self, url, latency, received=0, elapsed=0):
+        """记录一次成功的下载，received/elapsed用于计算吞吐量，并清零连续失败次数"""
+        with self.lock:
+            entry = self.entries.setdefault(url, {})
+            entry['latency'] = self._ewma(entry.get('latency'), latency)
+            # 数据量太小时吞吐量没有参考价值
+            if received >= 64 * 1024 and elapsed > 0:
+                entry['throughput'] = self._ewma(entry.get('throughput'), received / elapsed)
+            entry['successes'] = entry.get('successes', 0) + 1
+            entry['consecutive_failures'] = 0
+            entry['last_success'] = time.time()
+            save_json(self.entries, self.store_path)
+
+    def record_latency(self, url, latency):
+        """只记录探测得到的延迟：探测成功不代表下载能成功，不清零连续失败次数"""
+        with self.lock:
+            entry = self.entries.setdefault(url, {})
+            entry['latency'] = self._ewma(entry.get('latency'), latency)
+            save_json(self.entries, self.store_path)
+
+    def record_failure(self, url):
+        """记录一次失败的请求"""
+        with self.lock:
+            entry = self.entries.setdefault(url, {})
+            entry['failures'] = entry.get('failures', 0) + 1
+            entry['consecutive_failures'] = entry.get('consecutive_failures', 0) + 1
+            entry['last_failure'] = time.time()
+            save_json(self.entries, self.store_path)
+
+    def is_demoted(self, url):
+        """连续失败过多且仍在冷却期内的镜像被降级"""
+        with self.lock:
+            entry = self.entries.get(url, {})
+        return (entry.get('consecutive_failures', 0) >= self.max_failures
+                and time.time() - entry.get('last_failure', 0) < MIRROR_COOLDOWN)
+
+    def cost(self, url, failure_penalty=5):
+        """估算下载1MB所需的秒数，没有历史数据的镜像视为0以便被尝试，每次连续失败额外加罚"""
+        with self.lock:
+            entry = dict(self.entries.get(url, {}))
+        cost = entry.get('latency') or 0
+        if entry.get('throughput'):
+            cost += 1024 * 1024 / entry['throughput']
+        return cost + entry.get('consecutive_failures', 0) * failure_penalty
+
+    def rank(self, urls):
+        """按照是否降级和估算耗时排序，配置中的顺序作为最后的依据"""
+        return sorted(urls, key=lambda url: (self.is_demoted(url), self.cost(url), urls.index(url)))
+
 class GeoIPUpdater:
-    def __init__(self, config_path="config.yaml"):
-        """初始化GeoIP更新器"""
-        self.config_path = config_path
-        self.config = load_config(config_path)
+    def __init__(self, config_path=None):
+        """初始化GeoIP更新器，未指定路径时使用CONFIG_DIR下的config.yaml（与Web服务相同）"""
+        self.config_path = config_path or default_config_path()
+        self.config = load_config(self.config_path)
         if not self.config:
             logger.error("无法加载配置文件")
             raise ValueError("配置文件加载失败")
@@ -23,119 +189,434 @@ class GeoIPUpdater:
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
+        
+        # 并发下载的线程数，所有下载共享同一个保持连接的Session
+        self.workers = max(1, int(self.config.get('geo_download_workers', 3)))
+        self.session = self._create_session()
+        
+        # 校验信息存储，用于构造条件GET请求
+        geo_dir = os.path.dirname(self.config.get('geoip_path', GEO_FILES[0][3]))
+        self.validators = ValidatorStore(os.path.join(geo_dir, VALIDATOR_FILENAME))
+        
+        # 镜像统计信息，跨任务保留，用于选择最快的镜像
+        self.mirrors = MirrorStats(os.path.join(geo_dir, MIRROR_STATS_FILENAME),
+                                   max_failures=int(self.config.get('geo_mirror_max_failures', 3)))
+        self.mirror_race = self.config.get('geo_mirror_race', True)
+        self.probe_timeout = float(self.config.get('geo_mirror_probe_timeout', 5))
+        
+        # 下载写盘的缓冲区大小
+        self.chunk_size = max(8192, int(self.config.get('geo_download_chunk_size', 1024 * 1024)))
+        
+        # 同一次任务内的重试次数和指数退避的初始间隔（秒）
+        self.retries = max(0, int(self.config.get('geo_download_retries', 3)))
+        self.retry_backoff = float(self.config.get('geo_retry_backoff', 2))
+        
+        # 最近一次更新的结果：{名称: {...}} 以及总耗时
+        self.last_results = {}
+        self.last_elapsed = 0.0
+        # 每个文件最近一次下载的状态：not_modified / unchanged / installed
+        self.file_status = {}
+        # 每个文件最近一次下载的传输统计：首字节延迟、接收字节数和传输耗时
+        self.transfer_stats = {}
+        # 阶段开始时的回调（后台任务用它报告当前阶段）
+        self.phase_listener = None
+        # 最近一次更新各阶段的耗时和字节数（多个文件并发下载时累加）
+        self.run_record = RunRecord('geo', self.phase_listener)
+
+    def _create_session(self):
+        """创建带连接池的HTTP会话"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update(self.headers)
+        return session
 
-    def download_file(self, url, save_path):
-        """下载文件并保存到指定路径"""
+    def close(self):
+        """关闭HTTP会话，释放连接池"""
+        self.session.close()
+
+    def download_file(self, url, save_path, retries=None):
+        """下载文件并保存到指定路径，临时性错误按指数退避重试并断点续传，其他错误立即失败"""
+        retries = self.retries if retries is None else retries
+        if not url:
+            logger.error(f"未配置下载地址: {save_path}")
+            _set_progress(save_path, status='failed')
+            return False
         try:
             # 创建目录（如果不存在）
             os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        except Exception as e:
+            logger.error(f"创建目录失败 {save_path}: {str(e)}")
+            return False
+        
+        logger.info(f"准备下载文件: {url} -> {save_path}")
+        _set_progress(save_path, url=url, status='downloading', downloaded=0, total=None, speed=0)
+        
+        for attempt in range(1, retries + 2):
+            try:
+                self._download_once(url, save_path)
+                return True
+            except requests.exceptions.RequestException as e:
+                logger.error(f"下载文件失败 {url}: {str(e)}")
+                error = e
+            except Exception as e:
+                logger.error(f"保存文件失败 {save_path}: {str(e)}")
+                error = e
             
-            logger.info(f"准备下载文件: {url} -> {save_path}")
-            
-            # 检查文件是否存在，如果存在，发送带有If-None-Match头的请求
-            etag = None
-            if os.path.exists(save_path):
-                try:
-                    # 发送HEAD请求获取ETag
-                    logger.info(f"文件已存在，检查ETag: {save_path}")
-                    head_response = requests.head(url, headers=self.headers, timeout=30)
-                    if 'ETag' in head_response.headers:
-                        etag = head_response.headers['ETag']
-                        self.headers['If-None-Match'] = etag
-                        logger.info(f"获取到ETag: {etag}")
-                except Exception as e:
-                    logger.warning(f"获取ETag失败: {e}")
-            
-            # 下载文件
-            logger.info(f"开始下载文件: {url}")
-            response = requests.get(url, headers=self.headers, stream=True, timeout=30)
-            
+            if not is_transient_error(error):
+                logger.error(f"错误无法通过重试解决，不再重试: {url}")
+                break
+            if attempt <= retries:
+                delay = self.retry_backoff * (2 ** (attempt - 1))
+                logger.info(f"{delay:.1f}秒后进行第{attempt}次重试: {url}")
+                _set_progress(save_path, status='retrying', attempt=attempt)
+                with self.run_record.phase('retry_wait'):
+                    time.sleep(delay)
+        
+        _set_progress(save_path, status='failed')
+        return False
+
+    def _partial_paths(self, save_path):
+        """返回部分下载文件及其校验信息文件的路径"""
+        directory, filename = os.path.split(save_path)
+        part_path = os.path.join(directory, f".{filename}.part")
+        return part_path, part_path + ".json"
+
+    def _discard_partial(self, save_path):
+        """删除部分下载文件及其校验信息"""
+        for path in self._partial_paths(save_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _download_once(self, url, save_path):
+        """执行一次下载，可续传时从部分文件末尾继续"""
+        # 每次下载使用独立的请求头，避免并发下载时互相覆盖
+        # 关闭压缩，保证Range和Content-Length针对的是文件本身的字节
+        headers = dict(self.headers)
+        headers['Accept-Encoding'] = 'identity'
+        
+        part_path, meta_path = self._partial_paths(save_path)
+        partial = load_json(meta_path) if os.path.exists(part_path) else None
+        resume_from = 0
+        if partial and partial.get('url') == url and (partial.get('etag') or partial.get('last_modified')):
+            resume_from = os.path.getsize(part_path)
+        else:
+            partial = None
+            self._discard_partial(save_path)
+        
+        validator = None
+        if resume_from:
+            # If-Range保证远程文件变化时服务器返回完整内容而不是错位的片段
+            headers['Range'] = f"bytes={resume_from}-"
+            headers['If-Range'] = partial.get('etag') or partial['last_modified']
+            logger.info(f"从 {resume_from} 字节处续传: {save_path}")
+        else:
+            # 本地文件与记录的校验信息一致时，发送条件GET请求
+            validator = self.validators.matches_local(url, save_path)
+            if validator:
+                if validator.get('etag'):
+                    headers['If-None-Match'] = validator['etag']
+                if validator.get('last_modified'):
+                    headers['If-Modified-Since'] = validator['last_modified']
+                logger.info(f"使用缓存的校验信息发送条件请求: ETag={validator.get('etag')}, "
+                            f"Last-Modified={validator.get('last_modified')}")
+        
+        logger.info(f"开始下载文件: {url}")
+        request_start = time.monotonic()
+        with self.run_record.phase('connect'):
+            response = self.session.get(url, headers=headers, stream=True, timeout=30)
+        latency = time.monotonic() - request_start
+        self.transfer_stats[save_path] = {"latency": latency, "received": 0, "elapsed": 0}
+        try:
             # 如果返回304（未修改），则无需更新
-            if response.status_code == 304:
+            if response.status_code == 304 and validator:
                 logger.info(f"文件未修改，无需更新: {save_path}")
-                return True
+                self.file_status[save_path] = 'not_modified'
+                _set_progress(save_path, status='not_modified')
+                return
+            
+            if response.status_code == 416:
+                self._discard_partial(save_path)
+                raise TransientDownloadError("服务器拒绝续传范围，已丢弃部分文件")
             
             # 检查响应状态
             response.raise_for_status()
             
-            # 保存文件
-            logger.info(f"开始写入文件: {save_path}")
-            with open(save_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
+            if response.status_code == 206:
+                start, total = _parse_content_range(response.headers.get('Content-Range'))
+                if start != resume_from:
+                    self._discard_partial(save_path)
+                    raise TransientDownloadError(f"续传起始位置不匹配: 期望 {resume_from}，实际 {start}")
+            else:
+                if resume_from:
+                    logger.info(f"远程文件已变化，重新下载: {url}")
+                resume_from = 0
+                length = response.headers.get('Content-Length')
+                total = int(length) if length and not response.headers.get('Content-Encoding') else None
+                # 只有带校验信息且未压缩的响应才能在失败后续传
+                partial = None
+                if total and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+                    partial = {
+                        "url": url,
+                        "etag": response.headers.get('ETag'),
+                        "last_modified": response.headers.get('Last-Modified'),
+                        "total": total,
+                    }
+                    save_json(partial, meta_path)
+                elif os.path.exists(meta_path):
+                    os.remove(meta_path)
+            
+            logger.info(f"开始写入部分文件: {part_path}")
+            stream_start = time.monotonic()
+            with self.run_record.phase('download'):
+                sha256, size = self._stream_to_partial(response, save_path, part_path, resume_from, total,
+                                                       keep_on_error=partial is not None)
+            self.transfer_stats[save_path].update(received=size - resume_from,
+                                                  elapsed=time.monotonic() - stream_start)
+        finally:
+            response.close()
+        
+        # 内容与已安装文件相同时跳过替换，mihomo不会感知到变化
+        with self.run_record.phase('verify'):
+            installed_sha256 = validator['sha256'] if validator else file_sha256(save_path)
+        if sha256 == installed_sha256:
+            os.remove(part_path)
+            logger.info(f"下载内容与已安装文件一致，跳过替换: {save_path}")
+            self.file_status[save_path] = 'unchanged'
+        else:
+            with self.run_record.phase('install'):
+                self._install(part_path, save_path)
+                self.run_record.add_bytes('install', size)
+            logger.info(f"成功下载并替换文件: {save_path}，大小: {size} 字节")
+            self.file_status[save_path] = 'installed'
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        _set_progress(save_path, status=self.file_status[save_path])
+        
+        # 记录新的校验信息，供下次条件请求使用
+        self.validators.set(url, {
+            "path": save_path,
+            "etag": response.headers.get('ETag') or (partial or {}).get('etag'),
+            "last_modified": response.headers.get('Last-Modified') or (partial or {}).get('last_modified'),
+            "size": size,
+            "sha256": sha256,
+        })
+
+    def _stream_to_partial(self, response, save_path, part_path, resume_from, total, keep_on_error):
+        """把响应内容流式追加到部分文件，返回(完整文件的sha256, 大小)"""
+        digest = hashlib.sha256()
+        if resume_from:
+            # 续传时先对已下载的部分计算哈希
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                    digest.update(chunk)
+        
+        size = resume_from
+        received = 0
+        start = time.monotonic()
+        _set_progress(save_path, downloaded=size, total=total, resumed_from=resume_from, speed=0)
+        try:
+            with open(part_path, 'ab' if resume_from else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
                     if chunk:
                         f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                        received += len(chunk)
+                        elapsed = time.monotonic() - start
+                        _set_progress(save_path, downloaded=size,
+                                      speed=int(received / elapsed) if elapsed > 0 else 0)
+                f.flush()
+                os.fsync(f.fileno())
             
-            logger.info(f"成功下载文件: {save_path}")
-            
-            # 如果响应包含ETag，保存它
-            if 'ETag' in response.headers:
-                etag = response.headers['ETag']
-                self.headers['If-None-Match'] = etag
-                logger.info(f"更新ETag: {etag}")
-            
-            return True
-        except requests.exceptions.RequestException as e:
-            logger.error(f"下载文件失败 {url}: {str(e)}")
-            return False
+            # 校验长度，防止连接提前断开得到截断的文件
+            if total is not None and size != total:
+                raise TransientDownloadError(f"下载不完整: 期望 {total} 字节，实际 {size} 字节")
+        except BaseException:
+            # 可续传的部分文件保留下来，下次重试时从断点继续
+            if not keep_on_error and os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        finally:
+            # 中断的传输也计入下载字节数
+            self.run_record.add_bytes('download', received)
+        return digest.hexdigest(), size
+
+    def _install(self, tmp_path, save_path):
+        """用os.replace把临时文件原子地替换到目标位置"""
+        # 沿用原文件权限，以免mihomo无法读取
+        mode = os.stat(save_path).st_mode & 0o777 if os.path.exists(save_path) else 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, save_path)
+        # 同步目录项，确保替换在断电后依然有效
+        if hasattr(os, 'O_DIRECTORY'):
+            dir_fd = os.open(os.path.dirname(os.path.abspath(save_path)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def _probe_mirror(self, url):
+        """请求镜像的第一个字节，返回首字节延迟（秒）"""
+        start = time.monotonic()
+        response = self.session.get(url, headers={"Range": "bytes=0-0", "Accept-Encoding": "identity"},
+                                    stream=True, timeout=self.probe_timeout)
+        try:
+            response.raise_for_status()
+            return time.monotonic() - start
+        finally:
+            response.close()
+
+    def _record_probe(self, url, future):
+        """记录探测结果到镜像统计：成功只更新延迟，连续失败次数只在完整下载成功后清零"""
+        try:
+            self.mirrors.record_latency(url, future.result())
         except Exception as e:
-            logger.error(f"保存文件失败 {save_path}: {str(e)}")
-            return False
+            logger.warning(f"镜像探测失败 {url}: {e}")
+            self.mirrors.record_failure(url)
 
-    def update_all_geo_files(self):
-        """更新所有GEO文件"""
-        success = True
+    def race_mirrors(self, urls):
+        """同时探测所有未降级的镜像，最先响应的排在最前，其余按历史得分排序"""
+        ranked = self.mirrors.rank(urls)
+        candidates = [url for url in ranked if not self.mirrors.is_demoted(url)]
+        if len(candidates) < 2:
+            return ranked
         
-        logger.info("开始更新GeoIP数据文件")
+        executor = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix="geo-probe")
+        futures = {executor.submit(self._probe_mirror, url): url for url in candidates}
+        winner = None
+        try:
+            for future in as_completed(futures, timeout=self.probe_timeout + 1):
+                if future.exception() is None:
+                    winner = futures[future]
+                    break
+        except Exception:
+            pass
+        finally:
+            # 其余探测在后台完成，结果照常计入统计
+            for future, url in futures.items():
+                future.add_done_callback(lambda f, url=url: self._record_probe(url, f))
+            executor.shutdown(wait=False)
         
-        # 更新GeoIP数据
-        geoip_url = self.config.get('geoip_url', '')
-        geoip_path = self.config.get('geoip_path', '/etc/mihomo/geoip.dat')
-        logger.info(f"更新GeoIP数据: {geoip_url} -> {geoip_path}")
+        if winner is None:
+            return ranked
+        logger.info(f"镜像竞速胜出: {winner}")
+        return [winner] + [url for url in ranked if url != winner]
+
+    def download_from_mirrors(self, urls, save_path):
+        """依次尝试镜像直到下载成功，返回成功的镜像URL，全部失败时返回None"""
+        with self.run_record.phase('mirror_select'):
+            ordered = self.race_mirrors(urls) if self.mirror_race else self.mirrors.rank(urls)
+        for index, url in enumerate(ordered):
+            # 还有备选镜像时不在当前镜像上重试，直接切换
+            is_last = index == len(ordered) - 1
+            if self.download_file(url, save_path, retries=None if is_last else 0):
+                stats = self.transfer_stats.get(save_path, {})
+                self.mirrors.record_success(url, stats.get('latency', 0), stats.get('received', 0),
+                                            stats.get('elapsed', 0))
+                return url
+            self.mirrors.record_failure(url)
+            if not is_last:
+                logger.warning(f"镜像下载失败，切换到下一个镜像: {url}")
+        return None
+
+    def _mirror_urls(self, url_key):
+        """获取某个GEO文件的所有下载地址：主地址（字符串或列表）加上*_mirrors列表"""
+        urls = []
+        for key in (url_key, url_key.replace('_url', '_mirrors')):
+            value = self.config.get(key) or []
+            for url in [value] if isinstance(value, str) else value:
+                if url and url not in urls:
+                    urls.append(url)
+        return urls
+
+    def _update_geo_file(self, name, url_key, path_key, default_path):
+        """更新单个GEO文件，返回结果字典"""
+        urls = self._mirror_urls(url_key)
+        path = self.config.get(path_key, default_path)
+        logger.info(f"更新{name}数据: {', '.join(urls)} -> {path}")
         
-        if not self.download_file(geoip_url, geoip_path):
-            logger.error("GeoIP数据更新失败")
-            success = False
+        start = time.monotonic()
+        if len(urls) > 1:
+            url = self.download_from_mirrors(urls, path)
+            success = url is not None
         else:
-            logger.info("GeoIP数据更新成功")
-        
-        # 更新GeoSite数据
-        geosite_url = self.config.get('geosite_url', '')
-        geosite_path = self.config.get('geosite_path', '/etc/mihomo/geosite.dat')
-        logger.info(f"更新GeoSite数据: {geosite_url} -> {geosite_path}")
+            url = urls[0] if urls else ''
+            success = self.download_file(url, path)
+        elapsed = time.monotonic() - start
         
-        if not self.download_file(geosite_url, geosite_path):
-            logger.error("GeoSite数据更新失败")
-            success = False
+        if success:
+            logger.info(f"{name}数据更新成功，耗时: {elapsed:.2f}秒")
         else:
-            logger.info("GeoSite数据更新成功")
+            logger.error(f"{name}数据更新失败，耗时: {elapsed:.2f}秒")
         
-        # 更新MMDB数据
-        mmdb_url = self.config.get('mmdb_url', '')
-        mmdb_path = self.config.get('mmdb_path', '/etc/mihomo/country.mmdb')
-        logger.info(f"更新MMDB数据: {mmdb_url} -> {mmdb_path}")
+        return {
+            "url": url,
+            "path": path,
+            "success": success,
+            "status": self.file_status.get(path) if success else 'failed',
+            "elapsed": round(elapsed, 3),
+        }
+
+    def update_all_geo_files(self):
+        """更新所有GEO文件"""
+        logger.info(f"开始更新GeoIP数据文件，并发数: {self.workers}")
+        start = time.monotonic()
+        self.run_record = RunRecord('geo', self.phase_listener)
         
-        if not self.download_file(mmdb_url, mmdb_path):
-            logger.error("MMDB数据更新失败")
-            success = False
+        if self.workers > 1:
+            # 并发下载，线程数不超过文件数量
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(GEO_FILES)),
+                                    thread_name_prefix="geo-download") as executor:
+                results = list(executor.map(lambda item: self._update_geo_file(*item), GEO_FILES))
         else:
-            logger.info("MMDB数据更新成功")
+            results = [self._update_geo_file(*item) for item in GEO_FILES]
+        
+        self.last_results = {item[0]: result for item, result in zip(GEO_FILES, results)}
+        self.last_elapsed = round(time.monotonic() - start, 3)
+        self.run_record.finish()
+        success = all(result['success'] for result in results)
         
         if success:
-            logger.info("所有GEO文件更新成功")
+            logger.info(f"所有GEO文件更新成功 - {self.summary()}")
         else:
-            logger.warning("部分GEO文件更新失败")
+            logger.warning(f"部分GEO文件更新失败 - {self.summary()}")
         
         return success
 
-def run_geo_updater():
-    """运行GeoIP更新器"""
+    def summary(self):
+        """返回最近一次更新结果的简要说明"""
+        parts = [
+            f"{name}: {'成功' if result['success'] else '失败'}"
+            for name, result in self.last_results.items()
+        ]
+        parts.append(f"总耗时: {self.last_elapsed:.2f}秒")
+        return ", ".join(parts)
+
+def run_geo_updater(details=None, on_phase=None):
+    """运行GeoIP更新器
+    
+    如果传入details字典，会把每个文件的结果和总耗时写入其中；
+    传入on_phase时，每个阶段开始时以阶段名调用它
+    """
     try:
         logger.info("=" * 50)
         logger.info("启动GeoIP更新")
         logger.info("=" * 50)
         
         updater = GeoIPUpdater()
-        success = updater.update_all_geo_files()
+        updater.phase_listener = on_phase
+        try:
+            success = updater.update_all_geo_files()
+        finally:
+            updater.close()
+        
+        if details is not None:
+            details['files'] = updater.last_results
+            details['elapsed'] = updater.last_elapsed
+            details['summary'] = updater.summary()
+            details['run'] = updater.run_record.to_dict()
         
         if success:
             logger.info("GeoIP更新完成：全部成功")
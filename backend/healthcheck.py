@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+容器存活检查：从服务使用的配置文件（CONFIG_DIR下的config.yaml）读取web_port，请求本机/health
+
+/health返回200时退出码为0，否则为1。修改web_port后需要重启服务才会生效，检查也按配置文件中的端口进行。
+
+使用方法: python healthcheck.py
+"""
+
+import sys
+import urllib.request
+
+from config_service import load_config
+
+# 配置文件不存在或未设置web_port时使用的端口，与app.py一致
+DEFAULT_PORT = 5000
+
+
+def main():
+    config = load_config() or {}
+    port = int(config.get('web_port') or DEFAULT_PORT)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2) as response:
+            return 0 if response.status == 200 else 1
+    except Exception as e:
+        print(f"存活检查失败（端口 {port}）: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
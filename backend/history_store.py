@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger("mihomo-updater")
+
+# 默认保留的任务历史条数
+DEFAULT_RETENTION = 1000
+
+# 需要按是否存在单独查询的details键，及其对应的标记列
+DETAIL_COLUMNS = {
+    "run": "has_run",
+    "changeset": "has_changeset",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    created REAL NOT NULL,
+    task TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    message TEXT,
+    details TEXT,
+    has_run INTEGER NOT NULL DEFAULT 0,
+    has_changeset INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_task_history_timestamp ON task_history (timestamp);
+CREATE INDEX IF NOT EXISTS idx_task_history_task ON task_history (task);
+CREATE INDEX IF NOT EXISTS idx_task_history_success ON task_history (success);
+CREATE INDEX IF NOT EXISTS idx_task_history_has_run ON task_history (has_run);
+CREATE INDEX IF NOT EXISTS idx_task_history_has_changeset ON task_history (has_changeset);
+"""
+
+def detail_flags(details):
+    """details中各个需要单独查询的键是否存在（值非空），按DETAIL_COLUMNS的顺序返回"""
+    details = details if isinstance(details, dict) else {}
+    return [int(bool(details.get(key))) for key in DETAIL_COLUMNS]
+
+# 插入语句，标记列与DETAIL_COLUMNS的顺序一致
+INSERT_SQL = (
+    "INSERT INTO task_history (timestamp, created, task, success, message, details, "
+    + ", ".join(DETAIL_COLUMNS.values()) + ") VALUES (?, ?, ?, ?, ?, ?, "
+    + ", ".join("?" for _ in DETAIL_COLUMNS) + ")"
+)
+
+class HistoryStore:
+    """基于SQLite的任务历史存储：每条记录单独插入，不再整体重写文件"""
+
+    def __init__(self, db_path, retention=DEFAULT_RETENTION, retention_days=0, legacy_json_path=None):
+        self.db_path = db_path
+        self.retention = int(retention or 0)
+        self.retention_days = float(retention_days or 0)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._add_detail_columns(conn)
+            conn.executescript(INDEXES)
+        if legacy_json_path:
+            self._migrate_json(legacy_json_path)
+
+    @staticmethod
+    def _add_detail_columns(conn):
+        """旧版数据库没有标记列时添加，并根据已有记录的details回填"""
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(task_history)")}
+        missing = [column for column in DETAIL_COLUMNS.values() if column not in existing]
+        if not missing:
+            return
+        for column in missing:
+            conn.execute(f"ALTER TABLE task_history ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        assignments = ", ".join(f"{column} = ?" for column in DETAIL_COLUMNS.values())
+        rows = conn.execute("SELECT id, details FROM task_history WHERE details IS NOT NULL").fetchall()
+        for row in rows:
+            try:
+                details = json.loads(row["details"])
+            except ValueError:
+                continue
+            conn.execute(f"UPDATE task_history SET {assignments} WHERE id = ?", detail_flags(details) + [row["id"]])
+        logger.info(f"任务历史数据库已添加标记列: {', '.join(missing)}，回填 {len(rows)} 条记录")
+
+    @contextmanager
+    def _connect(self):
+        """每次操作使用独立连接（结束时提交并关闭），可在调度器线程和请求线程中同时使用"""
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, task, success, message=None, details=None, created=None):
+        """追加一条任务记录并执行保留策略，返回该记录"""
+        created = created if created is not None else time.time()
+        entry = {
+            "timestamp": datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S"),
+            "task": task,
+            "success": bool(success),
+            "message": message or ("成功" if success else "失败"),
+        }
+        if details:
+            entry["details"] = details
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                INSERT_SQL,
+                [entry["timestamp"], created, task, int(bool(success)), entry["message"],
+                 json.dumps(details, ensure_ascii=False, default=str) if details else None] + detail_flags(details))
+            entry["id"] = cursor.lastrowid
+            self._prune(conn)
+        return entry
+
+    def _prune(self, conn):
+        """按条数和天数删除旧记录，只通过主键和索引定位"""
+        if self.retention > 0:
+            conn.execute("DELETE FROM task_history WHERE id <= (SELECT MAX(id) FROM task_history) - ?",
+                         (self.retention,))
+        if self.retention_days > 0:
+            conn.execute("DELETE FROM task_history WHERE created < ?",
+                         (time.time() - self.retention_days * 86400,))
+
+    @staticmethod
+    def _where(task=None, success=None):
+        """根据筛选条件生成WHERE子句：task按名称前缀匹配（范围查询，可以使用索引），success按成功/失败筛选"""
+        clauses, params = [], []
+        if task:
+            # 任何以task开头的名称都在[task, task + 最大码位)范围内
+            clauses.append("task >= ? AND task < ?")
+            params.extend([task, task + chr(0x10FFFF)])
+        if success is not None:
+            clauses.append("success = ?")
+            params.append(int(bool(success)))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, page=1, page_size=50, task=None, success=None):
+        """分页查询任务记录（从新到旧），返回(记录列表, 符合条件的总数)"""
+        where, params = self._where(task, success)
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM task_history{where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM task_history{where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + [page_size, (page - 1) * page_size]).fetchall()
+        return [self._row_to_entry(row) for row in rows], total
+
+    def version(self):
+        """历史记录的版本标识（最新编号和总条数），新增或清理记录后都会变化"""
+        with self._connect() as conn:
+            latest, count = conn.execute("SELECT MAX(id), COUNT(*) FROM task_history").fetchone()
+        return f"{latest or 0}-{count}"
+
+    def recent_with_detail(self, key, limit=200, task=None):
+        """最近limit条details中包含指定键的记录（从新到旧），可按任务名称前缀筛选；key须为DETAIL_COLUMNS中的键"""
+        where, params = self._where(task)
+        where += (" AND " if where else " WHERE ") + f"{DETAIL_COLUMNS[key]} = 1"
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM task_history{where} ORDER BY id DESC LIMIT ?",
+                                params + [limit]).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def latest_with_detail(self, key):
+        """查找最近一条details中包含指定键的记录；key须为DETAIL_COLUMNS中的键"""
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT * FROM task_history WHERE {DETAIL_COLUMNS[key]} = 1 ORDER BY id DESC LIMIT 1").fetchone()
+        return self._row_to_entry(row) if row else None
+
+    @staticmethod
+    def _row_to_entry(row):
+        """数据库行转换为与旧版task_history.json相同结构的字典"""
+        entry = {
+            "id": row["id"],
+            "timestamp": row["timestamp"],
+            "task": row["task"],
+            "success": bool(row["success"]),
+            "message": row["message"],
+        }
+        if row["details"]:
+            entry["details"] = json.loads(row["details"])
+        return entry
+
+    def _migrate_json(self, json_path):
+        """导入旧版task_history.json，导入后重命名原文件，避免重复导入"""
+        if not os.path.exists(json_path):
+            return
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+            with self._lock, self._connect() as conn:
+                for item in history:
+                    try:
+                        created = datetime.strptime(item["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+                    except (KeyError, ValueError):
+                        created = time.time()
+                    details = item.get("details")
+                    conn.execute(
+                        INSERT_SQL,
+                        [item.get("timestamp") or datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S"),
+                         created, item.get("task", ""), int(bool(item.get("success"))), item.get("message"),
+                         json.dumps(details, ensure_ascii=False, default=str) if details else None]
+                        + detail_flags(details))
+                self._prune(conn)
+            os.replace(json_path, json_path + ".migrated")
+            logger.info(f"已将 {len(history)} 条历史记录从 {json_path} 导入数据库")
+        except Exception as e:
+            logger.error(f"导入旧版任务历史失败: {e}")
@@ -0,0 +1,190 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("mihomo-updater")
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+# 内存中保留的已结束任务数量
+DEFAULT_KEEP_JOBS = 50
+
+class Job:
+    """一次后台任务：状态、当前阶段和进度，每次变化递增version并通知等待者"""
+
+    def __init__(self, job_type, condition):
+        self.id = uuid.uuid4().hex
+        self.type = job_type
+        self.status = JOB_QUEUED
+        self.phase = None
+        self.progress = None
+        self.success = None
+        self.message = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.version = 0
+        self._condition = condition
+
+    def update(self, **fields):
+        """更新任务字段（phase、progress、status等）并唤醒等待变化的请求"""
+        with self._condition:
+            for key, value in fields.items():
+                setattr(self, key, value)
+            self.version += 1
+            self._condition.notify_all()
+
+    @property
+    def done(self):
+        return self.status in FINISHED_STATES
+
+    def wait_change(self, version, timeout):
+        """等待任务版本超过version或超时，返回当前版本"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version > version, timeout)
+            return self.version
+
+    def to_dict(self):
+        """转换为接口返回的字典"""
+        with self._condition:
+            return {
+                "id": self.id,
+                "type": self.type,
+                "status": self.status,
+                "phase": self.phase,
+                "progress": self.progress,
+                "success": self.success,
+                "message": self.message,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "version": self.version,
+            }
+
+class JobManager:
+    """共享线程池执行手动触发的任务，接口立即返回任务ID，通过ID查询状态"""
+
+    def __init__(self, max_workers=2, keep=DEFAULT_KEEP_JOBS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.keep = keep
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job_type, func):
+        """提交任务，func(job)返回(是否成功, 说明)，返回Job对象"""
+        job = Job(job_type, threading.Condition())
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        self.executor.submit(self._run, job, func)
+        logger.info(f"已提交后台任务: {job_type} ({job.id})")
+        return job
+
+    def _run(self, job, func):
+        """在线程池中执行任务并记录结果"""
+        job.update(status=JOB_RUNNING, started=time.time())
+        try:
+            success, message = func(job)
+        except Exception as e:
+            logger.error(f"后台任务执行失败: {job.type} ({job.id}): {e}")
+            success, message = False, str(e)
+        job.update(status=JOB_SUCCEEDED if success else JOB_FAILED, success=bool(success),
+                   message=message, finished=time.time())
+
+    def _prune(self):
+        """只保留最近keep个已结束的任务，未结束的任务始终保留"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(len(finished) - self.keep, 0)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        """按ID获取任务，不存在时返回None"""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def shutdown(self, wait=True):
+        """关闭线程池"""
+        self.executor.shutdown(wait=wait)
+
+class _Flight:
+    """一次进行中的执行：结果、完成事件和等待该结果的回调"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.listeners = []
+        self.joined = 0
+
+class SingleFlight:
+    """按任务类型合并并发触发：同一类型已有执行时，新的触发加入该执行并共享其结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {}
+
+    def do(self, key, func, listener=None):
+        """执行func(notify)并返回(结果, 是否加入了已有执行)
+
+        func通过notify(value)通知所有等待者（包括后加入的），listener为本次触发接收通知的回调。
+        """
+        with self._lock:
+            stats = self._stats.setdefault(key, {"runs": 0, "coalesced": 0})
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                stats["runs"] += 1
+            else:
+                flight.joined += 1
+                stats["coalesced"] += 1
+            if listener is not None:
+                flight.listeners.append(listener)
+
+        if not leader:
+            logger.info(f"{key} 任务正在执行，本次触发合并到该执行")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        def notify(value):
+            with self._lock:
+                listeners = list(flight.listeners)
+            for callback in listeners:
+                try:
+                    callback(value)
+                except Exception:
+                    pass
+
+        try:
+            flight.result = func(notify)
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+            if flight.joined:
+                logger.info(f"{key} 任务执行结束，{flight.joined} 次触发共享了本次结果")
+
+    def running(self, key):
+        """该类型当前是否有执行"""
+        with self._lock:
+            return key in self._flights
+
+    def stats(self):
+        """各任务类型实际执行次数和被合并的触发次数"""
+        with self._lock:
+            return {key: dict(value) for key, value in self._stats.items()}
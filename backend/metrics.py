@@ -0,0 +1,102 @@
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+# 统计的分位数
+PERCENTILES = (50, 95)
+
+class RunRecord:
+    """一次任务运行的结构化记录：各阶段的耗时（秒）、字节数和次数
+
+    同一阶段多次执行（例如并发拉取多个订阅、下载多个GEO文件）时累加，
+    因此并发阶段的耗时之和可能大于整次运行的耗时。
+    """
+
+    def __init__(self, kind, listener=None):
+        self.kind = kind
+        # 阶段开始时调用listener(阶段名)，用于向后台任务报告当前阶段
+        self.listener = listener
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.elapsed = None
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, name):
+        """获取阶段记录，不存在时创建"""
+        return self.phases.setdefault(name, {"duration": 0.0, "bytes": 0, "count": 0})
+
+    @contextmanager
+    def phase(self, name):
+        """记录一个阶段的耗时，可在代码块中通过add_bytes记录字节数"""
+        if self.listener is not None:
+            try:
+                self.listener(name)
+            except Exception:
+                pass
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                entry = self._entry(name)
+                entry["duration"] += duration
+                entry["count"] += 1
+
+    def add_bytes(self, name, count):
+        """累加阶段处理的字节数"""
+        with self._lock:
+            self._entry(name)["bytes"] += int(count or 0)
+
+    def finish(self):
+        """结束记录，返回可保存到任务历史中的字典"""
+        if self.elapsed is None:
+            self.elapsed = time.perf_counter() - self._start
+        return self.to_dict()
+
+    def to_dict(self):
+        """转换为字典，耗时保留毫秒精度"""
+        with self._lock:
+            phases = {
+                name: {"duration": round(entry["duration"], 3), "bytes": entry["bytes"], "count": entry["count"]}
+                for name, entry in self.phases.items()
+            }
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self._start
+        return {"kind": self.kind, "started": self.started, "elapsed": round(elapsed, 3), "phases": phases}
+
+def percentile(values, pct):
+    """最近秩法计算分位数"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(math.ceil(pct / 100.0 * len(ordered)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+def summarize_runs(runs):
+    """汇总多次运行记录，返回各阶段耗时和字节数的p50/p95"""
+    samples = {}
+    elapsed = []
+    for run in runs:
+        if run.get("elapsed") is not None:
+            elapsed.append(run["elapsed"])
+        for name, entry in (run.get("phases") or {}).items():
+            sample = samples.setdefault(name, {"duration": [], "bytes": []})
+            sample["duration"].append(entry.get("duration", 0))
+            sample["bytes"].append(entry.get("bytes", 0))
+
+    def stats(values):
+        result = {"count": len(values)}
+        for pct in PERCENTILES:
+            result[f"p{pct}"] = percentile(values, pct)
+        return result
+
+    return {
+        "runs": len(runs),
+        "elapsed": stats(elapsed),
+        "phases": {
+            name: {"duration": stats(sample["duration"]), "bytes": stats(sample["bytes"])}
+            for name, sample in samples.items()
+        },
+    }
@@ -0,0 +1,233 @@
+import os
+import ipaddress
+from utils import atomic_write
+
+# 可以转换为rule-provider的规则类型及其behavior
+DOMAIN_RULE_TYPES = ('DOMAIN', 'DOMAIN-SUFFIX')
+IPCIDR_RULE_TYPES = ('IP-CIDR', 'IP-CIDR6')
+
+# 生成的rule-provider名称前缀，用于识别和替换上一次生成的provider
+PROVIDER_PREFIX = "compiled-"
+
+# 连续同一策略的规则达到该数量时才转换为rule-provider
+DEFAULT_THRESHOLD = 100
+
+def _split_rule(rule):
+    """拆分规则字符串：返回(类型, 值, 策略, 附加参数)，无法识别的规则返回None"""
+    parts = [part.strip() for part in rule.split(',')]
+    rule_type = parts[0].upper()
+    if rule_type not in DOMAIN_RULE_TYPES + IPCIDR_RULE_TYPES or len(parts) < 3:
+        return None
+    return rule_type, parts[1], parts[2], tuple(part.lower() for part in parts[3:])
+
+def normalize_rule(rule):
+    """规则的规范形式：去掉多余空白，类型统一大写，用于识别完全重复的规则"""
+    if not isinstance(rule, str):
+        return rule
+    parts = [part.strip() for part in rule.split(',')]
+    parts[0] = parts[0].upper()
+    return ','.join(parts)
+
+class _Coverage:
+    """记录已出现的域名和IP规则，判断后续规则是否已被前面的规则完全覆盖"""
+
+    def __init__(self):
+        self.domains = set()
+        self.suffixes = set()
+        # 按前缀长度索引的网段，分为会解析域名的和no-resolve的
+        self.networks = {}
+        self.no_resolve_networks = {}
+
+    def _suffix_covered(self, domain):
+        """域名本身或任意上级域名已有DOMAIN-SUFFIX规则"""
+        labels = domain.split('.')
+        return any('.'.join(labels[i:]) in self.suffixes for i in range(len(labels)))
+
+    def _network_covered(self, network, index):
+        """网段被某个已记录的网段包含"""
+        for (version, prefixlen), networks in index.items():
+            if version != network.version or prefixlen > network.prefixlen:
+                continue
+            if network.supernet(new_prefix=prefixlen) in networks:
+                return True
+        return False
+
+    def covered(self, parsed):
+        """规则是否永远不会被匹配到（前面已有规则匹配了它能匹配的全部请求）"""
+        rule_type, value, _, extras = parsed
+        if rule_type == 'DOMAIN':
+            domain = value.lower()
+            return not extras and (domain in self.domains or self._suffix_covered(domain))
+        if rule_type == 'DOMAIN-SUFFIX':
+            return not extras and self._suffix_covered(value.lower())
+        network = _parse_network(value)
+        if network is None or extras not in ((), ('no-resolve',)):
+            return False
+        if self._network_covered(network, self.networks):
+            return True
+        # 前面的no-resolve规则不会触发域名解析，只能覆盖同样是no-resolve的规则
+        return bool(extras) and self._network_covered(network, self.no_resolve_networks)
+
+    def add(self, parsed):
+        """记录规则能匹配的范围"""
+        rule_type, value, _, extras = parsed
+        if rule_type == 'DOMAIN' and not extras:
+            self.domains.add(value.lower())
+        elif rule_type == 'DOMAIN-SUFFIX' and not extras:
+            self.suffixes.add(value.lower())
+        elif rule_type in IPCIDR_RULE_TYPES and extras in ((), ('no-resolve',)):
+            network = _parse_network(value)
+            if network is not None:
+                index = self.no_resolve_networks if extras else self.networks
+                index.setdefault((network.version, network.prefixlen), set()).add(network)
+
+def _parse_network(value):
+    """解析CIDR，无效时返回None"""
+    try:
+        return ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        return None
+
+def dedupe_rules(rules):
+    """去掉完全重复的规则以及被前面规则覆盖而永远不会匹配的规则，保持其余规则的顺序"""
+    seen = set()
+    coverage = _Coverage()
+    result = []
+    duplicates = 0
+    subsumed = 0
+    for rule in rules or []:
+        key = normalize_rule(rule)
+        if isinstance(key, str):
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            parsed = _split_rule(key)
+            if parsed is not None:
+                if coverage.covered(parsed):
+                    subsumed += 1
+                    continue
+                coverage.add(parsed)
+        result.append(rule)
+    return result, duplicates, subsumed
+
+def _behavior(parsed):
+    """规则可以放入的rule-provider behavior，以及no-resolve等附加参数"""
+    if parsed is None:
+        return None
+    rule_type, value, _, extras = parsed
+    if rule_type in DOMAIN_RULE_TYPES and not extras:
+        return 'domain', ()
+    if rule_type in IPCIDR_RULE_TYPES and extras in ((), ('no-resolve',)) and _parse_network(value) is not None:
+        return 'ipcidr', extras
+    return None
+
+def _provider_entry(parsed):
+    """规则在text格式rule-provider文件中的一行"""
+    rule_type, value, _, _ = parsed
+    if rule_type == 'DOMAIN-SUFFIX':
+        return f"+.{value}"
+    return value
+
+def compile_rules(rules, provider_dir, threshold=DEFAULT_THRESHOLD):
+    """编译规则列表：去重后把连续的同策略同类型规则转换为rule-provider文件
+
+    返回 (新的规则列表, rule-providers配置, {文件路径: 文件内容}, 统计信息)。
+    只合并相邻的规则，规则的匹配顺序和结果保持不变。
+    """
+    rules = list(rules or [])
+    deduped, duplicates, subsumed = dedupe_rules(rules)
+
+    compiled = []
+    providers = {}
+    files = {}
+
+    def flush(run):
+        """把一段连续规则写成provider，数量不足阈值时原样保留"""
+        if len(run) < max(threshold, 1):
+            compiled.extend(rule for rule, _ in run)
+            return
+        behavior, extras = _behavior(run[0][1])
+        target = run[0][1][2]
+        name = f"{PROVIDER_PREFIX}{len(providers) + 1}"
+        path = os.path.join(provider_dir, f"{name}.txt")
+        providers[name] = {
+            "type": "file",
+            "behavior": behavior,
+            "format": "text",
+            "path": path,
+        }
+        files[path] = "".join(f"{_provider_entry(parsed)}\n" for _, parsed in run)
+        compiled.append(",".join(("RULE-SET", name, target) + extras))
+
+    run = []
+    run_key = None
+    for rule in deduped:
+        parsed = _split_rule(normalize_rule(rule)) if isinstance(rule, str) else None
+        behavior = _behavior(parsed)
+        key = (behavior, parsed[2]) if behavior else None
+        if run and key != run_key:
+            flush(run)
+            run = []
+        if key is None:
+            compiled.append(rule)
+            run_key = None
+            continue
+        run.append((rule, parsed))
+        run_key = key
+    if run:
+        flush(run)
+
+    stats = {
+        "rules_before": len(rules),
+        "rules_after": len(compiled),
+        "duplicates": duplicates,
+        "subsumed": subsumed,
+        "providers": len(providers),
+        "provider_rules": sum(content.count("\n") for content in files.values()),
+        "bytes_before": _rules_size(rules),
+        "bytes_after": _rules_size(compiled),
+        "provider_bytes": sum(len(content.encode('utf-8')) for content in files.values()),
+    }
+    return compiled, providers, files, stats
+
+def _rules_size(rules):
+    """规则列表写入YAML后的大致字节数（每条规则一行"  - <规则>"）"""
+    return sum(len(str(rule).encode('utf-8')) + 5 for rule in rules)
+
+def apply_rule_providers(config, providers):
+    """替换配置中上一次生成的rule-providers，保留用户自己配置的provider"""
+    existing = config.get('rule-providers') or {}
+    merged = {name: value for name, value in existing.items() if not str(name).startswith(PROVIDER_PREFIX)}
+    merged.update(providers)
+    config = dict(config)
+    if merged:
+        config['rule-providers'] = merged
+    else:
+        config.pop('rule-providers', None)
+    return config
+
+def sync_provider_files(provider_dir, files, dry_run=False):
+    """写入内容有变化的provider文件并删除不再使用的生成文件，返回是否有文件变化
+
+    dry_run为True时只检查是否有变化，不写入也不删除
+    """
+    changed = False
+    for path, content in files.items():
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                if f.read() == content:
+                    continue
+        if dry_run:
+            return True
+        atomic_write(path, lambda file, content=content: file.write(content), suffix=".txt")
+        changed = True
+    if os.path.isdir(provider_dir):
+        for filename in os.listdir(provider_dir):
+            path = os.path.join(provider_dir, filename)
+            if filename.startswith(PROVIDER_PREFIX) and filename.endswith(".txt") and path not in files:
+                if dry_run:
+                    return True
+                os.remove(path)
+                changed = True
+    return changed
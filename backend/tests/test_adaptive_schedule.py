@@ -0,0 +1,70 @@
+import unittest
+import os
+import sys
+import shutil
+
+# 添加父目录到系统路径，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入被测试的模块
+from adaptive_schedule import AdaptiveSchedule, jitter_seconds, jittered_interval
+
+TEST_WORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testdata', 'schedule_work')
+STATE_PATH = os.path.join(TEST_WORK_DIR, 'schedule_state.json')
+
+HOUR = 3600
+DAY = 86400
+
+
+class TestAdaptiveSchedule(unittest.TestCase):
+    """测试自适应检查间隔"""
+
+    def tearDown(self):
+        shutil.rmtree(TEST_WORK_DIR, ignore_errors=True)
+
+    def test_backoff_and_tighten(self):
+        """无变化时按倍数退避直到最大值，有变化时回到最小值，失败时保持不变"""
+        schedule = AdaptiveSchedule(STATE_PATH, backoff=2)
+        bounds = (HOUR, 900, 4 * HOUR)
+        self.assertEqual(schedule.interval('mihomo', *bounds), HOUR)
+        self.assertEqual(schedule.observe('mihomo', False, *bounds, now=0), 2 * HOUR)
+        self.assertEqual(schedule.observe('mihomo', False, *bounds, now=1), 4 * HOUR)
+        self.assertEqual(schedule.observe('mihomo', False, *bounds, now=2), 4 * HOUR)
+        self.assertEqual(schedule.observe('mihomo', None, *bounds, now=3), 4 * HOUR)
+        self.assertEqual(schedule.observe('mihomo', True, *bounds, now=4), 900)
+
+        state = schedule.snapshot()['mihomo']
+        self.assertEqual(state['failures'], 1)
+        self.assertEqual(state['changes'], 1)
+
+    def test_learns_change_gap_and_persists(self):
+        """学习两次变化的间隔，退避不超过其一半，状态在重启后保留"""
+        schedule = AdaptiveSchedule(STATE_PATH, backoff=10)
+        bounds = (HOUR, HOUR, 7 * DAY)
+        schedule.observe('geo', True, *bounds, now=0)
+        schedule.observe('geo', True, *bounds, now=DAY)
+        self.assertEqual(schedule.snapshot()['geo']['mean_change_gap'], DAY)
+        self.assertEqual(schedule.observe('geo', False, *bounds, now=DAY + HOUR), 10 * HOUR)
+        self.assertEqual(schedule.observe('geo', False, *bounds, now=DAY + 11 * HOUR), DAY // 2)
+
+        restarted = AdaptiveSchedule(STATE_PATH)
+        self.assertEqual(restarted.interval('geo', *bounds), DAY // 2)
+        # 配置的范围变化后，保存的间隔也限制在新的范围内
+        self.assertEqual(restarted.interval('geo', HOUR, HOUR, 6 * HOUR), 6 * HOUR)
+
+    def test_jitter(self):
+        """抖动幅度按间隔比例计算，0表示不抖动"""
+        self.assertEqual(jitter_seconds(3600, 0.1), 360)
+        self.assertIsNone(jitter_seconds(3600, 0))
+        self.assertIsNone(jitter_seconds(3600, None))
+        # 幅度不超过间隔的一半
+        self.assertEqual(jitter_seconds(3600, 2), 1800)
+
+    def test_jittered_interval_is_symmetric(self):
+        """触发器的间隔缩短一个幅度、抖动为两倍幅度，触发时间在±幅度内对称分布"""
+        self.assertEqual(jittered_interval(3600, 0.1), (3240, 720))
+        self.assertEqual(jittered_interval(3600, 0), (3600, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
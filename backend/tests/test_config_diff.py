@@ -0,0 +1,71 @@
+import unittest
+import os
+import sys
+
+# 添加父目录到系统路径，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入被测试的模块
+from config_diff import diff_configs, diff_rules, summarize_changeset
+
+
+class TestConfigDiff(unittest.TestCase):
+    """测试配置结构化比较"""
+
+    def setUp(self):
+        """准备基础配置"""
+        self.config = {
+            "port": 7890,
+            "proxies": [
+                {"name": "HK", "type": "ss", "server": "hk.example.com", "port": 443},
+                {"name": "JP", "type": "ss", "server": "jp.example.com", "port": 443},
+            ],
+            "proxy-groups": [
+                {"name": "PROXY", "type": "select", "proxies": ["HK", "JP"]},
+                {"name": "AUTO", "type": "url-test", "proxies": ["HK", "JP"]},
+            ],
+            "rules": ["DOMAIN-SUFFIX,google.com,PROXY", "GEOIP,CN,DIRECT", "MATCH,PROXY"],
+        }
+
+    def test_reorder_is_not_a_change(self):
+        """节点和代理组仅调整顺序、字段顺序不同时没有变化"""
+        reordered = dict(self.config)
+        reordered["proxies"] = [
+            {"port": 443, "server": "jp.example.com", "type": "ss", "name": "JP"},
+            self.config["proxies"][0],
+        ]
+        reordered["proxy-groups"] = list(reversed(self.config["proxy-groups"]))
+        changeset = diff_configs(self.config, reordered)
+        self.assertFalse(changeset["changed"])
+        self.assertEqual(summarize_changeset(changeset), "配置无变化")
+
+    def test_added_removed_modified(self):
+        """新增、删除和修改分别计数"""
+        new = dict(self.config)
+        new["proxies"] = [
+            {"name": "HK", "type": "ss", "server": "hk2.example.com", "port": 443},
+            {"name": "US", "type": "ss", "server": "us.example.com", "port": 443},
+        ]
+        changeset = diff_configs(self.config, new)
+        self.assertTrue(changeset["changed"])
+        proxies = changeset["proxies"]
+        self.assertEqual((proxies["added"], proxies["removed"], proxies["modified"]), (1, 1, 1))
+        self.assertEqual(proxies["items"]["modified"], ["HK"])
+        self.assertEqual(changeset["rules"]["added"], 0)
+
+    def test_rules_are_ordered(self):
+        """规则按顺序比较，调换顺序属于变化"""
+        rules = self.config["rules"]
+        swapped = [rules[1], rules[0], rules[2]]
+        change = diff_rules(rules, swapped)
+        self.assertEqual(change["added"], change["removed"])
+        self.assertGreater(change["added"], 0)
+
+        inserted = rules[:2] + ["DOMAIN,example.com,DIRECT"] + rules[2:]
+        change = diff_rules(rules, inserted)
+        self.assertEqual((change["added"], change["removed"]), (1, 0))
+        self.assertEqual(change["items"]["added"], ["DOMAIN,example.com,DIRECT"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import os
+import sys
+import time
+import shutil
+from unittest.mock import patch
+
+# 添加父目录到系统路径，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入被测试的模块
+import config_service
+from config_service import ConfigService, get_service, default_config_path
+
+TEST_WORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testdata', 'config_work')
+CONFIG_PATH = os.path.join(TEST_WORK_DIR, 'config.yaml')
+
+
+class TestConfigService(unittest.TestCase):
+    """测试配置缓存和变化通知"""
+
+    def setUp(self):
+        os.makedirs(TEST_WORK_DIR, exist_ok=True)
+        self.write("fetch_interval: 3600\nweb_port: 5000\n")
+        self.service = ConfigService(CONFIG_PATH)
+        self.events = []
+        self.service.subscribe(lambda old, new, changed: self.events.append(changed))
+
+    def tearDown(self):
+        self.service.stop_watching()
+        shutil.rmtree(TEST_WORK_DIR, ignore_errors=True)
+
+    def write(self, content):
+        """直接修改配置文件，并把修改时间往后调，避免与上一次写入的时间相同"""
+        with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
+            f.write(content)
+        stat = os.stat(CONFIG_PATH)
+        os.utime(CONFIG_PATH, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def test_unchanged_file_is_not_reparsed(self):
+        """文件未变化时只stat不解析，返回的副本可以随意修改"""
+        config = self.service.get()
+        config['fetch_interval'] = 1
+        with patch('config_service.yaml_load') as mock_load:
+            self.assertEqual(self.service.get()['fetch_interval'], 3600)
+            mock_load.assert_not_called()
+        self.assertEqual(self.service.reloads, 1)
+
+    def test_edit_on_disk_publishes_changes(self):
+        """直接编辑文件后重新解析，并通知变化的配置项"""
+        self.service.get()
+        self.write("fetch_interval: 600\nweb_port: 5000\n")
+        self.assertEqual(self.service.get()['fetch_interval'], 600)
+        self.assertEqual(self.events, [{'fetch_interval'}])
+
+        # 解析失败时继续使用上一次的配置
+        self.write("fetch_interval: [\n")
+        self.assertEqual(self.service.get()['fetch_interval'], 600)
+
+    def test_save_updates_cache_and_publishes(self):
+        """保存配置后缓存立即更新，不需要重新解析"""
+        config = self.service.get()
+        config['schedule_mode'] = 'adaptive'
+        self.assertTrue(self.service.save(config))
+        self.assertEqual(self.events, [{'schedule_mode'}])
+        with patch('config_service.yaml_load') as mock_load:
+            self.assertEqual(self.service.get()['schedule_mode'], 'adaptive')
+            mock_load.assert_not_called()
+
+    def test_watcher_detects_edits(self):
+        """后台监视线程在没有读取时也能发现文件变化"""
+        self.service.get()
+        self.service.start_watching(0.01)
+        self.write("fetch_interval: 60\nweb_port: 5000\n")
+        deadline = time.time() + 5
+        while not self.events and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.events, [{'fetch_interval'}])
+
+    def test_shared_service_uses_config_dir(self):
+        """未指定路径时使用CONFIG_DIR下的config.yaml，同一路径共用一个实例"""
+        with patch.dict(os.environ, {'CONFIG_DIR': TEST_WORK_DIR}):
+            self.assertEqual(default_config_path(), CONFIG_PATH)
+            self.assertIs(get_service(), get_service(CONFIG_PATH))
+            self.assertEqual(config_service.load_config()['web_port'], 5000)
+
+
+if __name__ == '__main__':
+    unittest.main()
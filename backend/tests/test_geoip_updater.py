@@ -0,0 +1,338 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import time
+import shutil
+import threading
+import hashlib
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加父目录到系统路径，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入被测试的模块
+from geoip_updater import GeoIPUpdater, GEO_FILES, run_geo_updater, get_download_progress
+from utils import load_config
+
+# 获取实际配置文件路径
+REAL_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+# 测试文件夹路径
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testdata')
+TEST_GEO_DIR = os.path.join(TEST_DIR, 'geo')
+
+
+class GeoFileHandler(BaseHTTPRequestHandler):
+    """模拟GEO文件下载服务器，支持ETag条件请求和Range续传"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.command, self.path, dict(self.headers)))
+        time.sleep(server.delays.get(self.path, 0))
+        body = server.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        # 模拟服务器暂时出错，按次数返回指定的状态码
+        errors = getattr(server, 'errors', {}).get(self.path)
+        if errors:
+            self.send_error(errors.pop(0))
+            return
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        # If-Range与当前ETag一致时才按Range返回片段
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range') in (None, etag):
+            start = int(range_header.split('=')[1].split('-')[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+
+        # 模拟连接中断：只发送部分内容后关闭连接
+        if server.truncate_next:
+            self.wfile.write(body[start:start + server.truncate_next])
+            server.truncate_next = 0
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:])
+
+    def do_HEAD(self):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        self.send_error(405)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGeoIPUpdater(unittest.TestCase):
+    """测试 GeoIPUpdater 类"""
+
+    def setUp(self):
+        """每个测试前的设置"""
+        os.makedirs(TEST_GEO_DIR, exist_ok=True)
+        self.real_config = load_config(REAL_CONFIG_PATH)
+        self.assertIsNotNone(self.real_config, "无法加载配置文件")
+
+        # 使用测试目录保存GEO文件
+        self.test_config = self.real_config.copy()
+        for _, _, path_key, default_path in GEO_FILES:
+            self.test_config[path_key] = os.path.join(TEST_GEO_DIR, os.path.basename(default_path))
+
+    def tearDown(self):
+        """每个测试结束后清理"""
+        shutil.rmtree(TEST_GEO_DIR, ignore_errors=True)
+
+    def create_updater(self, **overrides):
+        """使用测试配置创建更新器"""
+        config = dict(self.test_config, **overrides)
+        with patch('geoip_updater.load_config', return_value=config):
+            return GeoIPUpdater(REAL_CONFIG_PATH)
+
+    def test_update_all_geo_files_parallel(self):
+        """并发模式下三个文件同时下载，并记录每个文件的结果和总耗时"""
+        updater = self.create_updater(geo_download_workers=3)
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def fake_download(url, save_path):
+            with lock:
+                active.append(save_path)
+                peak.append(len(active))
+            time.sleep(0.2)
+            with lock:
+                active.remove(save_path)
+            return not save_path.endswith('.mmdb')
+
+        with patch.object(updater, 'download_file', side_effect=fake_download):
+            result = updater.update_all_geo_files()
+
+        self.assertFalse(result)
+        self.assertEqual(max(peak), 3)
+        self.assertEqual(set(updater.last_results), {name for name, _, _, _ in GEO_FILES})
+        self.assertTrue(updater.last_results['GeoIP']['success'])
+        self.assertFalse(updater.last_results['MMDB']['success'])
+        # 总耗时应接近单个文件的耗时，而不是三者之和
+        self.assertLess(updater.last_elapsed, 0.5)
+        self.assertIn("总耗时", updater.summary())
+        updater.close()
+
+    def test_update_all_geo_files_sequential(self):
+        """并发数为1时逐个下载"""
+        updater = self.create_updater(geo_download_workers=1)
+        with patch.object(updater, 'download_file', return_value=True) as mock_download:
+            self.assertTrue(updater.update_all_geo_files())
+        self.assertEqual(mock_download.call_count, len(GEO_FILES))
+        updater.close()
+
+    def test_run_geo_updater_details(self):
+        """run_geo_updater 将结果写入 details"""
+        with patch('geoip_updater.load_config', return_value=self.test_config), \
+            patch.object(GeoIPUpdater, 'download_file', return_value=True):
+            details = {}
+            self.assertTrue(run_geo_updater(details))
+        self.assertEqual(len(details['files']), len(GEO_FILES))
+        self.assertIn('elapsed', details)
+        self.assertEqual(details['run']['kind'], 'geo')
+
+
+class TestGeoDownload(unittest.TestCase):
+    """使用本地HTTP服务器测试GEO文件下载"""
+
+    def setUp(self):
+        """启动本地HTTP服务器"""
+        os.makedirs(TEST_GEO_DIR, exist_ok=True)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), GeoFileHandler)
+        self.server.files = {'/geoip.dat': b'geoip-v1' * 1024}
+        self.server.requests = []
+        self.server.truncate_next = 0
+        self.server.delays = {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/geoip.dat"
+        self.save_path = os.path.join(TEST_GEO_DIR, 'geoip.dat')
+
+        config = load_config(REAL_CONFIG_PATH).copy()
+        config['geoip_path'] = self.save_path
+        config['geo_retry_backoff'] = 0.01
+        config['geo_download_chunk_size'] = 8192
+        with patch('geoip_updater.load_config', return_value=config):
+            self.updater = GeoIPUpdater(REAL_CONFIG_PATH)
+
+    def tearDown(self):
+        """关闭服务器并清理文件"""
+        self.updater.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(TEST_GEO_DIR, ignore_errors=True)
+
+    def test_conditional_get_without_head(self):
+        """第二次下载直接发送条件GET，文件未变化时返回304"""
+        self.assertTrue(self.updater.download_file(self.url, self.save_path))
+        self.assertTrue(self.updater.download_file(self.url, self.save_path))
+
+        methods = [method for method, _, _ in self.server.requests]
+        self.assertEqual(methods, ['GET', 'GET'])
+        self.assertNotIn('If-None-Match', self.server.requests[0][2])
+        self.assertIn('If-None-Match', self.server.requests[1][2])
+
+        with open(self.save_path, 'rb') as f:
+            self.assertEqual(f.read(), self.server.files['/geoip.dat'])
+
+    def test_stale_local_file_triggers_full_download(self):
+        """本地文件被改动后不再发送条件请求，而是重新下载"""
+        self.assertTrue(self.updater.download_file(self.url, self.save_path))
+        with open(self.save_path, 'wb') as f:
+            f.write(b'corrupted')
+
+        self.assertTrue(self.updater.download_file(self.url, self.save_path))
+        self.assertNotIn('If-None-Match', self.server.requests[1][2])
+        with open(self.save_path, 'rb') as f:
+            self.assertEqual(f.read(), self.server.files['/geoip.dat'])
+
+    def test_atomic_install_skips_identical_content(self):
+        """内容未变化时不替换已安装文件，内容变化时原子替换且不留临时文件"""
+        self.assertTrue(self.updater.download_file(self.url, self.save_path))
+        self.assertEqual(self.updater.file_status[self.save_path], 'installed')
+        inode = os.stat(self.save_path).st_ino
+
+        # 服务器ETag变化但内容相同：下载后比较哈希，跳过替换
+        self.updater.validators.set(self.url, dict(self.updater.validators.get(self.url), etag='"old"'))
+        self.assertTrue(self.updater.download_file(self.url, self.save_path))
+        self.assertEqual(self.updater.file_status[self.save_path], 'unchanged')
+        self.assertEqual(os.stat(self.save_path).st_ino, inode)
+
+        # 内容变化：替换为新文件
+        self.server.files['/geoip.dat'] = b'geoip-v2' * 1024
+        self.assertTrue(self.updater.download_file(self.url, self.save_path))
+        self.assertEqual(self.updater.file_status[self.save_path], 'installed')
+        with open(self.save_path, 'rb') as f:
+            self.assertEqual(f.read(), self.server.files['/geoip.dat'])
+        self.assertEqual([name for name in os.listdir(TEST_GEO_DIR) if name.endswith('.tmp')], [])
+
+    def test_resume_after_interrupted_download(self):
+        """连接中断后在同一次任务内重试，并用Range从断点续传"""
+        body = os.urandom(256 * 1024)
+        self.server.files['/geoip.dat'] = body
+        self.server.truncate_next = 100 * 1024
+
+        self.assertTrue(self.updater.download_file(self.url, self.save_path))
+        with open(self.save_path, 'rb') as f:
+            self.assertEqual(f.read(), body)
+
+        self.assertEqual(len(self.server.requests), 2)
+        retry_headers = self.server.requests[1][2]
+        self.assertTrue(retry_headers['Range'].startswith('bytes='))
+        self.assertGreater(int(retry_headers['Range'][6:-1]), 0)
+        self.assertIn('If-Range', retry_headers)
+
+        progress = {item['path']: item for item in get_download_progress()}[self.save_path]
+        self.assertEqual(progress['downloaded'], len(body))
+        self.assertEqual(progress['total'], len(body))
+        self.assertGreater(progress['resumed_from'], 0)
+        self.assertFalse(os.path.exists(os.path.join(TEST_GEO_DIR, '.geoip.dat.part')))
+
+        # 运行记录中包含两次下载的字节数和重试等待
+        phases = self.updater.run_record.to_dict()['phases']
+        self.assertEqual(phases['download']['bytes'], len(body))
+        self.assertEqual(phases['download']['count'], 2)
+        self.assertEqual(phases['retry_wait']['count'], 1)
+        self.assertEqual(phases['install']['bytes'], len(body))
+
+    def test_changed_remote_restarts_partial_download(self):
+        """远程文件变化后If-Range不匹配，服务器返回完整内容重新下载"""
+        self.server.files['/geoip.dat'] = os.urandom(64 * 1024)
+        self.server.truncate_next = 1024
+        self.updater.retries = 0
+        self.assertFalse(self.updater.download_file(self.url, self.save_path))
+        self.assertTrue(os.path.exists(os.path.join(TEST_GEO_DIR, '.geoip.dat.part')))
+
+        new_body = os.urandom(64 * 1024)
+        self.server.files['/geoip.dat'] = new_body
+        self.assertTrue(self.updater.download_file(self.url, self.save_path))
+        with open(self.save_path, 'rb') as f:
+            self.assertEqual(f.read(), new_body)
+
+    def test_only_transient_errors_are_retried(self):
+        """5xx和429按退避重试；404、地址无效和本地写入失败立即放弃"""
+        self.updater.retries = 2
+        self.server.errors = {'/geoip.dat': [503, 429]}
+        self.assertTrue(self.updater.download_file(self.url, self.save_path))
+        self.assertEqual(len(self.server.requests), 3)
+
+        self.server.requests.clear()
+        self.assertFalse(self.updater.download_file(self.mirror_url('/missing.dat'), self.save_path))
+        self.assertEqual(len(self.server.requests), 1)
+
+        with patch('geoip_updater.time.sleep') as mock_sleep:
+            self.assertFalse(self.updater.download_file('not a url', self.save_path))
+            self.assertFalse(self.updater.download_file('', self.save_path))
+            self.server.files['/geoip.dat'] = b'geoip-v2' * 1024
+            with patch.object(self.updater, '_stream_to_partial', side_effect=PermissionError("只读文件系统")):
+                self.assertFalse(self.updater.download_file(self.url, self.save_path))
+            # 测试服务器处理请求时会调用sleep(0)，这里只检查没有退避等待
+            self.assertFalse([call for call in mock_sleep.call_args_list if call[0][0] > 0])
+
+    def mirror_url(self, path):
+        """本地服务器上的镜像地址"""
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def test_mirror_race_prefers_fastest(self):
+        """竞速时选择最先响应的镜像，并记录每个镜像的延迟"""
+        body = self.server.files['/geoip.dat']
+        self.server.files['/slow/geoip.dat'] = body
+        self.server.delays['/slow/geoip.dat'] = 0.3
+        slow, fast = self.mirror_url('/slow/geoip.dat'), self.mirror_url('/geoip.dat')
+
+        self.assertEqual(self.updater.download_from_mirrors([slow, fast], self.save_path), fast)
+        time.sleep(0.5)
+        self.assertGreater(self.updater.mirrors.entries[slow]['latency'],
+                           self.updater.mirrors.entries[fast]['latency'])
+
+        # 统计信息跨实例保留，慢镜像排在后面
+        self.assertEqual(self.updater.mirrors.rank([slow, fast]), [fast, slow])
+
+    def test_failing_mirror_is_demoted(self):
+        """失败的镜像被跳过，连续失败后被降级到最后"""
+        broken, good = self.mirror_url('/missing/geoip.dat'), self.mirror_url('/geoip.dat')
+        self.updater.mirror_race = False
+        self.assertEqual(self.updater.download_from_mirrors([broken, good], self.save_path), good)
+        self.assertEqual(self.updater.mirrors.rank([broken, good]), [good, broken])
+
+        for _ in range(2):
+            self.updater.mirrors.record_failure(broken)
+        self.assertTrue(self.updater.mirrors.is_demoted(broken))
+
+    def test_probe_success_does_not_reset_failures(self):
+        """探测能响应但下载总是失败的镜像，仍会因连续失败被降级"""
+        flaky = self.mirror_url('/flaky/geoip.dat')
+        for _ in range(self.updater.mirrors.max_failures):
+            self.updater.mirrors.record_failure(flaky)
+            probe = Future()
+            probe.set_result(0.01)
+            self.updater._record_probe(flaky, probe)
+        self.assertTrue(self.updater.mirrors.is_demoted(flaky))
+        self.assertAlmostEqual(self.updater.mirrors.entries[flaky]['latency'], 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import time
+
+# 添加父目录到系统路径，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入被测试的模块
+from history_store import HistoryStore
+
+TEST_WORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testdata', 'history_work')
+
+
+class TestHistoryStore(unittest.TestCase):
+    """测试SQLite任务历史存储"""
+
+    def setUp(self):
+        """准备工作目录"""
+        os.makedirs(TEST_WORK_DIR, exist_ok=True)
+        self.db_path = os.path.join(TEST_WORK_DIR, 'task_history.db')
+
+    def tearDown(self):
+        """清理工作目录"""
+        shutil.rmtree(TEST_WORK_DIR, ignore_errors=True)
+
+    def test_query_pagination_and_filters(self):
+        """按从新到旧分页，支持按任务名称和成功状态筛选"""
+        store = HistoryStore(self.db_path)
+        for i in range(12):
+            task = "Mihomo配置更新" if i % 2 == 0 else "GeoIP数据更新"
+            store.add(task, i % 3 != 0, f"第{i}次", {"index": i})
+
+        items, total = store.query(page=1, page_size=5)
+        self.assertEqual(total, 12)
+        self.assertEqual([item["details"]["index"] for item in items], [11, 10, 9, 8, 7])
+        items, _ = store.query(page=3, page_size=5)
+        self.assertEqual(len(items), 2)
+
+        items, total = store.query(task="Mihomo", success=False)
+        self.assertEqual(total, 2)
+        self.assertTrue(all(item["task"] == "Mihomo配置更新" and not item["success"] for item in items))
+
+    def test_retention_and_version(self):
+        """超过保留条数和天数的记录被删除，版本标识随新增和清理变化"""
+        store = HistoryStore(self.db_path, retention=3, retention_days=7)
+        store.add("旧任务", True, created=time.time() - 30 * 86400)
+        self.assertEqual(store.query()[1], 0)
+        versions = set()
+        for i in range(5):
+            store.add("任务", True, str(i))
+            versions.add(store.version())
+        items, total = store.query()
+        self.assertEqual(total, 3)
+        self.assertEqual([item["message"] for item in items], ["4", "3", "2"])
+        self.assertEqual(len(versions), 5)
+
+    def test_migrate_legacy_json(self):
+        """首次启动时导入旧版task_history.json并重命名原文件"""
+        legacy_path = os.path.join(TEST_WORK_DIR, 'task_history.json')
+        legacy = [
+            {"timestamp": "2024-01-01 00:00:00", "task": "Mihomo配置更新", "success": True, "message": "成功",
+             "details": {"status": "updated", "changeset": {"changed": True}}},
+            {"timestamp": "2024-01-01 01:00:00", "task": "GeoIP数据更新", "success": False, "message": "失败"},
+        ]
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            json.dump(legacy, f, ensure_ascii=False)
+
+        store = HistoryStore(self.db_path, legacy_json_path=legacy_path)
+        self.assertFalse(os.path.exists(legacy_path))
+        self.assertTrue(os.path.exists(legacy_path + ".migrated"))
+        items, total = store.query()
+        self.assertEqual(total, 2)
+        self.assertEqual(items[0]["task"], "GeoIP数据更新")
+        self.assertEqual(store.latest_with_detail("changeset")["timestamp"], "2024-01-01 00:00:00")
+
+        # 再次打开时不会重复导入
+        self.assertEqual(HistoryStore(self.db_path, legacy_json_path=legacy_path).query()[1], 2)
+
+    def test_detail_queries_use_indexes(self):
+        """按details键和任务名称前缀查询时使用索引，不扫描整个details列"""
+        store = HistoryStore(self.db_path)
+        store.add("Mihomo配置更新", True, details={"run": {"total": 1.0}, "changeset": {"changed": True}})
+        store.add("GeoIP数据更新", True, details={"run": {"total": 2.0}})
+        store.add("恢复配置备份", True, details={"run": None, "backup": {"id": 1}})
+
+        self.assertEqual([item["task"] for item in store.recent_with_detail("run")], ["GeoIP数据更新", "Mihomo配置更新"])
+        self.assertEqual([item["task"] for item in store.recent_with_detail("run", task="Mihomo")], ["Mihomo配置更新"])
+        self.assertEqual(store.latest_with_detail("changeset")["task"], "Mihomo配置更新")
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for sql, params in (
+                    ("SELECT * FROM task_history WHERE has_changeset = 1 ORDER BY id DESC LIMIT 1", []),
+                    ("SELECT * FROM task_history" + HistoryStore._where("Mihomo")[0], HistoryStore._where("Mihomo")[1])):
+                plan = " ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+                self.assertIn("USING INDEX", plan)
+        finally:
+            conn.close()
+
+    def test_upgrade_adds_detail_columns(self):
+        """旧版数据库打开时添加标记列，并根据已有记录的details回填"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""CREATE TABLE task_history (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL,
+                        created REAL NOT NULL, task TEXT NOT NULL, success INTEGER NOT NULL, message TEXT, details TEXT)""")
+        conn.execute("INSERT INTO task_history (timestamp, created, task, success, message, details) VALUES (?, ?, ?, ?, ?, ?)",
+                     ("2024-01-01 00:00:00", 0, "Mihomo配置更新", 1, "成功", json.dumps({"changeset": {"changed": True}})))
+        conn.execute("INSERT INTO task_history (timestamp, created, task, success, message, details) VALUES (?, ?, ?, ?, ?, ?)",
+                     ("2024-01-01 01:00:00", 0, "GeoIP数据更新", 1, "成功", json.dumps({"summary": '"changeset"'})))
+        conn.commit()
+        conn.close()
+
+        store = HistoryStore(self.db_path)
+        self.assertEqual(store.latest_with_detail("changeset")["task"], "Mihomo配置更新")
+        self.assertEqual(store.recent_with_detail("run"), [])
+        self.assertEqual(store.query()[1], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import os
+import sys
+import time
+import threading
+
+# 添加父目录到系统路径，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入被测试的模块
+from job_manager import JobManager, SingleFlight, JOB_SUCCEEDED, JOB_FAILED, JOB_RUNNING
+from metrics import RunRecord
+
+
+class TestJobManager(unittest.TestCase):
+    """测试后台任务执行器"""
+
+    def setUp(self):
+        self.manager = JobManager(max_workers=1, keep=2)
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+    def test_submit_returns_immediately_and_reports_phases(self):
+        """提交后立即返回任务，阶段变化和最终结果都能查询到"""
+        release = threading.Event()
+        phases = []
+
+        def work(job):
+            record = RunRecord('mihomo', listener=lambda name: job.update(phase=name))
+            with record.phase('fetch'):
+                phases.append(job.phase)
+                release.wait(5)
+            return True, "更新成功"
+
+        job = self.manager.submit('mihomo', work)
+        self.assertIs(self.manager.get(job.id), job)
+        version = job.wait_change(0, 5)
+        self.assertGreater(version, 0)
+        while job.phase is None:
+            job.wait_change(job.version, 5)
+        self.assertEqual(job.status, JOB_RUNNING)
+        release.set()
+        while not job.done:
+            job.wait_change(job.version, 5)
+
+        data = job.to_dict()
+        self.assertEqual(phases, ['fetch'])
+        self.assertEqual(data['status'], JOB_SUCCEEDED)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['message'], "更新成功")
+        self.assertIsNotNone(data['finished'])
+
+    def test_failed_job_and_pruning(self):
+        """任务抛出异常时标记为失败，只保留最近keep个已结束的任务"""
+        def fail(job):
+            raise RuntimeError("下载失败")
+
+        jobs = [self.manager.submit('geoip', fail) for _ in range(3)]
+        for job in jobs:
+            while not job.done:
+                job.wait_change(job.version, 5)
+        self.assertEqual(jobs[-1].status, JOB_FAILED)
+        self.assertEqual(jobs[-1].message, "下载失败")
+
+        self.manager.submit('geoip', lambda job: (True, None))
+        self.assertIsNone(self.manager.get(jobs[0].id))
+        self.assertIsNotNone(self.manager.get(jobs[-1].id))
+        self.assertIsNone(self.manager.get('missing'))
+
+
+class TestSingleFlight(unittest.TestCase):
+    """测试并发触发的合并"""
+
+    def test_concurrent_triggers_share_one_run(self):
+        """执行期间到达的触发不再重复执行，共享结果和阶段通知，并计入合并次数"""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def run(notify):
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            notify('write')
+            return True
+
+        results = {}
+        phases = []
+
+        def trigger(name, listener=None):
+            results[name] = flight.do('mihomo', run, listener)
+
+        leader = threading.Thread(target=trigger, args=('leader',))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=trigger, args=(f'f{i}', phases.append)) for i in range(2)]
+        for thread in followers:
+            thread.start()
+        while flight.stats()['mihomo']['coalesced'] < 2:
+            time.sleep(0.01)
+        self.assertTrue(flight.running('mihomo'))
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results['leader'], (True, False))
+        self.assertEqual(results['f0'], (True, True))
+        self.assertEqual(phases, ['write', 'write'])
+        self.assertEqual(flight.stats(), {'mihomo': {'runs': 1, 'coalesced': 2}})
+        self.assertFalse(flight.running('mihomo'))
+
+        # 执行结束后的触发重新执行
+        self.assertEqual(flight.do('mihomo', run), (True, False))
+        self.assertEqual(len(calls), 2)
+
+    def test_error_ends_flight(self):
+        """执行抛出的异常传给调用方，并结束本次执行"""
+        flight = SingleFlight()
+
+        def fail(notify):
+            raise RuntimeError("拉取失败")
+
+        with self.assertRaises(RuntimeError):
+            flight.do('geoip', fail)
+        self.assertFalse(flight.running('geoip'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import os
+import sys
+import threading
+
+# 添加父目录到系统路径，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入被测试的模块
+from metrics import RunRecord, percentile, summarize_runs
+
+
+class TestMetrics(unittest.TestCase):
+    """测试分阶段运行记录和分位数统计"""
+
+    def test_run_record_accumulates_phases(self):
+        """同一阶段多次执行（包括并发执行）时累加耗时、字节数和次数"""
+        record = RunRecord('geo')
+
+        def download(size):
+            with record.phase('download'):
+                record.add_bytes('download', size)
+
+        threads = [threading.Thread(target=download, args=(100,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with self.assertRaises(ValueError):
+            with record.phase('install'):
+                raise ValueError("安装失败")
+
+        result = record.finish()
+        self.assertEqual(result['kind'], 'geo')
+        self.assertEqual(result['phases']['download']['bytes'], 400)
+        self.assertEqual(result['phases']['download']['count'], 4)
+        self.assertEqual(result['phases']['install']['count'], 1)
+        self.assertGreaterEqual(result['elapsed'], 0)
+
+    def test_percentiles(self):
+        """最近秩法计算p50/p95，并按阶段汇总多次运行"""
+        self.assertEqual(percentile(range(1, 101), 50), 50)
+        self.assertEqual(percentile(range(1, 101), 95), 95)
+        self.assertEqual(percentile([3], 95), 3)
+        self.assertIsNone(percentile([], 50))
+
+        runs = [{"elapsed": i, "phases": {"fetch": {"duration": i / 10, "bytes": i * 100}}} for i in range(1, 21)]
+        runs.append({"elapsed": 1, "phases": {"parse": {"duration": 0.5, "bytes": 10}}})
+        summary = summarize_runs(runs)
+        self.assertEqual(summary['runs'], 21)
+        self.assertEqual(summary['phases']['fetch']['duration'], {"count": 20, "p50": 1.0, "p95": 1.9})
+        self.assertEqual(summary['phases']['fetch']['bytes']['p95'], 1900)
+        self.assertEqual(summary['phases']['parse']['duration']['count'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import os
+import sys
+import shutil
+
+# 添加父目录到系统路径，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入被测试的模块
+from rule_compiler import dedupe_rules, compile_rules, apply_rule_providers, sync_provider_files
+
+TEST_PROVIDER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testdata', 'rule_providers')
+
+
+class TestRuleCompiler(unittest.TestCase):
+    """测试规则编译"""
+
+    def tearDown(self):
+        """清理生成的provider文件"""
+        shutil.rmtree(TEST_PROVIDER_DIR, ignore_errors=True)
+
+    def test_dedupe_exact_and_subsumed(self):
+        """去掉完全重复和被前面规则覆盖的规则"""
+        rules = [
+            "DOMAIN-SUFFIX,google.com,PROXY",
+            "domain-suffix, google.com ,PROXY",
+            "DOMAIN,www.google.com,DIRECT",
+            "DOMAIN-SUFFIX,mail.google.com,PROXY",
+            "DOMAIN,example.com,DIRECT",
+            "DOMAIN-SUFFIX,example.com,PROXY",
+            "IP-CIDR,10.0.0.0/8,DIRECT,no-resolve",
+            "IP-CIDR,10.1.0.0/16,DIRECT,no-resolve",
+            "IP-CIDR,10.2.0.0/16,DIRECT",
+            "IP-CIDR6,2001:db8::/32,DIRECT",
+            "IP-CIDR6,2001:db8:1::/48,PROXY",
+            "GEOIP,CN,DIRECT",
+            "MATCH,PROXY",
+        ]
+        result, duplicates, subsumed = dedupe_rules(rules)
+        self.assertEqual(duplicates, 1)
+        self.assertEqual(subsumed, 4)
+        self.assertEqual(result, [
+            "DOMAIN-SUFFIX,google.com,PROXY",
+            "DOMAIN,example.com,DIRECT",
+            "DOMAIN-SUFFIX,example.com,PROXY",
+            "IP-CIDR,10.0.0.0/8,DIRECT,no-resolve",
+            # 前面的规则是no-resolve，会解析域名的规则仍然可能被匹配
+            "IP-CIDR,10.2.0.0/16,DIRECT",
+            "IP-CIDR6,2001:db8::/32,DIRECT",
+            "GEOIP,CN,DIRECT",
+            "MATCH,PROXY",
+        ])
+
+    def test_compile_large_runs_into_providers(self):
+        """连续同策略的规则达到阈值时转换为rule-provider，其余规则保持原位"""
+        rules = [f"DOMAIN-SUFFIX,site{i}.com,PROXY" for i in range(5)]
+        rules += ["DOMAIN,a.example.org,PROXY", "GEOIP,CN,DIRECT"]
+        rules += [f"IP-CIDR,192.168.{i}.0/24,DIRECT,no-resolve" for i in range(4)]
+        rules += ["DOMAIN,b.example.org,DIRECT", "MATCH,PROXY"]
+
+        compiled, providers, files, stats = compile_rules(rules, TEST_PROVIDER_DIR, threshold=4)
+        self.assertEqual(compiled, [
+            "RULE-SET,compiled-1,PROXY",
+            "GEOIP,CN,DIRECT",
+            "RULE-SET,compiled-2,DIRECT,no-resolve",
+            "DOMAIN,b.example.org,DIRECT",
+            "MATCH,PROXY",
+        ])
+        self.assertEqual(providers["compiled-1"]["behavior"], "domain")
+        self.assertEqual(providers["compiled-2"]["behavior"], "ipcidr")
+        domain_file = files[providers["compiled-1"]["path"]]
+        self.assertEqual(domain_file.splitlines()[0], "+.site0.com")
+        self.assertEqual(domain_file.splitlines()[-1], "a.example.org")
+        self.assertEqual(stats["rules_before"], 13)
+        self.assertEqual(stats["rules_after"], 5)
+        self.assertEqual(stats["provider_rules"], 10)
+        self.assertLess(stats["bytes_after"], stats["bytes_before"])
+
+    def test_apply_and_sync_providers(self):
+        """替换旧的生成provider并保留用户provider，只在内容变化时写入文件"""
+        config = {"rule-providers": {"user": {"type": "http"}, "compiled-9": {"type": "file"}}}
+        _, providers, files, _ = compile_rules(
+            [f"DOMAIN,h{i}.example.com,PROXY" for i in range(3)], TEST_PROVIDER_DIR, threshold=2)
+        new_config = apply_rule_providers(config, providers)
+        self.assertEqual(sorted(new_config["rule-providers"]), ["compiled-1", "user"])
+        self.assertIn("compiled-9", config["rule-providers"])
+
+        stale = os.path.join(TEST_PROVIDER_DIR, "compiled-9.txt")
+        os.makedirs(TEST_PROVIDER_DIR, exist_ok=True)
+        with open(stale, 'w') as f:
+            f.write("old\n")
+        # dry_run只报告变化，不写入也不删除
+        self.assertTrue(sync_provider_files(TEST_PROVIDER_DIR, files, dry_run=True))
+        self.assertTrue(os.path.exists(stale))
+        self.assertFalse(any(os.path.exists(path) for path in files))
+        self.assertTrue(sync_provider_files(TEST_PROVIDER_DIR, files))
+        self.assertFalse(os.path.exists(stale))
+        self.assertFalse(sync_provider_files(TEST_PROVIDER_DIR, files))
+
+
+if __name__ == '__main__':
+    unittest.main()
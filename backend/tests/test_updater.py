@@ -6,13 +6,18 @@ import yaml
 import pytest
 import requests
 import shutil
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # 添加父目录到系统路径，以便导入模块
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # 导入被测试的模块
-from updater import MihomoUpdater, run_updater
-from utils import load_config, parse_yaml, merge_configs
+from updater import MihomoUpdater, FetchCache, StreamDecoder, run_updater, ACCEPT_ENCODING, BROTLI_SLICE
+import utils
+from utils import load_config, parse_yaml, merge_configs, merge_subscriptions, BackupStore
 
 # 获取实际配置文件路径
 REAL_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
@@ -21,6 +26,79 @@ REAL_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
 TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testdata')
 TEST_MIHOMO_CONFIG_PATH = os.path.join(TEST_DIR, 'mihomo_config.yaml')
 TEST_BACKUP_DIR = os.path.join(TEST_DIR, 'backups')
+TEST_CACHE_DIR = os.path.join(TEST_DIR, 'cache')
+
+def make_response(content, status_code=200, headers=None):
+    """构造模拟的流式HTTP响应"""
+    body = content.encode('utf-8') if isinstance(content, str) else content
+    response = MagicMock(status_code=status_code, headers=headers or {})
+    response.raw.stream.return_value = iter([body[i:i + 1024] for i in range(0, len(body), 1024)])
+    return response
+
+class ExpandingDecompressor:
+    """模拟brotli解压器：每个输入字节输出1000字节"""
+
+    def __init__(self):
+        self.inputs = []
+
+    def process(self, data):
+        self.inputs.append(len(data))
+        return b'a' * (len(data) * 1000)
+
+class LimitedDecompressor(ExpandingDecompressor):
+    """模拟支持output_buffer_limit的brotli>=1.2解压器"""
+
+    def process(self, data, output_buffer_limit=None):
+        self.limit = output_buffer_limit
+        return super().process(data)[:output_buffer_limit]
+
+    def can_accept_more_data(self):
+        return True
+
+def brotli_decoder(decompressor):
+    """构造使用模拟解压器的br解码器（测试环境不一定安装了brotli）"""
+    decoder = StreamDecoder(None)
+    decoder.encoding = 'br'
+    decoder.decoder = decompressor
+    return decoder
+
+class ControllerHandler(BaseHTTPRequestHandler):
+    """模拟Mihomo控制器接口"""
+
+    def do_PUT(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        self.server.requests.append((self.path, dict(self.headers), body))
+        if self.headers.get('Authorization') != f"Bearer {self.server.secret}":
+            self.send_response(401)
+        else:
+            self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class TestStreamDecoder(unittest.TestCase):
+    """测试brotli解压的输出上限"""
+
+    def test_brotli_output_limited_by_slices(self):
+        """旧版brotli分小段送入，超过上限后不再解压剩余的数据"""
+        decompressor = ExpandingDecompressor()
+        data = brotli_decoder(decompressor).decode(b'x' * 64 * 1024, 100 * 1000)
+        self.assertEqual(decompressor.inputs, [BROTLI_SLICE])
+        self.assertEqual(len(data), BROTLI_SLICE * 1000)
+
+        # 未超过上限时输出全部内容
+        decompressor = ExpandingDecompressor()
+        self.assertEqual(len(brotli_decoder(decompressor).decode(b'x' * 3000, 10 ** 7)), 3000 * 1000)
+
+    def test_brotli_output_buffer_limit(self):
+        """brotli>=1.2使用output_buffer_limit直接限制输出"""
+        decompressor = LimitedDecompressor()
+        self.assertEqual(len(brotli_decoder(decompressor).decode(b'x' * 64 * 1024, 5000)), 5000)
+        self.assertEqual(decompressor.limit, 5000)
+        self.assertEqual(decompressor.inputs, [64 * 1024])
 
 class TestMihomoUpdater(unittest.TestCase):
     """测试 MihomoUpdater 类，使用真实配置文件"""
@@ -57,8 +135,13 @@ class TestMihomoUpdater(unittest.TestCase):
     def tearDown(self):
         """每个测试结束后清理"""
         # 清理备份文件
-        for f in os.listdir(TEST_BACKUP_DIR):
-            os.remove(os.path.join(TEST_BACKUP_DIR, f))
+        shutil.rmtree(TEST_BACKUP_DIR, ignore_errors=True)
+        os.makedirs(TEST_BACKUP_DIR, exist_ok=True)
+        # 清理拉取缓存
+        shutil.rmtree(TEST_CACHE_DIR, ignore_errors=True)
+        # 清理配置文件写锁
+        if os.path.exists(TEST_MIHOMO_CONFIG_PATH + '.lock'):
+            os.remove(TEST_MIHOMO_CONFIG_PATH + '.lock')
     
     def test_init_with_real_config(self):
         """使用真实配置文件初始化更新器"""
@@ -90,10 +173,7 @@ class TestMihomoUpdater(unittest.TestCase):
             # 模拟网络请求
             with patch('requests.get') as mock_get:
                 # 模拟请求响应
-                mock_response = MagicMock()
-                mock_response.text = 'remote config content'
-                mock_response.raise_for_status = MagicMock()
-                mock_get.return_value = mock_response
+                mock_get.return_value = make_response('remote config content')
                 
                 # 初始化更新器并调用方法
                 updater = MihomoUpdater(REAL_CONFIG_PATH)
@@ -101,13 +181,43 @@ class TestMihomoUpdater(unittest.TestCase):
                 
                 # 验证
                 self.assertEqual(result, 'remote config content')
-                # 验证使用了真实URL
+                # 验证使用了真实URL，并协商压缩、流式读取
                 mock_get.assert_called_once_with(
                     self.real_config['fetch_url'],
-                    headers=updater.headers,
-                    timeout=30
+                    headers=dict(updater.headers, **{'Accept-Encoding': ACCEPT_ENCODING}),
+                    timeout=30,
+                    stream=True
                 )
     
+    def test_fetch_remote_config_compressed_and_capped(self):
+        """解压gzip订阅并记录传输/解压字节数，过大或HTML响应被拒绝"""
+        with patch('updater.load_config') as mock_load_config:
+            test_config = self.real_config.copy()
+            test_config['mihomo_config_path'] = TEST_MIHOMO_CONFIG_PATH
+            test_config['backup_dir'] = TEST_BACKUP_DIR
+            test_config['fetch_max_bytes'] = 64 * 1024
+            mock_load_config.return_value = test_config
+            updater = MihomoUpdater(REAL_CONFIG_PATH)
+            
+            content = "proxies:\n" + "- {name: 节点, type: http, server: a.com, port: 80}\n" * 200
+            compressed = gzip.compress(content.encode('utf-8'))
+            with patch('requests.get', return_value=make_response(
+                    compressed, headers={'Content-Encoding': 'gzip', 'Content-Type': 'text/plain'})):
+                self.assertEqual(updater.fetch_remote_config(), content)
+            stats = updater.last_details['fetch'][self.real_config['fetch_url']]
+            self.assertEqual(stats['wire_bytes'], len(compressed))
+            self.assertEqual(stats['decoded_bytes'], len(content.encode('utf-8')))
+            
+            # 解压后超过上限
+            bomb = gzip.compress(b"#" * (128 * 1024))
+            with patch('requests.get', return_value=make_response(bomb, headers={'Content-Encoding': 'gzip'})):
+                self.assertIsNone(updater.fetch_remote_config())
+            
+            # HTML错误页面
+            with patch('requests.get', return_value=make_response(
+                    '<html>error</html>', headers={'Content-Type': 'text/html; charset=utf-8'})):
+                self.assertIsNone(updater.fetch_remote_config())
+    
     # @pytest.mark.skip(reason="可能会发送真实网络请求，根据需要启用")
     def test_fetch_remote_config_actual_request(self):
         """发送真实网络请求获取远程配置"""
@@ -150,10 +260,64 @@ class TestMihomoUpdater(unittest.TestCase):
         with open(TEST_MIHOMO_CONFIG_PATH, 'r', encoding='utf-8') as original:
             original_content = original.read()
         
-        with open(backup_path, 'r', encoding='utf-8') as backup:
+        # 备份以gzip压缩保存
+        with gzip.open(backup_path, 'rt', encoding='utf-8') as backup:
             backup_content = backup.read()
         
         self.assertEqual(original_content, backup_content)
+        
+        # 内容没有变化时不重复存储
+        self.assertEqual(create_backup(TEST_MIHOMO_CONFIG_PATH, TEST_BACKUP_DIR), backup_path)
+    
+    def test_restore_backup(self):
+        """恢复备份：原子替换配置文件、先备份当前配置并重新加载"""
+        with patch('updater.load_config') as mock_load_config:
+            test_config = self.real_config.copy()
+            test_config['mihomo_config_path'] = TEST_MIHOMO_CONFIG_PATH
+            test_config['backup_dir'] = TEST_BACKUP_DIR
+            test_config['cache_dir'] = TEST_CACHE_DIR
+            mock_load_config.return_value = test_config
+            
+            updater = MihomoUpdater(REAL_CONFIG_PATH)
+            with open(TEST_MIHOMO_CONFIG_PATH, 'r', encoding='utf-8') as f:
+                original_content = f.read()
+            backup_id = updater.backup_store().add(TEST_MIHOMO_CONFIG_PATH)['id']
+            with open(TEST_MIHOMO_CONFIG_PATH, 'w', encoding='utf-8') as f:
+                f.write("port: 1234\n")
+            updater.fetch_cache.mark_applied('subscription-hash', TEST_MIHOMO_CONFIG_PATH)
+            
+            with patch.object(MihomoUpdater, 'restart_mihomo_service', return_value=True) as mock_restart:
+                self.assertTrue(updater.restore_backup(backup_id))
+                mock_restart.assert_called_once()
+            self.assertEqual(updater.last_status, 'restored')
+            with open(TEST_MIHOMO_CONFIG_PATH, 'r', encoding='utf-8') as f:
+                self.assertEqual(f.read(), original_content)
+            # 订阅未变化时，下次更新不会用同一份订阅覆盖恢复的配置
+            self.assertTrue(updater.fetch_cache.is_applied('subscription-hash', TEST_MIHOMO_CONFIG_PATH))
+            
+            # 被替换掉的配置也保存为新的备份，可以再恢复回去
+            entries, total = updater.backup_store().page(0, 10)
+            self.assertEqual(total, 2)
+            self.assertEqual(entries[0]['id'], updater.last_details['previous_backup'])
+            self.assertEqual(updater.backup_store().read(entries[0]['id']), b"port: 1234\n")
+            self.assertFalse(updater.restore_backup(999))
+            
+            # 重新加载失败时文件仍然恢复，但状态标记为reload_failed
+            with patch.object(MihomoUpdater, 'restart_mihomo_service', return_value=False):
+                self.assertTrue(updater.restore_backup(entries[0]['id']))
+            self.assertEqual(updater.last_status, 'reload_failed')
+            self.assertFalse(updater.last_details['reload']['success'])
+    
+    def test_backup_store_add_rereads_index(self):
+        """先打开的备份仓库实例写入时不会覆盖其他实例新增的备份记录"""
+        stale = BackupStore(TEST_BACKUP_DIR)
+        first = BackupStore(TEST_BACKUP_DIR).add(TEST_MIHOMO_CONFIG_PATH)
+        other_path = os.path.join(TEST_BACKUP_DIR, 'other.yaml')
+        with open(other_path, 'w', encoding='utf-8') as f:
+            f.write("port: 4321\n")
+        second = stale.add(other_path)
+        self.assertEqual(second['id'], first['id'] + 1)
+        self.assertEqual([entry['id'] for entry in BackupStore(TEST_BACKUP_DIR).entries()], [second['id'], first['id']])
     
     def test_merge_configs_with_real_format(self):
         """测试合并配置，使用真实格式的配置"""
@@ -189,6 +353,79 @@ class TestMihomoUpdater(unittest.TestCase):
         # 规则已替换
         self.assertEqual(merged_config["rules"], new_config["rules"])
     
+    def test_merge_subscriptions_dedup_and_rename(self):
+        """合并多个订阅：重复节点去重，重名节点按顺序重命名"""
+        first = {
+            "proxies": [
+                {"name": "HK", "type": "ss", "server": "hk.example.com", "port": 443, "password": "a"},
+                {"name": "JP", "type": "ss", "server": "jp.example.com", "port": 443, "password": "b"},
+            ],
+            "proxy-groups": [{"name": "PROXY", "type": "select", "proxies": ["HK", "JP"]},
+                             {"name": "FINAL", "type": "select", "proxies": ["PROXY", "DIRECT"]}],
+            "rules": ["MATCH,FINAL"],
+        }
+        second = {
+            "proxies": [
+                {"name": "香港", "type": "ss", "server": "hk.example.com", "port": 443, "password": "a"},
+                {"name": "HK", "type": "vmess", "server": "hk2.example.com", "port": 443, "uuid": "x"},
+            ],
+            "proxy-groups": [{"name": "OTHER", "type": "select", "proxies": ["香港"]}],
+            "rules": ["MATCH,OTHER"],
+        }
+        
+        merged = merge_subscriptions([first, second])
+        
+        self.assertEqual([p["name"] for p in merged["proxies"]], ["HK", "JP", "HK (2)"])
+        self.assertEqual(merged["proxy-groups"][0]["proxies"], ["HK", "JP", "HK (2)"])
+        # 只引用其他代理组的组不追加节点
+        self.assertEqual(merged["proxy-groups"][1]["proxies"], ["PROXY", "DIRECT"])
+        self.assertEqual(merged["rules"], first["rules"])
+        # 结果与订阅顺序一致，可重复
+        self.assertEqual(merge_subscriptions([first, second]), merged)
+    
+    def test_multiple_subscriptions_use_cached_copy_on_failure(self):
+        """某个订阅源失败时不影响其他源，并使用它上次成功拉取的内容"""
+        with patch('updater.load_config') as mock_load_config:
+            test_config = self.real_config.copy()
+            test_config['mihomo_config_path'] = TEST_MIHOMO_CONFIG_PATH
+            test_config['backup_dir'] = TEST_BACKUP_DIR
+            test_config['fetch_url'] = "https://a.example.com/sub"
+            test_config['subscriptions'] = [{"name": "b", "url": "https://b.example.com/sub", "timeout": 5}]
+            mock_load_config.return_value = test_config
+            
+            contents = {
+                "https://a.example.com/sub": yaml.dump({"proxies": [
+                    {"name": "A", "type": "http", "server": "a.com", "port": 80}],
+                    "proxy-groups": [{"name": "PROXY", "type": "select", "proxies": ["A"]}]}),
+                "https://b.example.com/sub": yaml.dump({"proxies": [
+                    {"name": "B", "type": "http", "server": "b.com", "port": 80}]}),
+            }
+            
+            def fake_get(url, headers=None, timeout=None, stream=False):
+                return make_response(contents[url])
+            
+            with patch('requests.get', side_effect=fake_get), \
+                patch.object(MihomoUpdater, 'restart_mihomo_service', return_value=True):
+                updater = MihomoUpdater(REAL_CONFIG_PATH)
+                self.assertTrue(updater.update_mihomo_config())
+            
+            def failing_get(url, headers=None, timeout=None, stream=False):
+                if url.startswith("https://b."):
+                    raise requests.exceptions.Timeout("timeout")
+                return fake_get(url, headers, timeout)
+            
+            contents["https://a.example.com/sub"] = contents["https://a.example.com/sub"].replace("a.com", "a2.com")
+            with patch('requests.get', side_effect=failing_get), \
+                patch.object(MihomoUpdater, 'restart_mihomo_service', return_value=True):
+                updater = MihomoUpdater(REAL_CONFIG_PATH)
+                self.assertTrue(updater.update_mihomo_config())
+                self.assertEqual(updater.last_details['failed_sources'], ["b"])
+            
+            with open(TEST_MIHOMO_CONFIG_PATH, 'r', encoding='utf-8') as f:
+                updated_config = yaml.safe_load(f)
+            self.assertEqual([p["server"] for p in updated_config["proxies"]], ["a2.com", "b.com"])
+            self.assertEqual(updated_config["proxy-groups"][0]["proxies"], ["A", "B"])
+    
     def test_update_mihomo_config_with_real_files(self):
         """测试更新Mihomo配置"""
         with patch('updater.load_config') as mock_load_config:
@@ -239,6 +476,111 @@ class TestMihomoUpdater(unittest.TestCase):
                 # 规则已更新
                 self.assertTrue("DOMAIN-SUFFIX,updated.com,UPDATED" in updated_config['rules'])
     
+    def test_unchanged_subscription_skips_update(self):
+        """订阅内容未变化（304或哈希相同）时跳过写入和重启"""
+        with patch('updater.load_config') as mock_load_config:
+            test_config = self.real_config.copy()
+            test_config['mihomo_config_path'] = TEST_MIHOMO_CONFIG_PATH
+            test_config['backup_dir'] = TEST_BACKUP_DIR
+            test_config['fetch_timeout'] = 12
+            mock_load_config.return_value = test_config
+            
+            remote_content = yaml.dump({
+                "proxies": [{"name": "cached_proxy", "type": "http", "server": "test.com", "port": 443}],
+                "proxy-groups": [{"name": "CACHED", "type": "select", "proxies": ["cached_proxy"]}],
+                "rules": ["MATCH,CACHED"]
+            })
+            first_response = make_response(remote_content, headers={'ETag': '"v1"'})
+            not_modified = make_response('', status_code=304, headers={'ETag': '"v1"'})
+            
+            # 记录已应用时仍持有配置文件锁，其他写入者不能在写入和记录之间改动文件
+            lock_held = []
+            original_mark_applied = FetchCache.mark_applied
+            def mark_applied(cache, *args):
+                lock_held.append(utils._file_locks[os.path.abspath(TEST_MIHOMO_CONFIG_PATH)].locked())
+                return original_mark_applied(cache, *args)
+            
+            with patch('requests.get', side_effect=[first_response, not_modified]) as mock_get, \
+                patch.object(MihomoUpdater, 'restart_mihomo_service', return_value=True) as mock_restart, \
+                patch.object(FetchCache, 'mark_applied', mark_applied):
+                updater = MihomoUpdater(REAL_CONFIG_PATH)
+                self.assertTrue(updater.update_mihomo_config())
+                self.assertEqual(updater.last_status, 'updated')
+                self.assertEqual(lock_held, [True])
+                # 只有一个订阅源时同样使用配置的超时
+                self.assertEqual(mock_get.call_args_list[0][1]['timeout'], 12)
+                phases = updater.last_details['run']['phases']
+                for name in ('fetch', 'parse', 'lock_wait', 'load', 'merge', 'diff', 'backup', 'write', 'reload'):
+                    self.assertIn(name, phases)
+                self.assertEqual(phases['fetch']['bytes'], len(remote_content.encode('utf-8')))
+                
+                # 第二次请求带上ETag，服务器返回304，整个流程被跳过
+                updater = MihomoUpdater(REAL_CONFIG_PATH)
+                self.assertTrue(updater.update_mihomo_config())
+                self.assertEqual(updater.last_status, 'unchanged')
+                self.assertEqual(mock_get.call_args_list[1][1]['headers']['If-None-Match'], '"v1"')
+                self.assertEqual(list(updater.last_details['run']['phases']), ['fetch'])
+                self.assertEqual(mock_restart.call_count, 1)
+                self.assertEqual(len(BackupStore(TEST_BACKUP_DIR).entries()), 1)
+            
+            # 配置文件被手动修改后，即使订阅未变化也会重新合并比较；
+            # 修改的不是节点、代理组和规则，变更集为空，仍然不写入也不重启
+            with open(TEST_MIHOMO_CONFIG_PATH, 'a', encoding='utf-8') as f:
+                f.write("mixed-port: 7893\n")
+            with patch.object(MihomoUpdater, 'fetch_remote_config', return_value=remote_content), \
+                patch.object(MihomoUpdater, 'restart_mihomo_service', return_value=True) as mock_restart:
+                updater = MihomoUpdater(REAL_CONFIG_PATH)
+                self.assertTrue(updater.update_mihomo_config())
+                self.assertEqual(updater.last_status, 'unchanged')
+                self.assertFalse(updater.last_details['changeset']['changed'])
+                mock_restart.assert_not_called()
+            
+            # 开启规则编译后，订阅未变化也要重新合并，不能沿用之前的结果
+            test_config['rule_compile'] = True
+            test_config['rule_provider_dir'] = os.path.join(TEST_CACHE_DIR, 'rule_providers')
+            with patch.object(MihomoUpdater, 'fetch_remote_config', return_value=remote_content), \
+                patch.object(MihomoUpdater, 'restart_mihomo_service', return_value=True):
+                updater = MihomoUpdater(REAL_CONFIG_PATH)
+                self.assertTrue(updater.update_mihomo_config())
+                self.assertIn('rules', updater.last_details)
+                self.assertIn('changeset', updater.last_details)
+    
+    def test_rule_provider_files_written_after_config(self):
+        """规则编译生成的provider文件在配置写入成功后才更新，写入失败时保持原样"""
+        with patch('updater.load_config') as mock_load_config:
+            provider_dir = os.path.join(TEST_CACHE_DIR, 'rule_providers')
+            test_config = self.real_config.copy()
+            test_config['mihomo_config_path'] = TEST_MIHOMO_CONFIG_PATH
+            test_config['backup_dir'] = TEST_BACKUP_DIR
+            test_config['cache_dir'] = TEST_CACHE_DIR
+            test_config['rule_compile'] = True
+            test_config['rule_compile_threshold'] = 2
+            test_config['rule_provider_dir'] = provider_dir
+            mock_load_config.return_value = test_config
+            
+            os.makedirs(provider_dir, exist_ok=True)
+            stale = os.path.join(provider_dir, 'compiled-9.txt')
+            with open(stale, 'w', encoding='utf-8') as f:
+                f.write("old\n")
+            remote_config = {
+                "proxies": [{"name": "p1", "type": "http", "server": "test.com", "port": 443}],
+                "proxy-groups": [{"name": "PROXY", "type": "select", "proxies": ["p1"]}],
+                "rules": [f"DOMAIN,h{i}.example.com,PROXY" for i in range(3)] + ["MATCH,PROXY"],
+            }
+            
+            updater = MihomoUpdater(REAL_CONFIG_PATH)
+            with patch.object(MihomoUpdater, 'write_config', side_effect=OSError("disk full")), \
+                patch.object(MihomoUpdater, 'restart_mihomo_service', return_value=True) as mock_restart:
+                self.assertFalse(updater.update_with_remote_config(remote_config))
+                mock_restart.assert_not_called()
+            self.assertEqual(os.listdir(provider_dir), ['compiled-9.txt'])
+            
+            with patch.object(MihomoUpdater, 'restart_mihomo_service', return_value=True):
+                self.assertTrue(updater.update_with_remote_config(remote_config))
+            self.assertEqual(updater.last_status, 'updated')
+            self.assertFalse(os.path.exists(stale))
+            self.assertEqual(os.listdir(provider_dir), ['compiled-1.txt'])
+    
     def test_restart_mihomo_service_mocked(self):
         """测试重启Mihomo服务（模拟执行）"""
         with patch('updater.load_config') as mock_load_config:
@@ -256,6 +598,92 @@ class TestMihomoUpdater(unittest.TestCase):
                 self.assertTrue(result)
                 mock_run.assert_called_once_with(['systemctl', 'restart', 'mihomo.service'], check=True)
     
+    def test_reload_via_controller_api(self):
+        """reload_mode为api时调用PUT /configs?force=true，失败时回退到systemctl"""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), ControllerHandler)
+        server.requests = []
+        server.secret = "s3cret"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            with patch('updater.load_config') as mock_load_config:
+                test_config = self.real_config.copy()
+                test_config['mihomo_config_path'] = TEST_MIHOMO_CONFIG_PATH
+                test_config['backup_dir'] = TEST_BACKUP_DIR
+                test_config['reload_mode'] = 'api'
+                test_config['clash_api_url'] = f"http://127.0.0.1:{server.server_address[1]}/"
+                test_config['clash_api_secret'] = "s3cret"
+                mock_load_config.return_value = test_config
+                
+                with patch('subprocess.run') as mock_run:
+                    updater = MihomoUpdater(REAL_CONFIG_PATH)
+                    self.assertTrue(updater.reload_mihomo())
+                    mock_run.assert_not_called()
+                
+                path, headers, body = server.requests[0]
+                self.assertEqual(path, '/configs?force=true')
+                self.assertEqual(body['path'], TEST_MIHOMO_CONFIG_PATH)
+                self.assertEqual(updater.last_details['reload']['method'], 'api')
+                self.assertGreaterEqual(updater.last_details['reload']['latency'], 0)
+                
+                # 密钥错误时回退到systemctl
+                test_config['clash_api_secret'] = "wrong"
+                with patch('subprocess.run') as mock_run:
+                    updater = MihomoUpdater(REAL_CONFIG_PATH)
+                    self.assertTrue(updater.reload_mihomo())
+                    mock_run.assert_called_once_with(['systemctl', 'restart', 'mihomo.service'], check=True)
+                self.assertEqual(updater.last_details['reload']['method'], 'systemctl')
+        finally:
+            server.shutdown()
+            server.server_close()
+    
+    def test_proxy_provider_output_mode(self):
+        """provider模式只写入provider文件并刷新该provider，主配置保持不变"""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), ControllerHandler)
+        server.requests = []
+        server.secret = "s3cret"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            with patch('updater.load_config') as mock_load_config:
+                test_config = self.real_config.copy()
+                test_config['mihomo_config_path'] = TEST_MIHOMO_CONFIG_PATH
+                test_config['backup_dir'] = TEST_BACKUP_DIR
+                test_config['cache_dir'] = TEST_CACHE_DIR
+                test_config['output_mode'] = 'provider'
+                test_config['provider_name'] = 'my sub'
+                test_config['provider_dir'] = os.path.join(TEST_CACHE_DIR, 'providers')
+                test_config['clash_api_url'] = f"http://127.0.0.1:{server.server_address[1]}"
+                test_config['clash_api_secret'] = "s3cret"
+                mock_load_config.return_value = test_config
+                
+                with open(TEST_MIHOMO_CONFIG_PATH, 'rb') as f:
+                    original_bytes = f.read()
+                remote_config = {
+                    'proxies': [{'name': 'n1', 'type': 'ss', 'server': 'a.example.com', 'port': 443}],
+                    'rules': ['MATCH,DIRECT'],
+                }
+                
+                with patch('subprocess.run') as mock_run:
+                    updater = MihomoUpdater(REAL_CONFIG_PATH)
+                    self.assertTrue(updater.update_with_remote_config(remote_config))
+                    self.assertEqual(updater.last_status, 'updated')
+                    
+                    provider_path = os.path.join(TEST_CACHE_DIR, 'providers', 'my sub.yaml')
+                    with open(provider_path, 'r', encoding='utf-8') as f:
+                        self.assertEqual(yaml.safe_load(f), {'proxies': remote_config['proxies']})
+                    with open(TEST_MIHOMO_CONFIG_PATH, 'rb') as f:
+                        self.assertEqual(f.read(), original_bytes)
+                    self.assertEqual([r[0] for r in server.requests], ['/providers/proxies/my%20sub'])
+                    self.assertEqual(updater.last_details['provider']['method'], 'provider')
+                    
+                    # 节点没有变化时不写入也不刷新
+                    self.assertTrue(updater.update_with_remote_config(remote_config))
+                    self.assertEqual(updater.last_status, 'unchanged')
+                    self.assertEqual(len(server.requests), 1)
+                    mock_run.assert_not_called()
+        finally:
+            server.shutdown()
+            server.server_close()
+    
     def test_run_updater_integration(self):
         """集成测试运行更新器（模拟依赖）"""
         with patch('updater.load_config') as mock_load_config:
@@ -276,5 +704,38 @@ class TestMihomoUpdater(unittest.TestCase):
                 # 验证
                 self.assertTrue(result)
 
+class TestFetchCache(unittest.TestCase):
+    """测试订阅拉取缓存"""
+
+    def tearDown(self):
+        shutil.rmtree(TEST_CACHE_DIR, ignore_errors=True)
+
+    def test_concurrent_store_keeps_all_sources(self):
+        """多个订阅源并发保存时索引写入不会失败，索引文件中保留全部订阅源"""
+        import updater as updater_module
+        cache = FetchCache(TEST_CACHE_DIR)
+        urls = [f"https://sub{i}.example.com/clash" for i in range(200)]
+        original_save_json = updater_module.save_json
+        results = []
+
+        def save_json(data, path):
+            """记录每次写入索引是否成功"""
+            results.append(original_save_json(data, path))
+            return results[-1]
+
+        with patch('updater.save_json', save_json):
+            threads = [threading.Thread(target=cache.store, args=(url, "proxies: []\n", f'"{url}"'))
+                       for url in urls]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertTrue(all(results))
+        reloaded = FetchCache(TEST_CACHE_DIR)
+        for url in urls:
+            self.assertEqual(reloaded.get(url)['etag'], f'"{url}"')
+
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,300 @@
+import unittest
+import os
+import sys
+import yaml
+import shutil
+import json
+import time
+import subprocess
+import threading
+from unittest.mock import patch
+
+# 添加父目录到系统路径，以便导入模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入被测试的模块
+import utils
+from utils import (yaml_load, yaml_dump, yaml_classes, set_yaml_engine, yaml_load_sections,
+                   splice_yaml_sections, SUBSCRIPTION_SECTIONS, ParsedConfigCache, BackupStore, file_lock)
+
+# 测试文件夹路径
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testdata')
+TEST_MIHOMO_CONFIG_PATH = os.path.join(TEST_DIR, 'mihomo_config.yaml')
+TEST_WORK_DIR = os.path.join(TEST_DIR, 'utils_work')
+
+
+class TestYamlEngine(unittest.TestCase):
+    """测试可切换的YAML引擎"""
+
+    def tearDown(self):
+        """恢复默认引擎"""
+        set_yaml_engine('auto')
+
+    def test_switch_engine(self):
+        """切换引擎后使用对应的Loader/Dumper，无效名称被忽略"""
+        self.assertTrue(set_yaml_engine('python'))
+        self.assertEqual(yaml_classes(), (yaml.SafeLoader, yaml.SafeDumper))
+        self.assertFalse(set_yaml_engine('fast'))
+        self.assertEqual(utils._yaml_engine, 'python')
+
+    @unittest.skipUnless(yaml.__with_libyaml__, "PyYAML未编译libyaml支持")
+    def test_engines_produce_same_output(self):
+        """libyaml与纯Python引擎的解析和序列化结果一致"""
+        with open(TEST_MIHOMO_CONFIG_PATH, 'r', encoding='utf-8') as f:
+            content = f.read()
+        data = dict(yaml_load(content, 'python'), extra={"中文": [1, 2.5, True, None, "a: b"]})
+
+        self.assertEqual(yaml_load(content, 'c'), yaml_load(content, 'python'))
+        self.assertEqual(yaml_dump(data, engine='c'), yaml_dump(data, engine='python'))
+        self.assertEqual(yaml_load(yaml_dump(data, engine='c'), 'c'), data)
+
+    def test_load_selected_sections(self):
+        """按段解析只返回指定的顶层键，跳过部分中的锚点仍可被引用"""
+        content = (
+            "x-base: &base {type: ss, port: 443}\n"
+            "dns:\n  enable: true\n  nameserver: [1.1.1.1, &ns 8.8.8.8]\n"
+            "hosts: {a.lan: 10.0.0.1}\n"
+            "proxies:\n  - <<: *base\n    name: a\n    server: *ns\n"
+            "rules:\n  - MATCH,DIRECT\n"
+        )
+        full = yaml.safe_load(content)
+        for engine in ('python', 'c') if yaml.__with_libyaml__ else ('python',):
+            result = yaml_load_sections(content, SUBSCRIPTION_SECTIONS, engine)
+            self.assertEqual(result, {"proxies": full["proxies"], "rules": full["rules"]})
+        self.assertIsNone(yaml_load_sections("", SUBSCRIPTION_SECTIONS))
+        self.assertEqual(yaml_load_sections("- 1\n- 2\n", SUBSCRIPTION_SECTIONS), [1, 2])
+
+    def test_splice_changed_sections(self):
+        """只替换变化的顶层配置段，其余内容和注释逐字节保留"""
+        content = (
+            "# 手动维护的配置\n"
+            "port: 7890  # 端口\n"
+            "dns:\n  enable: true\n  nameserver: [1.1.1.1]\n\n"
+            "# 节点\n"
+            "proxies:\n  - {name: a, type: ss}\n\n"
+            "proxy-groups:\n- name: G\n  proxies: [a]\n"
+            "rules:\n  - MATCH,DIRECT\n"
+        )
+        original = yaml.safe_load(content)
+        updated = dict(original, proxies=[{"name": "b", "type": "ss"}])
+
+        text, changed = splice_yaml_sections(content, original, updated)
+        self.assertEqual(changed, ["proxies"])
+        self.assertEqual(yaml.safe_load(text), updated)
+        self.assertEqual(text, content.replace(
+            "proxies:\n  - {name: a, type: ss}\n", "proxies:\n- name: b\n  type: ss\n"))
+
+        # 有锚点或文档标记时无法安全替换
+        self.assertIsNone(splice_yaml_sections("a: &x 1\nb: *x\n", {"a": 1, "b": 1}, {"a": 2, "b": 1}))
+        self.assertIsNone(splice_yaml_sections("---\na: 1\n", {"a": 1}, {"a": 2}))
+
+
+class TestParsedConfigCache(unittest.TestCase):
+    """测试按文件标识缓存的配置解析结果"""
+
+    def setUp(self):
+        """准备测试文件"""
+        os.makedirs(TEST_WORK_DIR, exist_ok=True)
+        self.path = os.path.join(TEST_WORK_DIR, 'config.yaml')
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write("port: 7890\nmode: rule\n")
+
+    def tearDown(self):
+        """清理测试文件"""
+        shutil.rmtree(TEST_WORK_DIR, ignore_errors=True)
+
+    def test_cache_hit_skips_parse(self):
+        """文件未变化时不再解析"""
+        cache = ParsedConfigCache()
+        self.assertEqual(cache.load(self.path), {"port": 7890, "mode": "rule"})
+        with patch('utils.yaml_load') as mock_load:
+            self.assertEqual(cache.load(self.path)["port"], 7890)
+            mock_load.assert_not_called()
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_hand_edit_invalidates(self):
+        """手动编辑后即使大小和修改时间不变也会重新解析"""
+        cache = ParsedConfigCache()
+        cache.load(self.path)
+        stat = os.stat(self.path)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write("port: 7891\nmode: rule\n")
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(cache.load(self.path)["port"], 7891)
+
+    def test_persisted_cache_survives_restart(self):
+        """磁盘缓存在新的缓存实例中依然有效"""
+        ParsedConfigCache().load(self.path, TEST_WORK_DIR)
+        cache = ParsedConfigCache()
+        with patch('utils.yaml_load') as mock_load:
+            self.assertEqual(cache.load(self.path, TEST_WORK_DIR)["mode"], "rule")
+            mock_load.assert_not_called()
+
+    def test_persisted_cache_is_plain_json(self):
+        """磁盘缓存保存为JSON；JSON无法原样表示的解析结果只保存在内存中"""
+        ParsedConfigCache().load(self.path, TEST_WORK_DIR)
+        cache_files = [name for name in os.listdir(TEST_WORK_DIR) if name.startswith("parsed_")]
+        self.assertEqual(len(cache_files), 1)
+        self.assertTrue(cache_files[0].endswith(".json"))
+        with open(os.path.join(TEST_WORK_DIR, cache_files[0]), 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)["config"], {"port": 7890, "mode": "rule"})
+
+        # 整数键写成JSON后会变成字符串，不能写入磁盘缓存
+        other_dir = os.path.join(TEST_WORK_DIR, 'int_keys')
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write("ports:\n  1: a\n")
+        self.assertEqual(ParsedConfigCache().load(self.path, other_dir), {"ports": {1: "a"}})
+        self.assertFalse(os.path.exists(other_dir) and os.listdir(other_dir))
+
+    def test_prime_after_write(self):
+        """写入后登记解析结果，返回的是浅拷贝"""
+        cache = ParsedConfigCache()
+        config = {"port": 1, "rules": ["MATCH,DIRECT"]}
+        with open(self.path, 'w', encoding='utf-8') as f:
+            yaml_dump(config, f)
+        cache.prime(self.path, config)
+        loaded = cache.load(self.path)
+        loaded["port"] = 2
+        self.assertEqual(cache.load(self.path), config)
+        self.assertEqual(cache.misses, 0)
+
+
+class TestBackupStore(unittest.TestCase):
+    """测试内容寻址的备份仓库"""
+
+    def setUp(self):
+        """准备工作目录"""
+        self.backup_dir = os.path.join(TEST_WORK_DIR, 'backups')
+        self.config_path = os.path.join(TEST_WORK_DIR, 'config.yaml')
+        os.makedirs(self.backup_dir, exist_ok=True)
+
+    def tearDown(self):
+        """清理工作目录"""
+        shutil.rmtree(TEST_WORK_DIR, ignore_errors=True)
+
+    def write_config(self, content):
+        """写入测试配置"""
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def test_identical_content_stored_once(self):
+        """相同内容只存储一个压缩对象，连续相同的备份只记录一次"""
+        store = BackupStore(self.backup_dir, max_backups=10)
+        self.write_config("port: 7890\n" * 1000)
+        first = store.add(self.config_path)
+        self.assertEqual(store.add(self.config_path)["id"], first["id"])
+        self.write_config("port: 7891\n")
+        store.add(self.config_path)
+        self.write_config("port: 7890\n" * 1000)
+        third = store.add(self.config_path)
+
+        self.assertEqual(third["sha256"], first["sha256"])
+        self.assertLess(first["stored_size"], first["size"])
+        self.assertEqual([entry["id"] for entry in BackupStore(self.backup_dir).entries()], [3, 2, 1])
+        self.assertEqual(store.read(1), b"port: 7890\n" * 1000)
+        objects = [name for _, _, names in os.walk(store.objects_dir) for name in names]
+        self.assertEqual(len(objects), 2)
+
+    def test_retention_by_count_and_age(self):
+        """超过数量或天数的记录被删除，不再引用的对象随之删除"""
+        store = BackupStore(self.backup_dir, max_backups=2, max_age_days=7)
+        now = time.time()
+        added = []
+        for i, age_days in enumerate((30, 3, 2, 1)):
+            self.write_config(f"port: {i}\n")
+            added.append(store.add(self.config_path, timestamp=now - age_days * 86400))
+        self.assertEqual([entry["id"] for entry in store.entries()], [4, 3])
+        self.assertIsNone(store.read(1))
+        self.assertFalse(os.path.exists(store.object_path(added[0]["sha256"])))
+        self.assertFalse(os.path.exists(store.object_path(added[1]["sha256"])))
+
+        store = BackupStore(self.backup_dir, max_backups=0, max_age_days=7)
+        self.write_config("port: 9\n")
+        store.add(self.config_path, timestamp=now)
+        self.assertEqual([entry["id"] for entry in store.entries()], [5, 4, 3])
+
+    def test_protected_backup_survives_prune(self):
+        """恢复备份前备份当前配置时，正在恢复的旧备份不会被保留策略删除"""
+        store = BackupStore(self.backup_dir, max_backups=2)
+        for i in range(2):
+            self.write_config(f"port: {i}\n")
+            store.add(self.config_path)
+        self.write_config("port: 9\n")
+        store.add(self.config_path, protect_id=1)
+        # 保留最新的两个备份，另外保留正在恢复的备份
+        self.assertEqual([entry["id"] for entry in store.entries()], [3, 2, 1])
+        self.assertEqual(store.read(1), b"port: 0\n")
+
+        # 超过保存天数的备份同样不会被删除
+        with open(store.index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        index["entries"][0]["time"] = time.time() - 30 * 86400
+        with open(store.index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        store = BackupStore(self.backup_dir, max_backups=0, max_age_days=7)
+        self.write_config("port: 10\n")
+        store.add(self.config_path, protect_id=1)
+        self.assertEqual([entry["id"] for entry in store.entries()], [4, 3, 2, 1])
+        # 之后的普通备份照常清理
+        self.write_config("port: 11\n")
+        store.add(self.config_path)
+        self.assertEqual([entry["id"] for entry in store.entries()], [5, 4, 3, 2])
+
+    def test_import_legacy_backups(self):
+        """首次使用时导入旧版的 .bak 备份文件"""
+        for i in range(3):
+            with open(os.path.join(self.backup_dir, f"config.yaml.2024010{i}_000000.bak"), 'w') as f:
+                f.write(f"port: {i}\n")
+        store = BackupStore(self.backup_dir, max_backups=10)
+        self.assertEqual(len(store.entries()), 3)
+        self.assertFalse([name for name in os.listdir(self.backup_dir) if name.endswith(".bak")])
+        contents = sorted(store.read(entry["id"]) for entry in store.entries())
+        self.assertEqual(contents, [b"port: 0\n", b"port: 1\n", b"port: 2\n"])
+
+
+class TestFileLock(unittest.TestCase):
+    """测试配置文件写锁"""
+
+    def setUp(self):
+        self.path = os.path.join(TEST_WORK_DIR, 'locked.yaml')
+
+    def tearDown(self):
+        shutil.rmtree(TEST_WORK_DIR, ignore_errors=True)
+
+    def test_threads_are_serialized(self):
+        """同一进程内的写入者依次进入临界区"""
+        active = []
+        overlaps = []
+
+        def writer():
+            with file_lock(self.path):
+                active.append(1)
+                overlaps.append(len(active))
+                time.sleep(0.02)
+                active.pop()
+
+        threads = [threading.Thread(target=writer) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [1, 1, 1, 1])
+
+    @unittest.skipIf(utils.fcntl is None, "当前平台不支持fcntl")
+    def test_lock_held_across_processes(self):
+        """持有锁时，其他进程无法获得同一个锁文件的flock"""
+        probe = ("import fcntl, sys\n"
+                 "f = open(sys.argv[1], 'a')\n"
+                 "try:\n"
+                 "    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)\n"
+                 "except OSError:\n"
+                 "    sys.exit(1)\n")
+        with file_lock(self.path):
+            held = subprocess.run([sys.executable, '-c', probe, self.path + '.lock'])
+        free = subprocess.run([sys.executable, '-c', probe, self.path + '.lock'])
+        self.assertEqual(held.returncode, 1)
+        self.assertEqual(free.returncode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,25 +1,235 @@
 import os
 import requests
-import yaml
 import logging
 import subprocess
 import time
-from utils import load_config, save_config, create_backup, parse_yaml, merge_configs, setup_logger
+import hashlib
+import threading
+import zlib
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, quote
+from utils import (create_backup, parse_yaml, merge_configs, merge_subscriptions,
+                   setup_logger, load_json, save_json, save_yaml, atomic_write, file_lock, file_sha256, yaml_dump, set_yaml_engine,
+                   splice_yaml_sections, parsed_config_cache, SUBSCRIPTION_SECTIONS, BackupStore)
+from config_diff import diff_configs, summarize_changeset
+from config_service import load_config, default_config_path
+from metrics import RunRecord
+from rule_compiler import compile_rules, apply_rule_providers, sync_provider_files, DEFAULT_THRESHOLD
+
+# brotli为可选依赖，未安装时不协商br压缩
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # 初始化日志
 logger = setup_logger("updater.log")
 logger.info("Mihomo配置更新器初始化")
 
+# 订阅拉取时可以接受的压缩方式
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli else "gzip, deflate"
+
+# 明显不是YAML订阅的内容类型，遇到时立即中止下载
+REJECTED_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'image/', 'audio/', 'video/')
+
+# 旧版brotli不支持限制单次输出时，每次送入解压器的压缩数据大小；每段之后检查输出是否超过上限
+BROTLI_SLICE = 1024
+
+class SubscriptionRejected(Exception):
+    """订阅响应的类型或大小不符合要求"""
+
+class StreamDecoder:
+    """按Content-Encoding增量解压响应内容"""
+
+    def __init__(self, encoding):
+        self.encoding = (encoding or 'identity').strip().lower()
+        if self.encoding in ('identity', ''):
+            self.decoder = None
+        elif self.encoding in ('gzip', 'x-gzip'):
+            self.decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == 'deflate':
+            self.decoder = zlib.decompressobj()
+            self.first_chunk = True
+        elif self.encoding == 'br' and brotli:
+            self.decoder = brotli.Decompressor()
+        else:
+            raise SubscriptionRejected(f"不支持的压缩方式: {encoding}")
+
+    def decode(self, chunk, max_length=0):
+        """解压一段数据，max_length限制本次最多输出的字节数，超过时返回的内容不完整，调用方应中止"""
+        if self.decoder is None:
+            return chunk
+        if self.encoding == 'br':
+            return self._decode_brotli(chunk, max_length)
+        if self.encoding == 'deflate' and self.first_chunk:
+            # 部分服务器发送不带zlib头的原始deflate数据
+            self.first_chunk = False
+            try:
+                return self.decoder.decompress(chunk, max_length)
+            except zlib.error:
+                self.decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self.decoder.decompress(chunk, max_length)
+
+    def _decode_brotli(self, chunk, max_length):
+        """brotli解压：支持output_buffer_limit时直接限制输出，否则分小段送入并在每段之后检查上限"""
+        if not max_length:
+            return self.decoder.process(chunk)
+        if hasattr(self.decoder, 'can_accept_more_data'):
+            # brotli>=1.2：超过上限的输出留在解压器中，调用方会中止下载，不会再读取
+            return self.decoder.process(chunk, output_buffer_limit=max_length)
+        parts = []
+        produced = 0
+        for start in range(0, len(chunk), BROTLI_SLICE):
+            data = self.decoder.process(chunk[start:start + BROTLI_SLICE])
+            parts.append(data)
+            produced += len(data)
+            if produced >= max_length:
+                break
+        return b''.join(parts)
+
+    def flush(self):
+        """输出解压器中剩余的数据"""
+        if self.decoder is None or self.encoding == 'br':
+            return b''
+        return self.decoder.flush()
+
+def read_limited_body(response, max_bytes, chunk_size=64 * 1024):
+    """流式读取并解压响应内容，超过max_bytes或不是YAML时中止
+    
+    返回(解压后的内容, 传输的字节数)
+    """
+    content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+    if content_type.startswith(REJECTED_CONTENT_TYPES):
+        raise SubscriptionRejected(f"订阅响应不是YAML内容: {content_type}")
+    
+    encoding = response.headers.get('Content-Encoding')
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and not encoding and int(length) > max_bytes:
+        raise SubscriptionRejected(f"订阅内容过大: {length} 字节，上限 {max_bytes} 字节")
+    
+    decoder = StreamDecoder(encoding)
+    parts = []
+    wire_bytes = 0
+    decoded_bytes = 0
+    for chunk in response.raw.stream(chunk_size, decode_content=False):
+        wire_bytes += len(chunk)
+        data = decoder.decode(chunk, max_bytes - decoded_bytes + 1)
+        if not parts and data.lstrip()[:15].lower().startswith((b'<!doctype html', b'<html')):
+            raise SubscriptionRejected("订阅响应是HTML页面，不是YAML内容")
+        decoded_bytes += len(data)
+        if decoded_bytes > max_bytes:
+            raise SubscriptionRejected(f"订阅内容解压后超过上限 {max_bytes} 字节")
+        if data:
+            parts.append(data)
+    tail = decoder.flush()
+    if decoded_bytes + len(tail) > max_bytes:
+        raise SubscriptionRejected(f"订阅内容解压后超过上限 {max_bytes} 字节")
+    parts.append(tail)
+    return b''.join(parts), wire_bytes
+
+def decode_text(body, content_type):
+    """按Content-Type中的charset解码，未指定时按YAML默认的UTF-8解码"""
+    charset = 'utf-8'
+    for param in (content_type or '').split(';')[1:]:
+        key, _, value = param.strip().partition('=')
+        if key.lower() == 'charset' and value:
+            charset = value.strip('"\'')
+    try:
+        return body.decode(charset)
+    except (LookupError, UnicodeDecodeError):
+        return body.decode('utf-8', errors='replace')
+
+def content_sha256(content):
+    """计算文本内容的sha256"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+class FetchCache:
+    """订阅拉取缓存：保存ETag/Last-Modified、上次订阅内容及其哈希，以及最近一次应用的结果"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.body_dir = os.path.join(cache_dir, "subscriptions")
+        self.index_path = os.path.join(cache_dir, "fetch_cache.json")
+        self.data = load_json(self.index_path, {}) or {}
+        self.data.setdefault("sources", {})
+        # 多个订阅源在线程池中并发拉取，修改和保存索引时需要加锁
+        self.lock = threading.Lock()
+
+    def _body_path(self, url):
+        """订阅内容在缓存目录中的保存路径"""
+        return os.path.join(self.body_dir, hashlib.sha256(url.encode('utf-8')).hexdigest()[:16] + ".yaml")
+
+    def get(self, url):
+        """获取URL的缓存信息，缓存的订阅内容不存在时返回None"""
+        with self.lock:
+            entry = self.data["sources"].get(url)
+        if not entry or not os.path.exists(self._body_path(url)):
+            return None
+        return dict(entry)
+
+    def read_body(self, url):
+        """读取缓存的订阅内容"""
+        with open(self._body_path(url), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def store(self, url, content, etag=None, last_modified=None):
+        """保存最新拉取到的订阅内容和校验信息"""
+        # 原子替换，写入中断时不会留下被截断的订阅内容（304和拉取失败时会使用它）
+        atomic_write(self._body_path(url), lambda f: f.write(content), suffix=".yaml")
+        with self.lock:
+            self.data["sources"][url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "sha256": content_sha256(content),
+                "fetched_at": time.time(),
+            }
+            save_json(self.data, self.index_path)
+
+    def is_applied(self, content_hash, mihomo_config_path, settings=None):
+        """订阅内容已经按相同的输出设置应用过，且写入的文件（主配置或provider文件）在那之后没有被改动"""
+        with self.lock:
+            applied = self.data.get("applied")
+        return bool(applied
+                    and applied.get("sha256") == content_hash
+                    and applied.get("settings") == settings
+                    and applied.get("config_sha256") == file_sha256(mihomo_config_path))
+
+    def mark_applied(self, content_hash, mihomo_config_path, settings=None):
+        """记录已应用的订阅内容哈希、影响输出的设置以及写入后的配置文件哈希"""
+        config_sha256 = file_sha256(mihomo_config_path)
+        with self.lock:
+            self.data["applied"] = {
+                "sha256": content_hash,
+                "settings": settings,
+                "config_sha256": config_sha256,
+                "applied_at": time.time(),
+            }
+            save_json(self.data, self.index_path)
+
+    def pin_applied(self, mihomo_config_path):
+        """把文件的当前内容记为上次应用的订阅结果（恢复备份后使用），订阅未变化时不会被重新覆盖"""
+        config_sha256 = file_sha256(mihomo_config_path)
+        with self.lock:
+            applied = self.data.get("applied")
+            if not applied:
+                return False
+            applied["config_sha256"] = config_sha256
+            applied["pinned_at"] = time.time()
+            save_json(self.data, self.index_path)
+            return True
+
 class MihomoUpdater:
-    def __init__(self, config_path="config.yaml"):
-        """初始化Mihomo配置更新器"""
-        self.config_path = config_path
-        self.config = load_config(config_path)
+    def __init__(self, config_path=None):
+        """初始化Mihomo配置更新器，未指定路径时使用CONFIG_DIR下的config.yaml（与Web服务相同）"""
+        self.config_path = config_path or default_config_path()
+        self.config = load_config(self.config_path)
         if not self.config:
             logger.error("无法加载配置文件")
             raise ValueError("配置文件加载失败")
         
         logger.info("Mihomo配置更新器配置加载成功")
+        set_yaml_engine(self.config.get('yaml_engine', 'auto'))
         
         # 设置用户代理
         self.headers = {
@@ -30,35 +240,164 @@ class MihomoUpdater:
         backup_dir = self.config.get('backup_dir', '/etc/mihomo/backups')
         os.makedirs(backup_dir, exist_ok=True)
         logger.info(f"备份目录确认: {backup_dir}")
+        
+        # 订阅拉取缓存，默认与备份目录放在同一个持久化目录下
+        cache_dir = self.config.get('cache_dir') or os.path.join(os.path.dirname(os.path.abspath(backup_dir)), 'cache')
+        self.fetch_cache = FetchCache(cache_dir)
+        # 原始配置解析结果是否同时保存到磁盘，进程重启后依然有效
+        self.parsed_cache_dir = cache_dir if self.config.get('parsed_cache_persist', False) else None
+        
+        # 最近一次更新的状态（updated / unchanged / failed）和详细信息
+        self.last_status = None
+        self.last_details = {}
+        # 阶段开始时的回调（后台任务用它报告当前阶段）
+        self.phase_listener = None
+        # 最近一次更新各阶段的耗时和字节数
+        self.run_record = RunRecord('mihomo', self.phase_listener)
+
+    def subscription_sources(self):
+        """获取所有订阅源：fetch_url（字符串或列表）加上subscriptions列表
+        
+        列表项可以是URL字符串，也可以是包含url、name、timeout的字典
+        """
+        sources = []
+        for key in ('fetch_url', 'subscriptions'):
+            value = self.config.get(key) or []
+            for item in [value] if isinstance(value, (str, dict)) else value:
+                source = {"url": item} if isinstance(item, str) else dict(item)
+                if not source.get('url') or any(s['url'] == source['url'] for s in sources):
+                    continue
+                source.setdefault('name', urlparse(source['url']).hostname or source['url'])
+                source.setdefault('timeout', self.config.get('fetch_timeout', 30))
+                sources.append(source)
+        return sources
+
+    def fetch_subscriptions(self, sources):
+        """并发拉取多个订阅源，失败的源使用上次成功拉取的内容
+        
+        返回[(订阅源, 内容)]，顺序与sources一致，没有可用内容的源被忽略
+        """
+        workers = max(1, min(int(self.config.get('fetch_workers', 4)), len(sources)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="subscription-fetch") as executor:
+            contents = list(executor.map(
+                lambda source: self.fetch_remote_config(source['url'], source['timeout']), sources))
+        
+        results = []
+        failed = []
+        for source, content in zip(sources, contents):
+            if not content:
+                failed.append(source['name'])
+                if self.fetch_cache.get(source['url']):
+                    logger.warning(f"订阅源 {source['name']} 拉取失败，使用上次成功拉取的内容")
+                    content = self.fetch_cache.read_body(source['url'])
+                else:
+                    logger.error(f"订阅源 {source['name']} 拉取失败，且没有可用的缓存")
+                    continue
+            results.append((source, content))
+        
+        if failed:
+            self.last_details['failed_sources'] = failed
+        return results
 
-    def fetch_remote_config(self):
+    def fetch_remote_config(self, url=None, timeout=30):
         """从远程URL获取配置文件"""
         try:
-            url = self.config['fetch_url']
+            url = url or self.subscription_sources()[0]['url']
             logger.info(f"正在从 {url} 获取远程配置")
             
-            response = requests.get(url, headers=self.headers, timeout=30)
-            response.raise_for_status()
+            # 有缓存时发送条件请求，订阅未变化时服务器返回304
+            headers = dict(self.headers)
+            headers['Accept-Encoding'] = ACCEPT_ENCODING
+            cached = self.fetch_cache.get(url)
+            if cached:
+                if cached.get('etag'):
+                    headers['If-None-Match'] = cached['etag']
+                if cached.get('last_modified'):
+                    headers['If-Modified-Since'] = cached['last_modified']
+            
+            with self.run_record.phase('fetch'):
+                response = requests.get(url, headers=headers, timeout=timeout, stream=True)
+                try:
+                    if response.status_code == 304 and cached:
+                        logger.info("远程配置未修改（304），使用缓存的订阅内容")
+                        return self.fetch_cache.read_body(url)
+                    response.raise_for_status()
+                    
+                    # 流式读取并解压，超过大小上限或不是YAML时提前中止
+                    max_bytes = int(self.config.get('fetch_max_bytes', 32 * 1024 * 1024))
+                    body, wire_bytes = read_limited_body(response, max_bytes)
+                    self.run_record.add_bytes('fetch', wire_bytes)
+                finally:
+                    response.close()
             
-            config_content = response.text
-            logger.info(f"成功获取远程配置，大小: {len(config_content)} 字节")
+            config_content = decode_text(body, response.headers.get('Content-Type'))
+            encoding = response.headers.get('Content-Encoding') or 'identity'
+            self.last_details.setdefault('fetch', {})[url] = {
+                "encoding": encoding,
+                "wire_bytes": wire_bytes,
+                "decoded_bytes": len(body),
+            }
+            logger.info(f"成功获取远程配置，传输 {wire_bytes} 字节，解压后 {len(body)} 字节（{encoding}）")
+            self.fetch_cache.store(url, config_content,
+                                   etag=response.headers.get('ETag'),
+                                   last_modified=response.headers.get('Last-Modified'))
             return config_content
         except Exception as e:
             logger.error(f"获取远程配置失败: {e}")
             return None
 
-    def update_with_yaml_content(self, yaml_content):
-        """使用提供的YAML内容更新Mihomo配置文件"""
+    def parse_subscription(self, yaml_content):
+        """解析订阅内容，sections模式下只解析合并时用到的proxies、proxy-groups、rules"""
+        with self.run_record.phase('parse'):
+            self.run_record.add_bytes('parse', len(yaml_content.encode('utf-8')))
+            if self.config.get('subscription_parse', 'sections') == 'full':
+                return parse_yaml(yaml_content)
+            return parse_yaml(yaml_content, SUBSCRIPTION_SECTIONS)
+
+    def update_with_yaml_content(self, yaml_content, content_hash=None):
+        """使用提供的YAML内容更新Mihomo配置文件，content_hash见update_with_remote_config"""
         try:
             logger.info("开始使用提供的YAML内容更新Mihomo配置")
             
             # 解析提供的YAML内容
             logger.info("正在解析提供的YAML内容")
-            remote_config = parse_yaml(yaml_content)
+            remote_config = self.parse_subscription(yaml_content)
             if not remote_config:
                 logger.error("解析提供的YAML内容失败")
                 return False
             
+            return self.update_with_remote_config(remote_config, content_hash)
+        except Exception as e:
+            logger.error(f"使用提供的YAML内容更新Mihomo配置失败: {e}")
+            return False
+
+    @contextmanager
+    def locked(self, path):
+        """持有目标文件的写锁（跨进程有效），等待时间记录为lock_wait阶段"""
+        with ExitStack() as stack:
+            with self.run_record.phase('lock_wait'):
+                stack.enter_context(file_lock(path))
+            yield
+
+    def update_with_remote_config(self, remote_config, content_hash=None):
+        """使用已解析的远程配置更新Mihomo配置文件，读取、备份、写入和重载期间持有文件锁
+        
+        指定content_hash时，成功后在同一把锁内记录为已应用的订阅内容，
+        避免其他写入者在释放锁之后写入的文件被当作本次订阅的结果
+        """
+        output_path = self.output_path()
+        with self.locked(output_path):
+            if self.config.get('output_mode', 'config') == 'provider':
+                success = self.update_proxy_provider(remote_config)
+            else:
+                success = self._apply_remote_config(remote_config)
+            if success and content_hash is not None:
+                self.fetch_cache.mark_applied(content_hash, output_path, self.output_settings())
+            return success
+
+    def _apply_remote_config(self, remote_config):
+        """合并远程配置并写入Mihomo配置文件，调用方需持有配置文件锁"""
+        try:
             # 读取当前的mihomo配置
             mihomo_config_path = self.config['mihomo_config_path']
             logger.info(f"正在读取当前Mihomo配置: {mihomo_config_path}")
@@ -67,64 +406,411 @@ class MihomoUpdater:
                 logger.error(f"Mihomo配置文件不存在: {mihomo_config_path}")
                 return False
             
-            # 备份当前配置
-            logger.info("正在备份当前配置文件")
-            backup_path = create_backup(
-                mihomo_config_path, 
-                self.config['backup_dir']
-            )
-            if not backup_path:
-                logger.error("备份配置文件失败")
-                return False
-            
-            logger.info(f"已备份原配置文件到: {backup_path}")
-            
-            # 读取和解析原始配置
+            # 读取和解析原始配置，文件未变化时直接使用缓存的解析结果
             logger.info("正在读取和解析原始配置文件")
-            with open(mihomo_config_path, 'r', encoding='utf-8') as f:
-                original_config_content = f.read()
-            
-            original_config = parse_yaml(original_config_content)
+            hits = parsed_config_cache.hits
+            with self.run_record.phase('load'):
+                original_config = parsed_config_cache.load(mihomo_config_path, self.parsed_cache_dir)
+            if parsed_config_cache.hits > hits:
+                logger.info("原始配置文件未变化，使用缓存的解析结果")
             if not original_config:
                 logger.error("解析原始配置失败")
                 return False
             
             # 合并配置，保留原始配置中的关键部分，只更新proxies, proxy-groups, rules
             logger.info("正在合并配置文件")
-            merged_config = merge_configs(original_config, remote_config)
+            with self.run_record.phase('merge'):
+                merged_config = merge_configs(original_config, remote_config)
+            
+            # 规则编译：去重，并把大段连续规则转换为rule-provider文件（文件在配置写入后才同步）
+            provider_files = None
+            provider_files_changed = False
+            if self.config.get('rule_compile', False):
+                with self.run_record.phase('rule_compile'):
+                    merged_config, provider_files = self.compile_merged_rules(merged_config)
+                    provider_files_changed = sync_provider_files(self.rule_provider_dir(), provider_files, dry_run=True)
+            
+            # 比较新旧配置，没有实际变化（包括仅调整了节点或代理组顺序）时不写入也不重启
+            with self.run_record.phase('diff'):
+                changeset = diff_configs(original_config, merged_config)
+            self.last_details['changeset'] = changeset
+            logger.info(f"配置变更: {summarize_changeset(changeset)}")
+            if provider_files_changed:
+                logger.info("生成的rule-provider文件有变化")
+            elif not changeset['changed']:
+                logger.info("配置没有实际变化，跳过写入和重启")
+                self.last_status = 'unchanged'
+                return True
+            
+            # 备份当前配置
+            logger.info("正在备份当前配置文件")
+            with self.run_record.phase('backup'):
+                backup_path = create_backup(
+                    mihomo_config_path, 
+                    self.config['backup_dir'],
+                    self.config.get('max_backups', 10),
+                    self.config.get('max_backup_age_days', 0)
+                )
+                self.run_record.add_bytes('backup', os.path.getsize(mihomo_config_path))
+            if not backup_path:
+                logger.error("备份配置文件失败")
+                return False
+            
+            logger.info(f"已备份原配置文件到: {backup_path}")
             
             # 保存合并后的配置
             logger.info(f"正在保存合并后的配置到: {mihomo_config_path}")
-            with open(mihomo_config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(merged_config, f, default_flow_style=False, allow_unicode=True)
+            with self.run_record.phase('write'):
+                self.write_config(mihomo_config_path, original_config, merged_config)
+                self.run_record.add_bytes('write', os.path.getsize(mihomo_config_path))
+                # 配置写入成功后再更新rule-provider文件，写入失败时原配置引用的文件保持不变
+                if provider_files is not None:
+                    sync_provider_files(self.rule_provider_dir(), provider_files)
+            parsed_config_cache.prime(mihomo_config_path, merged_config, self.parsed_cache_dir)
             
             logger.info(f"成功更新Mihomo配置文件: {mihomo_config_path}")
             
-            # 检查是否需要重启mihomo服务
-            logger.info("配置更新完成，准备重启服务")
-            self.restart_mihomo_service()
+            # 让mihomo加载新配置
+            logger.info("配置更新完成，准备重新加载Mihomo")
+            with self.run_record.phase('reload'):
+                self.reload_mihomo()
+            self.last_status = 'updated'
             
             return True
         except Exception as e:
-            logger.error(f"使用提供的YAML内容更新Mihomo配置失败: {e}")
+            logger.error(f"使用远程配置更新Mihomo配置失败: {e}")
+            return False
+
+    def write_config(self, mihomo_config_path, original_config, merged_config):
+        """原子写入合并后的配置；splice模式下只重写变化的顶层配置段，其余内容逐字节保留"""
+        start = time.monotonic()
+        result = None
+        if self.config.get('config_write_mode', 'splice') == 'splice':
+            with open(mihomo_config_path, 'r', encoding='utf-8') as f:
+                result = splice_yaml_sections(f.read(), original_config, merged_config)
+            if result is None:
+                logger.info("无法定位原配置中的顶层配置段，改为完整写入")
+        
+        if result is not None:
+            text, sections = result
+            atomic_write(mihomo_config_path, lambda f: f.write(text), suffix=".yaml")
+            mode = 'splice'
+        else:
+            atomic_write(mihomo_config_path, lambda f: yaml_dump(merged_config, f), suffix=".yaml")
+            mode, sections = 'full', list(merged_config)
+        
+        elapsed = time.monotonic() - start
+        self.last_details['write'] = {"mode": mode, "sections": sections, "elapsed": round(elapsed, 3)}
+        logger.info(f"配置写入完成，方式: {mode}，重写的配置段: {', '.join(map(str, sections)) or '无'}，耗时: {elapsed:.2f}秒")
+
+    def rule_provider_dir(self):
+        """规则编译生成的rule-provider文件目录，默认为Mihomo配置目录下的rule_providers"""
+        return self.config.get('rule_provider_dir') or os.path.join(
+            os.path.dirname(os.path.abspath(self.config['mihomo_config_path'])), 'rule_providers')
+
+    def compile_merged_rules(self, merged_config):
+        """编译合并后配置中的规则，返回(新配置, {provider文件路径: 内容})，文件由调用方在写入配置后同步"""
+        threshold = int(self.config.get('rule_compile_threshold', DEFAULT_THRESHOLD))
+        rules, providers, files, stats = compile_rules(merged_config.get('rules'), self.rule_provider_dir(), threshold)
+        
+        merged_config = apply_rule_providers(merged_config, providers)
+        merged_config['rules'] = rules
+        
+        self.last_details['rules'] = stats
+        logger.info(
+            f"规则编译: {stats['rules_before']} 条 -> {stats['rules_after']} 条"
+            f"（重复 {stats['duplicates']}，被覆盖 {stats['subsumed']}，"
+            f"生成 {stats['providers']} 个rule-provider共 {stats['provider_rules']} 条），"
+            f"规则大小 {stats['bytes_before']} -> {stats['bytes_after']} 字节"
+        )
+        return merged_config, files
+
+    def provider_name(self):
+        """proxy-provider输出模式下的provider名称"""
+        return self.config.get('provider_name') or 'subscription'
+
+    def provider_path(self):
+        """provider文件路径，默认为Mihomo配置目录下的providers/<name>.yaml"""
+        provider_dir = self.config.get('provider_dir') or os.path.join(
+            os.path.dirname(os.path.abspath(self.config['mihomo_config_path'])), 'providers')
+        return os.path.join(provider_dir, f"{self.provider_name()}.yaml")
+
+    def output_path(self):
+        """本次更新写入的文件：主配置文件或provider文件"""
+        if self.config.get('output_mode', 'config') == 'provider':
+            return self.provider_path()
+        return self.config['mihomo_config_path']
+
+    def update_proxy_provider(self, remote_config):
+        """只把订阅中的节点写入provider文件，主配置保持不变，然后刷新该provider"""
+        try:
+            proxies = remote_config.get('proxies') or []
+            if not proxies:
+                logger.error("订阅中没有节点，不更新provider文件")
+                return False
+            
+            provider_path = self.provider_path()
+            old_proxies = []
+            if os.path.exists(provider_path):
+                with open(provider_path, 'r', encoding='utf-8') as f:
+                    old_provider = parse_yaml(f.read())
+                if isinstance(old_provider, dict):
+                    old_proxies = old_provider.get('proxies') or []
+            
+            # 只比较节点，没有变化时不写入也不刷新
+            changeset = diff_configs({'proxies': old_proxies}, {'proxies': proxies})
+            self.last_details['changeset'] = changeset
+            logger.info(f"provider节点变更: {summarize_changeset(changeset)}")
+            if not changeset['changed']:
+                logger.info("provider节点没有实际变化，跳过写入和刷新")
+                self.last_status = 'unchanged'
+                return True
+            
+            logger.info(f"正在写入provider文件: {provider_path}")
+            with self.run_record.phase('write'):
+                if not save_yaml({'proxies': proxies}, provider_path):
+                    return False
+                self.run_record.add_bytes('write', os.path.getsize(provider_path))
+            
+            with self.run_record.phase('reload'):
+                self.refresh_proxy_provider()
+            self.last_status = 'updated'
+            return True
+        except Exception as e:
+            logger.error(f"更新proxy-provider失败: {e}")
             return False
 
+    def refresh_proxy_provider(self):
+        """调用PUT /providers/proxies/{name}让Mihomo重新读取provider文件，失败时回退到完整重载"""
+        start = time.monotonic()
+        name = self.provider_name()
+        method = None
+        try:
+            api_url = (self.config.get('clash_api_url') or '').rstrip('/')
+            if not api_url:
+                raise ValueError("未配置clash_api_url")
+            response = requests.put(
+                f"{api_url}/providers/proxies/{quote(name, safe='')}",
+                headers=self.controller_headers(),
+                timeout=float(self.config.get('reload_timeout', 10))
+            )
+            response.raise_for_status()
+            method = 'provider'
+            logger.info(f"已刷新proxy-provider: {name}")
+        except Exception as e:
+            logger.warning(f"刷新proxy-provider {name} 失败: {e}，改为重新加载Mihomo")
+            if self.reload_mihomo():
+                method = self.last_details['reload']['method']
+        
+        latency = time.monotonic() - start
+        self.last_details['provider'] = {
+            "name": name,
+            "path": self.provider_path(),
+            "method": method,
+            "success": method is not None,
+            "latency": round(latency, 3),
+        }
+        return method is not None
+
     def update_mihomo_config(self):
-        """更新Mihomo配置文件"""
+        """更新Mihomo配置文件，各阶段的耗时和字节数记录在last_details['run']中"""
+        self.last_status = 'failed'
+        self.last_details = {}
+        self.run_record = RunRecord('mihomo', self.phase_listener)
+        try:
+            return self._update_mihomo_config()
+        finally:
+            self.last_details['run'] = self.run_record.finish()
+
+    def _update_mihomo_config(self):
+        """拉取订阅并更新Mihomo配置文件"""
         try:
             # 获取远程配置
             logger.info("开始更新Mihomo配置")
-            remote_config_content = self.fetch_remote_config()
+            sources = self.subscription_sources()
+            if not sources:
+                logger.error("未配置订阅地址，更新失败")
+                return False
+            if len(sources) > 1:
+                return self._update_from_multiple_sources(sources)
+            
+            remote_config_content = self.fetch_remote_config(sources[0]['url'], sources[0]['timeout'])
             if not remote_config_content:
                 logger.error("无法获取远程配置，更新失败")
                 return False
             
+            # 订阅内容与上次应用的完全相同时，跳过解析、合并、写入和重启
+            content_hash = content_sha256(remote_config_content)
+            if self._is_unchanged(content_hash):
+                return True
+            
             # 使用获取的YAML内容更新配置
-            return self.update_with_yaml_content(remote_config_content)
+            return self.update_with_yaml_content(remote_config_content, content_hash)
         except Exception as e:
             logger.error(f"更新Mihomo配置失败: {e}")
             return False
 
+    def _is_unchanged(self, content_hash):
+        """订阅内容已应用且配置文件未被改动时，标记本次更新为未变化"""
+        self.last_details['content_sha256'] = content_hash
+        if self.fetch_cache.is_applied(content_hash, self.output_path(), self.output_settings()):
+            logger.info("订阅内容未变化，跳过本次更新")
+            self.last_status = 'unchanged'
+            return True
+        return False
+
+    def _update_from_multiple_sources(self, sources):
+        """拉取并合并多个订阅源后更新配置"""
+        logger.info(f"共有 {len(sources)} 个订阅源，开始并发拉取")
+        results = self.fetch_subscriptions(sources)
+        if not results:
+            logger.error("所有订阅源均无法获取，更新失败")
+            return False
+        
+        # 组合哈希由各订阅源的内容哈希按顺序计算
+        content_hash = content_sha256("\n".join(
+            f"{source['url']}:{content_sha256(content)}" for source, content in results))
+        if self._is_unchanged(content_hash):
+            return True
+        
+        configs = []
+        for source, content in results:
+            parsed = self.parse_subscription(content)
+            if isinstance(parsed, dict):
+                configs.append(parsed)
+            else:
+                logger.error(f"订阅源 {source['name']} 内容解析失败，已忽略")
+        if not configs:
+            logger.error("没有可用的订阅内容，更新失败")
+            return False
+        
+        with self.run_record.phase('merge'):
+            remote_config = merge_subscriptions(configs)
+        self.last_details['sources'] = len(configs)
+        self.last_details['proxies'] = len(remote_config.get('proxies', []))
+        logger.info(f"合并 {len(configs)} 个订阅源，去重后共 {self.last_details['proxies']} 个节点")
+        
+        return self.update_with_remote_config(remote_config, content_hash)
+
+    def output_settings(self):
+        """影响生成结果的设置，变化后即使订阅未变化也要重新合并"""
+        return {
+            "output_mode": self.config.get('output_mode', 'config'),
+            "rule_compile": bool(self.config.get('rule_compile', False)),
+            "rule_compile_threshold": int(self.config.get('rule_compile_threshold', DEFAULT_THRESHOLD)),
+            "rule_provider_dir": self.config.get('rule_provider_dir') or None,
+        }
+
+    def backup_store(self):
+        """按当前配置打开备份仓库"""
+        return BackupStore(
+            self.config['backup_dir'],
+            self.config.get('max_backups', 10),
+            self.config.get('max_backup_age_days', 0)
+        )
+
+    def restore_backup(self, backup_id):
+        """把指定备份原子替换到Mihomo配置文件并重新加载，恢复前先备份当前配置
+        
+        文件恢复成功即返回True；重新加载失败时last_status为'reload_failed'
+        """
+        try:
+            self.last_status = 'failed'
+            self.last_details = {}
+            mihomo_config_path = self.config['mihomo_config_path']
+            with file_lock(mihomo_config_path):
+                # 在锁内打开备份仓库，避免使用更新任务写入新备份之前的旧索引
+                store = self.backup_store()
+                entry = store.get(backup_id)
+                content = store.read(backup_id) if entry else None
+                if content is None:
+                    logger.error(f"备份不存在或已损坏: {backup_id}")
+                    return False
+                
+                if os.path.exists(mihomo_config_path):
+                    current = store.add(mihomo_config_path, protect_id=entry['id'])
+                    self.last_details['previous_backup'] = current['id']
+                    logger.info(f"恢复前已备份当前配置: #{current['id']}")
+                
+                text = content.decode('utf-8')
+                atomic_write(mihomo_config_path, lambda f: f.write(text), suffix=".yaml")
+                parsed_config_cache.invalidate(mihomo_config_path)
+                logger.info(f"已恢复备份 #{entry['id']} 到: {mihomo_config_path}")
+                
+                # 订阅内容未变化时保留恢复的配置，下次定时更新不会再用同一份订阅覆盖它
+                if self.output_path() == mihomo_config_path and self.fetch_cache.pin_applied(mihomo_config_path):
+                    logger.info("已将恢复的配置记为当前订阅的应用结果")
+                
+                reloaded = self.reload_mihomo()
+            self.last_details['backup'] = entry
+            self.last_status = 'restored' if reloaded else 'reload_failed'
+            if not reloaded:
+                logger.error(f"已恢复备份 #{entry['id']}，但Mihomo重新加载失败")
+            return True
+        except Exception as e:
+            logger.error(f"恢复备份失败: {e}")
+            return False
+
+    def reload_mihomo(self):
+        """让Mihomo加载新配置
+        
+        reload_mode为api时通过控制器接口热重载，失败时回退到systemctl重启；
+        为systemctl时直接重启服务。重载方式和耗时记录在last_details['reload']中
+        """
+        start = time.monotonic()
+        mode = self.config.get('reload_mode', 'systemctl')
+        method = None
+        if mode == 'api':
+            if self.reload_via_api():
+                method = 'api'
+            else:
+                logger.warning("通过API热重载失败，回退到systemctl重启")
+        if method is None and self.restart_mihomo_service():
+            method = 'systemctl'
+        
+        latency = time.monotonic() - start
+        self.last_details['reload'] = {
+            "mode": mode,
+            "method": method,
+            "success": method is not None,
+            "latency": round(latency, 3),
+        }
+        logger.info(f"Mihomo重新加载{'成功' if method else '失败'}，方式: {method or mode}，耗时: {latency:.2f}秒")
+        return method is not None
+
+    def controller_headers(self):
+        """访问Mihomo控制器接口的请求头，配置了密钥时附带认证"""
+        headers = {}
+        secret = self.config.get('clash_api_secret')
+        if secret:
+            headers['Authorization'] = f"Bearer {secret}"
+        return headers
+
+    def reload_via_api(self):
+        """调用Mihomo控制器的PUT /configs?force=true热重载配置，保持现有连接"""
+        try:
+            api_url = (self.config.get('clash_api_url') or '').rstrip('/')
+            if not api_url:
+                logger.error("未配置clash_api_url，无法通过API热重载")
+                return False
+            
+            # Mihomo看到的配置路径可能与本服务不同（例如在不同的容器中）
+            config_path = self.config.get('mihomo_api_config_path') or self.config['mihomo_config_path']
+            logger.info(f"通过API热重载Mihomo配置: {api_url}/configs, path={config_path}")
+            response = requests.put(
+                f"{api_url}/configs",
+                params={"force": "true"},
+                json={"path": config_path, "payload": ""},
+                headers=self.controller_headers(),
+                timeout=float(self.config.get('reload_timeout', 10))
+            )
+            response.raise_for_status()
+            logger.info("Mihomo配置热重载成功")
+            return True
+        except Exception as e:
+            logger.error(f"通过API热重载Mihomo配置失败: {e}")
+            return False
+
     def restart_mihomo_service(self):
         """重启Mihomo服务"""
         try:
@@ -137,16 +823,25 @@ class MihomoUpdater:
             logger.error(f"重启Mihomo服务失败: {e}")
             return False
 
-def run_updater():
-    """运行配置更新器"""
+def run_updater(details=None, on_phase=None):
+    """运行配置更新器
+    
+    如果传入details字典，会把本次更新的状态（updated / unchanged / failed）等信息写入其中；
+    传入on_phase时，每个阶段开始时以阶段名调用它
+    """
     try:
         logger.info("=" * 50)
         logger.info("启动Mihomo配置更新")
         logger.info("=" * 50)
         
         updater = MihomoUpdater()
+        updater.phase_listener = on_phase
         success = updater.update_mihomo_config()
         
+        if details is not None:
+            details.update(updater.last_details)
+            details['status'] = updater.last_status
+        
         if success:
             logger.info("Mihomo配置更新成功")
         else:
@@ -1,10 +1,144 @@
 import os
+import re
+import json
+import gzip
+import time
+import hashlib
+import tempfile
+import threading
 import yaml
 import logging
 from logging.handlers import RotatingFileHandler
-import datetime
 import shutil
 from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows等平台没有fcntl，只能在进程内加锁
+    fcntl = None
+
+# YAML引擎：auto优先使用libyaml（C实现），c强制使用libyaml，python使用纯Python实现
+YAML_ENGINES = ('auto', 'c', 'python')
+_yaml_engine = os.environ.get('MIHOMO_YAML_ENGINE', 'auto')
+
+def set_yaml_engine(engine):
+    """切换YAML引擎，无效的引擎名称被忽略"""
+    global _yaml_engine
+    if engine not in YAML_ENGINES:
+        logging.getLogger("mihomo-updater").warning(f"未知的YAML引擎: {engine}，继续使用 {_yaml_engine}")
+        return False
+    _yaml_engine = engine
+    return True
+
+def yaml_classes(engine=None):
+    """返回当前引擎对应的(Loader, Dumper)类"""
+    engine = engine or _yaml_engine
+    if engine == 'python' or (engine == 'auto' and not yaml.__with_libyaml__):
+        return yaml.SafeLoader, yaml.SafeDumper
+    if engine == 'c' and not yaml.__with_libyaml__:
+        raise RuntimeError("PyYAML未编译libyaml支持，无法使用c引擎")
+    return yaml.CSafeLoader, yaml.CSafeDumper
+
+def yaml_load(content, engine=None):
+    """解析YAML文本或文件对象"""
+    loader, _ = yaml_classes(engine)
+    return yaml.load(content, Loader=loader)
+
+def yaml_dump(data, stream=None, engine=None):
+    """序列化为YAML，保持块格式和Unicode字符；stream为None时返回字符串"""
+    _, dumper = yaml_classes(engine)
+    return yaml.dump(data, stream, Dumper=dumper, default_flow_style=False, allow_unicode=True)
+
+# 订阅中合并时实际用到的顶层配置段
+SUBSCRIPTION_SECTIONS = ('proxies', 'proxy-groups', 'rules')
+
+def yaml_load_sections(content, keys, engine=None):
+    """只解析顶层映射中指定的键，其余部分在事件流中直接跳过，不创建任何对象
+
+    被跳过部分中带锚点的节点仍会组装，以便保留段中的别名引用。
+    顶层不是映射时按完整文档解析。
+    """
+    loader_cls, _ = yaml_classes(engine)
+    loader = loader_cls(content)
+    try:
+        loader.get_event()  # StreamStartEvent
+        if loader.check_event(yaml.StreamEndEvent):
+            return None
+        loader.get_event()  # DocumentStartEvent
+        anchors = {}
+        if not loader.check_event(yaml.MappingStartEvent):
+            return loader.construct_document(_compose_event_node(loader, anchors))
+        
+        start = loader.get_event()
+        root = yaml.MappingNode(
+            loader.resolve(yaml.MappingNode, None, start.implicit),
+            [], start.start_mark, None, flow_style=start.flow_style)
+        while not loader.check_event(yaml.MappingEndEvent):
+            key_node = _compose_event_node(loader, anchors)
+            if isinstance(key_node, yaml.ScalarNode) and key_node.value in keys:
+                root.value.append((key_node, _compose_event_node(loader, anchors)))
+            else:
+                _skip_event_node(loader, anchors)
+        root.end_mark = loader.get_event().end_mark
+        return loader.construct_document(root)
+    finally:
+        loader.dispose()
+
+def _compose_event_node(loader, anchors):
+    """从事件流组装一个节点（与yaml.composer.Composer.compose_node相同，但适用于C和Python两种解析器）"""
+    event = loader.get_event()
+    if isinstance(event, yaml.AliasEvent):
+        if event.anchor not in anchors:
+            raise yaml.composer.ComposerError(
+                None, None, f"found undefined alias {event.anchor!r}", event.start_mark)
+        return anchors[event.anchor]
+    
+    if isinstance(event, yaml.ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        node = yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+    elif isinstance(event, yaml.SequenceStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.SequenceNode, None, event.implicit)
+        node = yaml.SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+    else:
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(yaml.MappingNode, None, event.implicit)
+        node = yaml.MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+    
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    if isinstance(node, yaml.SequenceNode):
+        while not loader.check_event(yaml.SequenceEndEvent):
+            node.value.append(_compose_event_node(loader, anchors))
+        node.end_mark = loader.get_event().end_mark
+    elif isinstance(node, yaml.MappingNode):
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = _compose_event_node(loader, anchors)
+            node.value.append((key, _compose_event_node(loader, anchors)))
+        node.end_mark = loader.get_event().end_mark
+    return node
+
+def _skip_event_node(loader, anchors):
+    """跳过一个节点的全部事件，只组装其中带锚点的子节点"""
+    depth = 0
+    while True:
+        event = loader.peek_event()
+        if getattr(event, 'anchor', None) is not None and not isinstance(event, yaml.AliasEvent):
+            _compose_event_node(loader, anchors)
+        else:
+            loader.get_event()
+            if isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+                depth += 1
+            elif isinstance(event, (yaml.SequenceEndEvent, yaml.MappingEndEvent)):
+                depth -= 1
+        if depth == 0:
+            return
 
 # 配置日志
 def setup_logger(log_file="mihomo_updater.log"):
@@ -49,7 +183,7 @@ def load_config(config_path="config.yaml"):
     """从YAML文件加载配置"""
     try:
         with open(config_path, 'r', encoding='utf-8') as file:
-            return yaml.safe_load(file)
+            return yaml_load(file)
     except Exception as e:
         logger = logging.getLogger("mihomo-updater")
         logger.error(f"加载配置文件失败: {e}")
@@ -65,16 +199,207 @@ def save_config(config, config_path="config.yaml"):
             os.makedirs(config_dir, exist_ok=True)
             
         with open(config_path, 'w', encoding='utf-8') as file:
-            yaml.dump(config, file, default_flow_style=False, allow_unicode=True)
+            yaml_dump(config, file)
         return True
     except Exception as e:
         logger = logging.getLogger("mihomo-updater")
         logger.error(f"保存配置文件失败: {e}")
         return False
 
+# 读取JSON文件
+def load_json(file_path, default=None):
+    """读取JSON文件，文件不存在或损坏时返回默认值"""
+    if not os.path.exists(file_path):
+        return default
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except Exception as e:
+        logger = logging.getLogger("mihomo-updater")
+        logger.warning(f"读取JSON文件失败 {file_path}: {e}")
+        return default
+
+# 原子写入JSON文件
+def save_json(data, file_path):
+    """先写入同目录下的临时文件，再替换目标文件，避免写入中断导致文件损坏"""
+    try:
+        atomic_write(file_path, lambda file: json.dump(data, file, ensure_ascii=False), suffix=".json")
+        return True
+    except Exception as e:
+        logger = logging.getLogger("mihomo-updater")
+        logger.error(f"保存JSON文件失败 {file_path}: {e}")
+        return False
+
+# 原子写入YAML文件
+def save_yaml(data, file_path):
+    """以原子替换的方式写入YAML文件，读取方不会看到写了一半的内容"""
+    try:
+        atomic_write(file_path, lambda file: yaml_dump(data, file), suffix=".yaml")
+        return True
+    except Exception as e:
+        logger = logging.getLogger("mihomo-updater")
+        logger.error(f"保存YAML文件失败 {file_path}: {e}")
+        return False
+
+# 原子写入文件
+def atomic_write(file_path, write_func, suffix=""):
+    """在目标目录创建临时文件，由write_func写入内容后替换目标文件，失败时清理临时文件"""
+    target_dir = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(target_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=target_dir, prefix=".tmp-", suffix=suffix)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            write_func(file)
+            file.flush()
+            os.fsync(file.fileno())
+        # 保留原文件的权限，mkstemp创建的文件默认只有属主可读写
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# 进程内每个文件对应的线程锁
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+@contextmanager
+def file_lock(file_path):
+    """独占写入某个文件：进程内使用线程锁，同时对<file_path>.lock加flock，其他进程也会等待
+
+    没有fcntl的平台上退化为只在进程内互斥。锁不可重入。
+    """
+    key = os.path.abspath(file_path)
+    with _file_locks_guard:
+        thread_lock = _file_locks.setdefault(key, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        lock_dir = os.path.dirname(key)
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(key + ".lock", 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+# 计算文件的sha256
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """计算文件内容的sha256，文件不存在时返回None"""
+    if not os.path.exists(file_path):
+        return None
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ParsedConfigCache:
+    """按文件标识(inode, mtime_ns, size, sha256)缓存解析后的YAML配置
+    
+    每次读取都会重新计算文件哈希，因此手动编辑（即使保持了大小和修改时间）也会使缓存失效；
+    命中时省去的是耗时远大于哈希计算的YAML解析。返回的是顶层字典的浅拷贝，
+    调用方不能原地修改嵌套的列表或字典。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _identity(self, file_path):
+        """读取文件内容并返回(文件标识, 内容)"""
+        with open(file_path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            data = file.read()
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size, hashlib.sha256(data).hexdigest()), data
+
+    def _persist_path(self, file_path, persist_dir):
+        """解析结果在磁盘上的缓存路径"""
+        name = hashlib.sha256(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(persist_dir, f"parsed_{name}.json")
+
+    def _load_persisted(self, file_path, identity, persist_dir):
+        """读取磁盘缓存，文件标识不一致时返回None"""
+        path = self._persist_path(file_path, persist_dir)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+            return entry['config'] if tuple(entry['identity']) == identity else None
+        except Exception as e:
+            logging.getLogger("mihomo-updater").warning(f"读取解析缓存失败 {path}: {e}")
+            return None
+
+    def _persist(self, file_path, identity, config, persist_dir):
+        """原子地写入磁盘缓存（JSON，读取时不会执行任何代码）
+        
+        包含JSON无法原样表示的值（日期、非字符串键等）时不写入，只使用内存缓存
+        """
+        try:
+            text = json.dumps({"identity": identity, "config": config}, ensure_ascii=False)
+            if json.loads(text)["config"] != config:
+                logging.getLogger("mihomo-updater").info(f"解析结果无法用JSON原样保存，跳过磁盘缓存: {file_path}")
+                return
+            path = self._persist_path(file_path, persist_dir)
+            atomic_write(path, lambda f: f.write(text), suffix=".json")
+            # 删除旧版本生成的pickle缓存
+            legacy_path = os.path.splitext(path)[0] + ".pickle"
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+        except Exception as e:
+            logging.getLogger("mihomo-updater").warning(f"保存解析缓存失败: {e}")
+
+    def load(self, file_path, persist_dir=None):
+        """读取并解析YAML文件，文件未变化时直接返回缓存的结果"""
+        identity, data = self._identity(file_path)
+        with self.lock:
+            entry = self.entries.get(file_path)
+        if entry and entry[0] == identity:
+            self.hits += 1
+            return dict(entry[1]) if isinstance(entry[1], dict) else entry[1]
+        
+        config = self._load_persisted(file_path, identity, persist_dir) if persist_dir else None
+        if config is None:
+            self.misses += 1
+            config = yaml_load(data.decode('utf-8'))
+            if persist_dir and config is not None:
+                self._persist(file_path, identity, config, persist_dir)
+        else:
+            self.hits += 1
+        
+        with self.lock:
+            self.entries[file_path] = (identity, config)
+        return dict(config) if isinstance(config, dict) else config
+
+    def prime(self, file_path, config, persist_dir=None):
+        """写入文件后直接登记其解析结果，下次读取无需重新解析"""
+        identity, _ = self._identity(file_path)
+        with self.lock:
+            self.entries[file_path] = (identity, config)
+        if persist_dir:
+            self._persist(file_path, identity, config, persist_dir)
+
+    def invalidate(self, file_path=None):
+        """清除某个文件或全部的内存缓存"""
+        with self.lock:
+            if file_path is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(file_path, None)
+
+# 全局共享的解析缓存
+parsed_config_cache = ParsedConfigCache()
+
 # 创建备份
-def create_backup(file_path, backup_dir, max_backups=10):
-    """创建文件备份，并管理备份数量"""
+def create_backup(file_path, backup_dir, max_backups=10, max_age_days=0):
+    """把文件存入备份仓库，返回备份对象文件路径；内容与最近一次备份相同时不重复存储"""
     logger = logging.getLogger("mihomo-updater")
     
     # 检查原文件是否存在
@@ -82,47 +407,255 @@ def create_backup(file_path, backup_dir, max_backups=10):
         logger.error(f"要备份的文件不存在: {file_path}")
         return None
     
-    # 确保备份目录存在
-    os.makedirs(backup_dir, exist_ok=True)
-    
-    # 创建带时间戳的备份文件名
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_filename = f"{os.path.basename(file_path)}.{timestamp}.bak"
-    backup_path = os.path.join(backup_dir, backup_filename)
-    
-    # 复制文件
     try:
-        shutil.copy2(file_path, backup_path)
-        logger.info(f"成功创建备份: {backup_path}")
-        
-        # 管理备份数量
-        backup_files = sorted([
-            os.path.join(backup_dir, f) for f in os.listdir(backup_dir)
-            if f.startswith(os.path.basename(file_path)) and f.endswith(".bak")
-        ])
-        
-        # 如果备份数量超过限制，删除最旧的备份
-        if len(backup_files) > max_backups:
-            files_to_delete = backup_files[:-max_backups]
-            for old_file in files_to_delete:
-                os.remove(old_file)
-                logger.info(f"删除旧备份: {old_file}")
-        
-        return backup_path
+        store = BackupStore(backup_dir, max_backups, max_age_days)
+        entry = store.add(file_path)
+        logger.info(f"成功创建备份 #{entry['id']}: {entry['sha256'][:12]}")
+        return store.object_path(entry['sha256'])
     except Exception as e:
         logger.error(f"创建备份失败: {e}")
         return None
 
+# 备份仓库
+class BackupStore:
+    """内容寻址的备份仓库：相同内容只压缩存储一次，索引记录每次备份的时间和内容哈希
+
+    目录结构：backups.json（索引）和 objects/<哈希前两位>/<哈希>.gz。
+    保留策略只根据索引计算（数量和天数），不需要扫描目录。
+    """
+
+    INDEX_FILENAME = "backups.json"
+    _lock = threading.Lock()
+
+    def __init__(self, backup_dir, max_backups=10, max_age_days=0):
+        self.backup_dir = backup_dir
+        self.max_backups = int(max_backups or 0)
+        self.max_age_days = float(max_age_days or 0)
+        self.objects_dir = os.path.join(backup_dir, "objects")
+        self.index_path = os.path.join(backup_dir, self.INDEX_FILENAME)
+        os.makedirs(self.objects_dir, exist_ok=True)
+        with self._lock:
+            self.index = load_json(self.index_path, None)
+            if not isinstance(self.index, dict):
+                self.index = {"next_id": 1, "entries": []}
+                self._import_legacy_backups()
+
+    def object_path(self, sha256):
+        """内容哈希对应的压缩对象文件"""
+        return os.path.join(self.objects_dir, sha256[:2], f"{sha256}.gz")
+
+    def entries(self):
+        """全部备份记录，按时间从新到旧排列"""
+        return list(reversed(self.index["entries"]))
+
+    def page(self, offset=0, limit=20):
+        """分页获取备份记录（从新到旧），返回(记录列表, 总数)"""
+        entries = self.index["entries"]
+        total = len(entries)
+        end = max(total - offset, 0)
+        start = max(end - limit, 0)
+        return [dict(entry) for entry in reversed(entries[start:end])], total
+
+    def get(self, entry_id):
+        """按编号查找备份记录"""
+        for entry in self.index["entries"]:
+            if str(entry["id"]) == str(entry_id):
+                return dict(entry)
+        return None
+
+    def read(self, entry_id):
+        """读取备份内容（解压后的字节），备份不存在时返回None"""
+        entry = self.get(entry_id)
+        if not entry or not os.path.exists(self.object_path(entry["sha256"])):
+            return None
+        with gzip.open(self.object_path(entry["sha256"]), 'rb') as f:
+            return f.read()
+
+    def add(self, file_path, timestamp=None, protect_id=None):
+        """备份文件并执行保留策略，返回备份记录；protect_id指定的备份（例如正在恢复的备份）不会被清理"""
+        sha256 = file_sha256(file_path)
+        with self._lock:
+            # 其他实例可能已经写入了新的备份，先重新读取索引，避免覆盖掉这些记录
+            index = load_json(self.index_path, None)
+            if isinstance(index, dict):
+                self.index = index
+            entries = self.index["entries"]
+            if entries and entries[-1]["sha256"] == sha256 and os.path.exists(self.object_path(sha256)):
+                return dict(entries[-1])
+            
+            self._store_object(file_path, sha256)
+            entry = {
+                "id": self.index["next_id"],
+                "time": timestamp if timestamp is not None else time.time(),
+                "sha256": sha256,
+                "size": os.path.getsize(file_path),
+                "stored_size": os.path.getsize(self.object_path(sha256)),
+                "source": os.path.basename(file_path),
+            }
+            self.index["next_id"] += 1
+            entries.append(entry)
+            self._prune(protect_id)
+            save_json(self.index, self.index_path)
+            return dict(entry)
+
+    def _store_object(self, file_path, sha256):
+        """压缩保存内容对象，已存在时跳过"""
+        object_path = self.object_path(sha256)
+        if os.path.exists(object_path):
+            return
+        object_dir = os.path.dirname(object_path)
+        os.makedirs(object_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=object_dir, prefix=".tmp-", suffix=".gz")
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as compressed:
+                with open(file_path, 'rb') as source:
+                    shutil.copyfileobj(source, compressed, 1024 * 1024)
+            os.replace(tmp_path, object_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _prune(self, protect_id=None):
+        """按数量和天数删除旧的备份记录，并删除不再被引用的内容对象；protect_id指定的备份始终保留"""
+        entries = self.index["entries"]
+        keep = entries
+        if self.max_age_days > 0:
+            cutoff = time.time() - self.max_age_days * 86400
+            # 至少保留最新的一个备份
+            keep = [entry for entry in keep[:-1] if entry["time"] >= cutoff] + keep[-1:]
+        if self.max_backups > 0:
+            keep = keep[-self.max_backups:]
+        kept_ids = {entry["id"] for entry in keep}
+        if protect_id is not None:
+            kept_ids |= {entry["id"] for entry in entries if str(entry["id"]) == str(protect_id)}
+            keep = [entry for entry in entries if entry["id"] in kept_ids]
+        if len(keep) == len(entries):
+            return
+        
+        removed = [entry for entry in entries if entry["id"] not in kept_ids]
+        referenced = {entry["sha256"] for entry in keep}
+        self.index["entries"] = keep
+        logger = logging.getLogger("mihomo-updater")
+        for sha256 in {entry["sha256"] for entry in removed} - referenced:
+            try:
+                os.remove(self.object_path(sha256))
+            except FileNotFoundError:
+                pass
+        logger.info(f"删除 {len(removed)} 个旧备份记录")
+
+    def _import_legacy_backups(self):
+        """首次使用时导入旧版本生成的 *.bak 备份文件，导入后删除原文件"""
+        logger = logging.getLogger("mihomo-updater")
+        legacy = sorted(
+            (os.path.join(self.backup_dir, name) for name in os.listdir(self.backup_dir) if name.endswith(".bak")),
+            key=os.path.getmtime)
+        for path in legacy:
+            sha256 = file_sha256(path)
+            self._store_object(path, sha256)
+            self.index["entries"].append({
+                "id": self.index["next_id"],
+                "time": os.path.getmtime(path),
+                "sha256": sha256,
+                "size": os.path.getsize(path),
+                "stored_size": os.path.getsize(self.object_path(sha256)),
+                "source": os.path.basename(path),
+            })
+            self.index["next_id"] += 1
+            os.remove(path)
+        if legacy:
+            logger.info(f"已导入 {len(legacy)} 个旧版备份文件")
+        self._prune()
+        save_json(self.index, self.index_path)
+
 # 解析YAML配置文件
-def parse_yaml(yaml_content):
-    """解析YAML内容为Python对象"""
+def parse_yaml(yaml_content, sections=None):
+    """解析YAML内容为Python对象，指定sections时只解析这些顶层键"""
     try:
-        return yaml.safe_load(yaml_content)
+        if sections:
+            return yaml_load_sections(yaml_content, sections)
+        return yaml_load(yaml_content)
     except Exception as e:
         logger = logging.getLogger("mihomo-updater")
         logger.error(f"解析YAML内容失败: {e}")
         return None
 
+# 顶层键所在行：普通键或加引号的键，冒号后为空白或行尾
+_TOP_LEVEL_KEY = re.compile(r"""^(?:'([^']*)'|"([^"\\]*)"|([^\s#'"?\-\[{][^#]*?))\s*:(?:\s|$)""")
+# 锚点定义，出现时不做局部替换，避免替换掉被其他部分引用的锚点
+_YAML_ANCHOR = re.compile(r"(?:^|[\s\[{,:-])&[^\s,\]}]")
+
+def _top_level_sections(text):
+    """定位顶层映射各个键的文本范围：[(键, 起始偏移, 结束偏移)]
+
+    每段从键所在行开始，到下一个键之前最后一行内容结束，紧挨着下一个键的顶格注释和空行归属下一个键。
+    遇到无法识别的顶格内容（文档标记、复杂键、顶层列表等）时返回None。
+    """
+    lines = text.splitlines(keepends=True)
+    starts = []
+    offset = 0
+    keys = []
+    for index, line in enumerate(lines):
+        # 顶格的"- "是键下面的块列表（yaml_dump默认不缩进列表），属于当前段
+        is_sequence_item = line[:1] == '-' and line[1:2] in ('', ' ', '\n', '\r')
+        if line[:1] not in ('', ' ', '\t', '#', '\n', '\r') and not is_sequence_item:
+            match = _TOP_LEVEL_KEY.match(line)
+            if not match:
+                return None
+            keys.append((next(group for group in match.groups() if group is not None), index))
+        starts.append(offset)
+        offset += len(line)
+    starts.append(offset)
+    
+    sections = []
+    for position, (key, line_index) in enumerate(keys):
+        end_line = keys[position + 1][1] if position + 1 < len(keys) else len(lines)
+        while end_line > line_index + 1 and (not lines[end_line - 1].strip() or lines[end_line - 1].startswith('#')):
+            end_line -= 1
+        sections.append((key, starts[line_index], starts[end_line]))
+    return sections
+
+# 局部替换配置文件中变化的顶层配置段
+def splice_yaml_sections(original_text, original_config, new_config):
+    """只重新序列化发生变化的顶层配置段，其余内容（注释、格式、键顺序）逐字节保留
+
+    返回(新文本, 重写的键列表)；原文无法安全定位配置段时返回None，调用方应完整序列化。
+    """
+    if not isinstance(original_config, dict) or _YAML_ANCHOR.search(original_text):
+        return None
+    sections = _top_level_sections(original_text)
+    if sections is None or [key for key, _, _ in sections] != [str(key) for key in original_config]:
+        return None
+    
+    parts = []
+    changed = []
+    cursor = 0
+    for (key, start, end), original_key in zip(sections, original_config):
+        parts.append(original_text[cursor:start])
+        cursor = end
+        if original_key not in new_config:
+            changed.append(original_key)
+            continue
+        if new_config[original_key] == original_config[original_key]:
+            parts.append(original_text[start:end])
+            continue
+        changed.append(original_key)
+        parts.append(yaml_dump({original_key: new_config[original_key]}))
+        # 原来的段以换行结尾时保持一致，yaml_dump的结果总是以换行结尾
+        if not original_text[start:end].endswith('\n'):
+            parts[-1] = parts[-1].rstrip('\n')
+    parts.append(original_text[cursor:])
+    text = ''.join(parts)
+    
+    # 新增的顶层键追加到文件末尾
+    added = [key for key in new_config if key not in original_config]
+    if added:
+        if text and not text.endswith('\n'):
+            text += '\n'
+        text += yaml_dump({key: new_config[key] for key in added})
+        changed.extend(added)
+    return text, changed
+
 # 合并配置文件
 def merge_configs(original_config, new_config):
     """合并原始配置和新配置，只替换proxies, proxy-groups, rules部分"""
@@ -134,4 +667,71 @@ def merge_configs(original_config, new_config):
         if key in new_config:
             merged_config[key] = new_config[key]
     
-    return merged_config 
\ No newline at end of file
+    return merged_config 
+
+# 用于判断节点是否重复的认证字段
+PROXY_CREDENTIAL_KEYS = ('uuid', 'password', 'username', 'auth', 'auth-str', 'psk', 'private-key', 'token')
+
+def proxy_identity(proxy):
+    """节点的去重键：(类型, 服务器, 端口, 认证信息)"""
+    credentials = tuple(str(proxy.get(key)) for key in PROXY_CREDENTIAL_KEYS if key in proxy)
+    return (proxy.get('type'), proxy.get('server'), str(proxy.get('port')), credentials)
+
+# 合并多个订阅
+def merge_subscriptions(configs):
+    """合并多个订阅的节点，基于哈希索引去重，名称冲突时按订阅顺序重命名
+    
+    代理组和规则取自第一个订阅，其他订阅新增的节点追加到第一个订阅中直接引用节点的代理组
+    """
+    proxies = []
+    identities = {}
+    names = set()
+    renames = []
+    
+    for config in configs:
+        rename = {}
+        for proxy in config.get('proxies') or []:
+            if not isinstance(proxy, dict) or 'name' not in proxy:
+                continue
+            identity = proxy_identity(proxy)
+            if identity in identities:
+                # 重复节点，引用已保留的同一节点
+                rename[proxy['name']] = identities[identity]
+                continue
+            
+            name = str(proxy['name'])
+            final_name = name
+            suffix = 2
+            while final_name in names:
+                final_name = f"{name} ({suffix})"
+                suffix += 1
+            if final_name != proxy['name']:
+                proxy = dict(proxy, name=final_name)
+            
+            proxies.append(proxy)
+            identities[identity] = final_name
+            names.add(final_name)
+            rename.setdefault(name, final_name)
+        renames.append(rename)
+    
+    primary = configs[0]
+    primary_names = set(renames[0].values())
+    extra_names = [proxy['name'] for proxy in proxies if proxy['name'] not in primary_names]
+    
+    groups = []
+    for group in primary.get('proxy-groups') or []:
+        if not isinstance(group, dict):
+            groups.append(group)
+            continue
+        members = [renames[0].get(member, member) for member in group.get('proxies') or []]
+        # 去掉因去重而重复的成员，保持原有顺序
+        members = list(dict.fromkeys(members))
+        if extra_names and any(member in primary_names for member in members):
+            existing = set(members)
+            members.extend(name for name in extra_names if name not in existing)
+        groups.append(dict(group, proxies=members) if 'proxies' in group else group)
+    
+    merged = {"proxies": proxies, "proxy-groups": groups}
+    if 'rules' in primary:
+        merged['rules'] = primary['rules']
+    return merged
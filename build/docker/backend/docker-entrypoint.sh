@@ -36,13 +36,7 @@ else
     echo "使用现有配置文件: $CONFIG_FILE"
 fi
 
-echo "检查任务历史文件..."
-HISTORY_FILE="$CONFIG_DIR/task_history.json"
-if [ ! -f "$HISTORY_FILE" ]; then
-    echo "任务历史文件不存在，创建空文件..."
-    echo "[]" > $HISTORY_FILE
-    echo "任务历史文件已创建: $HISTORY_FILE"
-fi
+# 任务历史保存在$CONFIG_DIR/task_history.db中，由应用启动时自动创建
 
 echo "目录准备完成，启动应用..."
 # 启动应用
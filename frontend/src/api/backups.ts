@@ -0,0 +1,12 @@
+import { get, post } from './http'
+import { ApiResponse, BackupEntry, Paged } from '@/types'
+
+// 分页获取配置备份列表
+export function getBackups(page = 1, pageSize = 20): Promise<ApiResponse<Paged<BackupEntry>>> {
+  return get<Paged<BackupEntry>>('/api/backups', { page, page_size: pageSize })
+}
+
+// 恢复指定的配置备份并重新加载Mihomo
+export function restoreBackup(id: number): Promise<ApiResponse<Record<string, any>>> {
+  return post<Record<string, any>>(`/api/backups/${id}/restore`)
+}
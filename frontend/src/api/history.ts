@@ -1,7 +1,7 @@
 import { get } from './http'
-import { TaskHistory, ApiResponse } from '@/types'
+import { TaskHistory, HistoryQuery, ApiResponse } from '@/types'
 
-// 获取任务执行历史
-export function getTaskHistory(): Promise<ApiResponse<TaskHistory[]>> {
-  return get<TaskHistory[]>('/api/history')
-} 
\ No newline at end of file
+// 分页获取任务执行历史（从新到旧），可按任务名称和成功状态筛选
+export function getTaskHistory(query: HistoryQuery = {}): Promise<ApiResponse<TaskHistory[]>> {
+  return get<TaskHistory[]>('/api/history', query)
+} 
@@ -0,0 +1,53 @@
+import { get } from './http'
+import { ApiResponse, Job } from '@/types'
+
+// 获取后台任务状态
+export function getJob(id: string): Promise<ApiResponse<Job>> {
+  return get<Job>(`/api/jobs/${id}`)
+}
+
+const isFinished = (job: Job): boolean => job.status === 'succeeded' || job.status === 'failed'
+
+// 跟踪后台任务直到结束：优先使用SSE，连接失败时改为每秒轮询
+export function watchJob(id: string, onUpdate: (job: Job) => void): Promise<Job> {
+  return new Promise((resolve, reject) => {
+    let timer: number | undefined
+
+    const finish = (job: Job) => {
+      onUpdate(job)
+      if (isFinished(job)) {
+        if (timer !== undefined) window.clearInterval(timer)
+        resolve(job)
+        return true
+      }
+      return false
+    }
+
+    const poll = () => {
+      timer = window.setInterval(async () => {
+        try {
+          const res = await getJob(id)
+          if (res.success && res.data) finish(res.data)
+        } catch (error) {
+          window.clearInterval(timer)
+          reject(error)
+        }
+      }, 1000)
+    }
+
+    if (typeof EventSource === 'undefined') {
+      poll()
+      return
+    }
+
+    const source = new EventSource(`/api/jobs/${id}/events`)
+    source.addEventListener('job', (event) => {
+      if (finish(JSON.parse((event as MessageEvent).data))) source.close()
+    })
+    source.onerror = () => {
+      // 服务端在任务结束后关闭连接；若任务尚未结束则改为轮询
+      source.close()
+      poll()
+    }
+  })
+}
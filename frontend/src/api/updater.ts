@@ -1,14 +1,19 @@
-import { post } from './http'
-import { ApiResponse } from '@/types'
+import { get, post } from './http'
+import { ApiResponse, GeoDownloadProgress, Job } from '@/types'
 
-// 手动触发Mihomo配置更新
-export function updateMihomo(): Promise<ApiResponse<void>> {
-  return post<void>('/api/update/mihomo')
+// 手动触发Mihomo配置更新，返回后台任务
+export function updateMihomo(): Promise<ApiResponse<Job>> {
+  return post<Job>('/api/update/mihomo')
 }
 
-// 手动触发GeoIP数据更新
-export function updateGeoIP(): Promise<ApiResponse<void>> {
-  return post<void>('/api/update/geoip')
+// 手动触发GeoIP数据更新，返回后台任务
+export function updateGeoIP(): Promise<ApiResponse<Job>> {
+  return post<Job>('/api/update/geoip')
+}
+
+// 获取GEO文件下载进度
+export function getGeoProgress(): Promise<ApiResponse<GeoDownloadProgress[]>> {
+  return get<GeoDownloadProgress[]>('/api/geoip/progress')
 }
 
 // 导入本地YAML文件
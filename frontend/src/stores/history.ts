@@ -1,21 +1,23 @@
 import { defineStore } from 'pinia'
 import { ref } from 'vue'
 import { getTaskHistory } from '@/api/history'
-import { TaskHistory } from '@/types'
+import { TaskHistory, HistoryQuery } from '@/types'
 
 export const useHistoryStore = defineStore('history', () => {
     const history = ref<TaskHistory[]>([])
+    const total = ref<number>(0)
     const loading = ref<boolean>(false)
     const error = ref<string | null>(null)
 
-    async function fetchHistory(): Promise<void> {
+    async function fetchHistory(query: HistoryQuery = { page: 1, page_size: 10 }): Promise<void> {
         loading.value = true
         error.value = null
 
         try {
-            const res = await getTaskHistory()
+            const res = await getTaskHistory(query)
             if (res.success && res.data) {
                 history.value = res.data
+                total.value = res.total ?? res.data.length
             } else {
                 error.value = res.message || '获取历史记录失败'
             }
@@ -28,6 +30,7 @@ export const useHistoryStore = defineStore('history', () => {
 
     return {
         history,
+        total,
         loading,
         error,
         fetchHistory
@@ -2,12 +2,16 @@
 export interface Config {
   fetch_url: string;
   fetch_interval: number;
+  subscriptions?: Array<string | { name?: string; url: string; timeout?: number }>;
   geoip_fetch_interval: number;
   mihomo_config_path: string;
   backup_dir: string;
   geoip_url: string;
   geosite_url: string;
   mmdb_url: string;
+  geoip_mirrors?: string[];
+  geosite_mirrors?: string[];
+  mmdb_mirrors?: string[];
   geoip_path: string;
   geosite_path: string;
   mmdb_path: string;
@@ -19,10 +23,67 @@ export interface Config {
 
 // 历史记录类型定义
 export interface TaskHistory {
+  id?: number;
   timestamp: string;
   task: string;
   success: boolean;
   message: string;
+  details?: Record<string, any>;
+}
+
+// 历史记录查询参数
+export interface HistoryQuery {
+  page?: number;
+  page_size?: number;
+  task?: string;
+  success?: boolean;
+}
+
+// GEO文件下载进度类型定义
+export interface GeoDownloadProgress {
+  path: string;
+  url: string;
+  status: string;
+  downloaded: number;
+  total: number | null;
+  speed: number;
+  resumed_from?: number;
+  attempt?: number;
+  updated_at: number;
+}
+
+// 后台任务类型定义
+export interface Job {
+  id: string;
+  type: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  phase: string | null;
+  progress: GeoDownloadProgress[] | null;
+  success: boolean | null;
+  message: string | null;
+  created: number;
+  started: number | null;
+  finished: number | null;
+  version: number;
+}
+
+// 配置备份类型定义
+export interface BackupEntry {
+  id: number;
+  time: number;
+  timestamp: string;
+  sha256: string;
+  size: number;
+  stored_size: number;
+  source: string;
+}
+
+// 分页结果类型定义
+export interface Paged<T> {
+  items: T[];
+  total: number;
+  page: number;
+  page_size: number;
 }
 
 // 接口响应类型定义
@@ -30,4 +91,7 @@ export interface ApiResponse<T = any> {
   success: boolean;
   data?: T;
   message?: string;
+  total?: number;
+  page?: number;
+  page_size?: number;
 } 
\ No newline at end of file